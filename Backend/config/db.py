@@ -84,4 +84,18 @@ else:
          logger.error("Database session factory (SessionLocal) is not available due to configuration errors.")
          raise RuntimeError("Database session not available due to configuration errors.")
 
+def dialect_insert(db, model):
+    """
+    Returns an INSERT construct for `model` that supports ON CONFLICT upserts on the
+    session's dialect (PostgreSQL and SQLite both implement on_conflict_do_update/nothing).
+    """
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert_insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported for database dialect '{dialect_name}'.")
+    return upsert_insert(model)
+
 logger.info("config/db.py loaded.") # Add a log to confirm this file finished loading
\ No newline at end of file
@@ -0,0 +1,98 @@
+# backend/config/schema_upgrade.py
+"""
+In-place upgrade of tables created by an earlier version of the app.
+
+create_all only creates missing tables; it never alters existing ones. This startup hook
+(see PRE_CREATE_HOOKS in main.py) adds the columns and indexes that later versions added to
+tables which already existed, so an old database keeps working without a manual migration.
+It is idempotent: anything already present is left alone, and tables that don't exist yet
+are skipped (create_all then creates them complete).
+
+Column types, defaults and index definitions come from the models, so only the list below
+needs updating when a column is added to an existing table.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from config.db import Base
+
+logger = logging.getLogger(__name__)
+
+# (table, column, value for existing rows). Columns with a server_default need no value;
+# NOT NULL columns without one get the value, then the constraint (PostgreSQL only: SQLite
+# can't add it to an existing column, the ORM default keeps new rows filled).
+ADDED_COLUMNS = [
+    ("inventory", "reserved", None),
+    ("inventory", "reorder_threshold", None),
+    ("inventory", "shard_count", None),
+    ("inventory_shards", "reserved", None),
+    ("cart_items", "updated_at", datetime.utcnow), # Existing carts count as touched at upgrade time
+    ("delivery_info", "user_id", None),
+    ("delivery_info", "content_hash", None),
+]
+
+# Tables whose model indexes (and unique constraints, created as unique indexes) are ensured
+INDEXED_TABLES = ["inventory", "cart_items", "delivery_info", "orders", "products"]
+
+
+def _add_column(conn: Connection, table_name: str, column_name: str, backfill) -> None:
+    column = Base.metadata.tables[table_name].c[column_name]
+    dialect = conn.dialect
+    postgres = dialect.name == "postgresql"
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {'IF NOT EXISTS ' if postgres else ''}" \
+          f"{column_name} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    for foreign_key in column.foreign_keys:
+        ddl += f" REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+    conn.execute(text(ddl))
+    if backfill is not None:
+        conn.execute(
+            text(f"UPDATE {table_name} SET {column_name} = :value WHERE {column_name} IS NULL"),
+            {"value": backfill()},
+        )
+        if postgres and not column.nullable:
+            conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL"))
+    logger.info(f"Schema upgrade: added column {table_name}.{column_name}.")
+
+
+def _ensure_indexes(conn: Connection, table_name: str) -> None:
+    table = Base.metadata.tables[table_name]
+    inspector = inspect(conn)
+    existing = {index["name"] for index in inspector.get_indexes(table_name)}
+    existing.update(constraint["name"] for constraint in inspector.get_unique_constraints(table_name))
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(conn, checkfirst=True)
+            logger.info(f"Schema upgrade: created index {index.name} on {table_name}.")
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in existing:
+            # A unique index enforces the same rule and, unlike the constraint, can be added in place on SQLite
+            columns = ", ".join(column.name for column in constraint.columns)
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {constraint.name} ON {table_name} ({columns})"))
+            logger.info(f"Schema upgrade: created unique index {constraint.name} on {table_name}.")
+
+
+def upgrade_existing_tables(engine: Optional[Engine]) -> None:
+    """Startup hook, run before create_all: adds missing columns and indexes to existing tables."""
+    if engine is None:
+        return
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        present = set(inspector.get_table_names())
+        columns = {
+            table_name: {column["name"] for column in inspector.get_columns(table_name)}
+            for table_name in {table_name for table_name, _, _ in ADDED_COLUMNS} & present
+        }
+        for table_name, column_name, backfill in ADDED_COLUMNS:
+            if table_name in columns and column_name not in columns[table_name]:
+                _add_column(conn, table_name, column_name, backfill)
+        for table_name in INDEXED_TABLES:
+            if table_name in present:
+                _ensure_indexes(conn, table_name)
@@ -1,6 +1,7 @@
 # backend/config/settings.py
 # (Keep the code exactly as provided in the previous answer)
 import os
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -8,6 +9,49 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # --- Stock reservations (cart holds) ---
+    RESERVATION_TTL_SECONDS: int = 900
+    RESERVATION_SWEEP_INTERVAL_SECONDS: int = 30
+    RESERVATION_SWEEP_BATCH_SIZE: int = 500
+    # --- Live stock push: max one update per SKU per interval ---
+    STOCK_EVENT_INTERVAL_SECONDS: float = 1.0
+    # --- Sharded stock counters for hot SKUs ---
+    SHARD_REBALANCE_INTERVAL_SECONDS: int = 5
+    # --- Guest carts (signed client-side tokens; no DB writes until login) ---
+    GUEST_CART_SECRET_KEY: Optional[str] = None # Falls back to JWT_SECRET_KEY
+    GUEST_CART_TTL_DAYS: int = 30
+    GUEST_CART_MAX_LINES: int = 100
+    # --- Cart store: "direct" writes cart_items on every edit, "write_back" buffers (domain/cart/store.py) ---
+    CART_STORE_MODE: str = "direct"
+    CART_STORE_URL: str = "memory://" # Or redis://host:6379/0 (needs the redis package)
+    CART_STORE_FLUSH_INTERVAL_SECONDS: int = 5
+    CART_STORE_FLUSH_BATCH_SIZE: int = 500
+    CART_STORE_IDLE_SECONDS: int = 1800 # Clean carts are dropped from the store after this long
+    CART_STORE_JOURNAL_PATH: str = "cart_store.journal" # Each process appends its pid
+    CART_STORE_JOURNAL_FSYNC: bool = True
+    # --- Abandoned cart purge ---
+    CART_RETENTION_DAYS: int = 30 # Carts with no line touched for this long are deleted
+    CART_PURGE_INTERVAL_SECONDS: int = 3600
+    CART_PURGE_BATCH_SIZE: int = 500
+    # --- Checkout ---
+    SHIPPING_FEE: float = 10.0 # Flat fee for non-empty orders
+    # --- Orders: monthly range partitions (PostgreSQL only; see domain/order/partitioning.py) ---
+    ORDER_PARTITION_MONTHS_AHEAD: int = 3 # Partitions are created this many months in advance
+    ORDER_PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = 86400
+    ORDER_RETENTION_MONTHS: int = 24 # Older partitions are detached and archived by the archive command
+    ORDER_ARCHIVE_DIR: str = "order_archive"
+    # --- Cross-process WebSocket fan-out (notification_bus.py) ---
+    NOTIFICATION_BUS_URL: Optional[str] = None # Falls back to DATABASE_URL (PostgreSQL) or in-process (memory://)
+    NOTIFICATION_BUS_CHANNEL: str = "ws_fanout"
+    # --- WebSocket keep-alive: protocol ping frames sent by uvicorn (a missed pong closes the socket) ---
+    WS_PING_INTERVAL_SECONDS: float = 20.0
+    WS_PING_TIMEOUT_SECONDS: float = 20.0
+    # --- WebSocket send queues (websocket_manager.py) ---
+    WS_SEND_QUEUE_SIZE: int = 256 # Frames buffered per client before the slow-consumer policy kicks in
+    WS_SLOW_CONSUMER_POLICY: str = "evict" # "evict", "drop_oldest" or "drop_newest"
+    # --- WebSocket coalescing: room -> window; such rooms get JSON array frames (JSON objects in env vars) ---
+    WS_COALESCE_WINDOW_MS: Dict[str, int] = {"admin_notifications": 100}
+    WS_COALESCE_MAX_EVENTS: Dict[str, int] = {"admin_notifications": 200} # Flush early at this many pending
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8', extra='ignore')
 
 settings = Settings()
\ No newline at end of file
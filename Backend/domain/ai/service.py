@@ -1,7 +1,7 @@
 # domain/ai/service.py
 import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import func, select, distinct
+from sqlalchemy import func
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import os
@@ -11,6 +11,8 @@ from dotenv import load_dotenv
 try:
     from ..product.models import Product
     from ..inventory.models import Inventory
+    from ..category.repository import CategoryRepository
+    from ..inventory.repository import InventoryRepository
     logger = logging.getLogger(__name__)
     logger.info("Successfully imported DB models (Product, Inventory) for AI Service.")
 except ImportError as e:
@@ -22,6 +24,10 @@ except ImportError as e:
     class Inventory:
         prod_id = None
         stock = None
+    class CategoryRepository:
+        def get_paths_with_products(self, db): return []
+    class InventoryRepository:
+        def get_low_stock_categories(self, db): return []
 
 # LangChain & LLM
 try:
@@ -110,24 +116,19 @@ class AISalesPredictorService:
         prediction_months = params.get('prediction_months', 3)
         location_context = params.get('context_hint', 'Global')
         current_date_str = datetime.utcnow().strftime("%Y-%m-%d")
-        low_stock_threshold = 10
 
         # Fetch Categories and Stock Info
         category_list_str = "Unknown"
         low_stock_info_str = "No stock info available."
         try:
-            category_query = select(distinct(Product.category)).where(Product.category.isnot(None))
-            categories = db.execute(category_query).scalars().all()
+            # Served from the small category tree table instead of scanning products
+            categories = CategoryRepository().get_paths_with_products(db)
             category_list_str = ", ".join(categories) if categories else "No categories found."
 
-            low_stock_query = (
-                select(distinct(Product.category))
-                .join(Inventory, Product.id == Inventory.prod_id)
-                .where(Inventory.stock <= low_stock_threshold, Product.category.isnot(None))
-            )
-            low_stock_categories = db.execute(low_stock_query).scalars().all()
+            # Per-product reorder thresholds, served from the partial low-stock index
+            low_stock_categories = InventoryRepository().get_low_stock_categories(db)
             low_stock_info_str = (
-                f"Low stock (<= {low_stock_threshold} units): {', '.join(low_stock_categories)}"
+                f"Low stock (at or below reorder threshold): {', '.join(low_stock_categories)}"
                 if low_stock_categories else "No low stock categories."
             )
             logger.info(f"Categories: {category_list_str}, Low Stock: {low_stock_info_str}")
@@ -1,14 +1,18 @@
 # domain/cart/endpoints.py
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Path, Header, Cookie, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Dict, Optional
 
 # Local imports
 from . import schemas
 from .service import CartService
+from .guest import (
+    GUEST_CART_HEADER, GUEST_CART_COOKIE, GuestCartTokenError, encode_guest_cart, decode_guest_cart
+)
 
 # Core dependencies
 from config.db import get_db
+from config.settings import settings
 
 # Auth dependencies
 from domain.authentication.models import User
@@ -31,13 +35,43 @@ def get_cart_service() -> CartService:
     """Provides a CartService instance."""
     # Could potentially initialize with specific repo instances if needed later
     return CartService()
+
+# --- Guest cart token helpers ---
+def get_guest_cart_items(
+    x_guest_cart: Optional[str] = Header(None, alias=GUEST_CART_HEADER),
+    guest_cart: Optional[str] = Cookie(None, alias=GUEST_CART_COOKIE),
+) -> Dict[int, int]:
+    """
+    Reads the guest cart from the X-Guest-Cart header (preferred) or the guest_cart cookie.
+    A missing, tampered or expired token is treated as an empty cart.
+    """
+    token = x_guest_cart or guest_cart
+    if not token:
+        return {}
+    try:
+        return decode_guest_cart(token)
+    except GuestCartTokenError as e:
+        print(f"API WARNING: Ignoring guest cart token: {e}")
+        return {}
+
+def _guest_cart_response(response: Response, cart: dict, items: Dict[int, int]) -> dict:
+    """ Re-issues the signed token for `items`, sets it as a cookie and adds it to the payload. """
+    try:
+        token = encode_guest_cart(items)
+    except GuestCartTokenError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    response.set_cookie(
+        GUEST_CART_COOKIE, token, max_age=settings.GUEST_CART_TTL_DAYS * 86400,
+        httponly=True, samesite="lax"
+    )
+    return {**cart, "token": token}
 # ---
 
 @router.get(
     "/",
     response_model=schemas.CartOut,
     summary="Get current user's cart",
-    description="Retrieves all items, quantities, and product details for the logged-in user's cart.",
+    description="Retrieves all items, quantities, and product details for the logged-in user's cart, with totals and per-line stock availability computed in the same query.",
 )
 def get_user_cart(
     db: Session = Depends(get_db),
@@ -92,6 +126,34 @@ def add_or_update_cart_item(
             detail="An unexpected error occurred while updating the cart.",
         )
 
+@router.patch(
+    "/",
+    response_model=schemas.CartOut,
+    summary="Apply several cart changes at once",
+    description="Applies a list of add / set / remove operations in a single transaction and returns the resulting cart. Stock for all lines is validated up front; if anything fails, nothing changes.",
+)
+def apply_cart_operations(
+    operations: List[schemas.CartOperation] = Body(..., min_length=1, example=[
+        {"op": "add", "prod_id": 1, "quantity": 2},
+        {"op": "set", "prod_id": 2, "quantity": 1},
+        {"op": "remove", "prod_id": 3},
+    ]),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    cart_service: CartService = Depends(get_cart_service)
+):
+    """ Batch cart edit (merges, multi-item edits): one round trip, one commit. """
+    try:
+        return cart_service.apply_operations(db=db, user_id=current_user.id, operations=operations)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        print(f"API ERROR: apply_cart_operations: User {current_user.id}, Ops: {len(operations)}, Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred while updating the cart.",
+        )
+
 @router.put(
     "/{prod_id}",
     response_model=schemas.CartItemOut,
@@ -185,4 +247,108 @@ def clear_user_cart(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred while clearing the cart.",
-        )
\ No newline at end of file
+        )
+
+@router.post(
+    "/merge-guest",
+    response_model=schemas.CartOut,
+    summary="Merge a guest cart into the user's cart",
+    description="Moves the lines of a guest cart token (X-Guest-Cart header or guest_cart cookie) into the logged-in user's cart in one batch. Quantities are added to existing lines and capped at available stock; unknown products are skipped. Clears the guest cookie.",
+)
+def merge_guest_cart(
+    response: Response,
+    items: Dict[int, int] = Depends(get_guest_cart_items),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    cart_service: CartService = Depends(get_cart_service)
+):
+    """ Called once after login; one query, one bulk write, one commit. """
+    try:
+        cart = cart_service.merge_guest_cart(db=db, user_id=current_user.id, items=items)
+        response.delete_cookie(GUEST_CART_COOKIE)
+        return cart
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        print(f"API ERROR: merge_guest_cart: User {current_user.id}, Lines: {len(items)}, Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred while merging the guest cart.",
+        )
+
+
+# --- Guest cart (no login) ---
+# The cart lives in a signed client token, so these routes never write to the database.
+guest_router = APIRouter(
+    tags=["Guest Cart"],
+    responses={
+        404: {"description": "Not Found"},
+        400: {"description": "Bad Request"},
+        500: {"description": "Internal Server Error"},
+    },
+)
+
+@guest_router.get(
+    "/",
+    response_model=schemas.GuestCartOut,
+    summary="Get a guest cart",
+    description="Returns the guest cart carried in the X-Guest-Cart header (or guest_cart cookie) with current prices, totals and availability. Invalid or expired tokens yield an empty cart.",
+)
+def get_guest_cart(
+    response: Response,
+    items: Dict[int, int] = Depends(get_guest_cart_items),
+    db: Session = Depends(get_db),
+    cart_service: CartService = Depends(get_cart_service)
+):
+    """ Read-only: one query prices the lines the token lists. """
+    try:
+        cart = cart_service.get_guest_cart(db=db, items=items)
+        # Products that no longer exist drop out of the re-issued token
+        return _guest_cart_response(response, cart, {line["prod_id"]: line["quantity"] for line in cart["items"]})
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        print(f"API ERROR: get_guest_cart: Lines: {len(items)}, Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred while fetching the cart.",
+        )
+
+@guest_router.patch(
+    "/",
+    response_model=schemas.GuestCartOut,
+    summary="Apply changes to a guest cart",
+    description="Applies add / set / remove operations to the guest cart, validating stock up front, and returns the cart with a new signed token. Nothing is stored server-side and no stock is held.",
+)
+def apply_guest_cart_operations(
+    response: Response,
+    operations: List[schemas.CartOperation] = Body(..., min_length=1, example=[
+        {"op": "add", "prod_id": 1, "quantity": 2},
+    ]),
+    items: Dict[int, int] = Depends(get_guest_cart_items),
+    db: Session = Depends(get_db),
+    cart_service: CartService = Depends(get_cart_service)
+):
+    """ Same batch semantics as PATCH /cart/, against the token instead of cart_items. """
+    try:
+        cart, new_items = cart_service.apply_guest_operations(db=db, items=items, operations=operations)
+        return _guest_cart_response(response, cart, new_items)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        print(f"API ERROR: apply_guest_cart_operations: Ops: {len(operations)}, Error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred while updating the cart.",
+        )
+
+@guest_router.delete(
+    "/",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Clear a guest cart",
+    description="Clears the guest cart cookie. Clients using the header simply discard their token.",
+)
+def clear_guest_cart(response: Response):
+    """ Nothing to delete server-side. """
+    response.delete_cookie(GUEST_CART_COOKIE)
+    return None
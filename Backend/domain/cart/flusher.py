@@ -0,0 +1,57 @@
+# domain/cart/flusher.py
+import asyncio
+import logging
+from typing import Optional
+
+from config import db as db_config
+from config.settings import settings
+from .store import cart_store
+
+logger = logging.getLogger(__name__)
+
+def flush_cart_store(recover: bool = False) -> int:
+    """
+    Writes dirty carts from the write-back store to cart_items (after replaying any journal
+    left by a previous process when `recover` is set). Returns the number of carts written.
+    """
+    if db_config.SessionLocal is None:
+        logger.error("Cart store flusher: database session factory is not available.")
+        return 0
+    db = db_config.SessionLocal()
+    try:
+        written = 0
+        if recover:
+            recovered = cart_store.recover(db)
+            if recovered:
+                logger.info(f"Cart store flusher replayed journaled changes for {recovered} cart(s).")
+            written += recovered
+        return written + cart_store.flush(db)
+    finally:
+        db.close()
+
+async def run_cart_store_flusher(interval_seconds: Optional[int] = None):
+    """Background task: periodically writes back dirty carts; flushes once more on shutdown."""
+    if cart_store is None:
+        logger.info("Cart store flusher not needed (CART_STORE_MODE=direct).")
+        return
+    interval_seconds = interval_seconds or settings.CART_STORE_FLUSH_INTERVAL_SECONDS
+    logger.info(f"Cart store flusher started (interval={interval_seconds}s).")
+    recover = True
+    try:
+        while True:
+            try:
+                # DB work is blocking; keep it off the event loop
+                written = await asyncio.to_thread(flush_cart_store, recover)
+                recover = False
+                if written:
+                    logger.debug(f"Cart store flusher wrote {written} cart(s).")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cart store flusher run failed: {e}", exc_info=True)
+            await asyncio.sleep(interval_seconds)
+    except asyncio.CancelledError:
+        # Shutdown: write everything still pending before the process exits
+        written = flush_cart_store(recover)
+        logger.info(f"Cart store flusher stopped after writing {written} cart(s).")
+        raise
@@ -0,0 +1,77 @@
+# domain/cart/guest.py
+"""
+Guest carts live entirely on the client, in a compact signed token:
+
+    base64url(zlib(json([version, issued_at, [[prod_id, quantity], ...]]))) "." base64url(hmac_sha256)[:16 bytes]
+
+The token is verified with the server secret only (no database access) and is re-issued on
+every change. Guests don't hold stock; lines are moved into cart_items in one batch at login.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+import zlib
+from typing import Dict
+
+from config.settings import settings
+
+GUEST_CART_HEADER = "X-Guest-Cart"
+GUEST_CART_COOKIE = "guest_cart"
+TOKEN_VERSION = 1
+MAX_TOKEN_LENGTH = 4096 # Fits in a cookie
+MAX_PAYLOAD_BYTES = 16384 # Decompression bound (guards against zip bombs)
+
+
+class GuestCartTokenError(ValueError):
+    """Raised for tokens that are malformed, tampered with, expired or too large."""
+
+
+def _secret() -> bytes:
+    return (settings.GUEST_CART_SECRET_KEY or settings.JWT_SECRET_KEY).encode("utf-8")
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(_secret(), body.encode("ascii"), hashlib.sha256).digest()[:16])
+
+
+def encode_guest_cart(items: Dict[int, int]) -> str:
+    """Serializes {prod_id: quantity} (lines <= 0 are dropped) into a signed token."""
+    lines = [[prod_id, quantity] for prod_id, quantity in sorted(items.items()) if quantity > 0]
+    if len(lines) > settings.GUEST_CART_MAX_LINES:
+        raise GuestCartTokenError(f"Guest carts are limited to {settings.GUEST_CART_MAX_LINES} products.")
+    payload = json.dumps([TOKEN_VERSION, int(time.time()), lines], separators=(",", ":")).encode("utf-8")
+    body = _b64encode(zlib.compress(payload, 9))
+    return f"{body}.{_sign(body)}"
+
+
+def decode_guest_cart(token: str) -> Dict[int, int]:
+    """Verifies a token and returns {prod_id: quantity}. Raises GuestCartTokenError if invalid."""
+    if len(token) > MAX_TOKEN_LENGTH:
+        raise GuestCartTokenError("Guest cart token is too large.")
+    if not token.isascii(): # Tokens are base64url; compare_digest and _sign reject anything else with TypeError/UnicodeError
+        raise GuestCartTokenError("Guest cart token is malformed.")
+    body, _, signature = token.partition(".")
+    if not body or not hmac.compare_digest(signature, _sign(body)):
+        raise GuestCartTokenError("Guest cart token signature is invalid.")
+    try:
+        decompressor = zlib.decompressobj()
+        payload = decompressor.decompress(_b64decode(body), MAX_PAYLOAD_BYTES)
+        if decompressor.unconsumed_tail:
+            raise GuestCartTokenError("Guest cart token is too large.")
+        version, issued_at, lines = json.loads(payload)
+    except GuestCartTokenError:
+        raise
+    except Exception as e:
+        raise GuestCartTokenError("Guest cart token is malformed.") from e
+    if version != TOKEN_VERSION:
+        raise GuestCartTokenError("Guest cart token version is not supported.")
+    if time.time() - issued_at > settings.GUEST_CART_TTL_DAYS * 86400:
+        raise GuestCartTokenError("Guest cart token has expired.")
+    return {int(prod_id): int(quantity) for prod_id, quantity in lines if int(quantity) > 0}
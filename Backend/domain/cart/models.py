@@ -1,6 +1,7 @@
 # domain/cart/models.py
+from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, ForeignKey, UniqueConstraint, CheckConstraint
+    Column, Integer, ForeignKey, UniqueConstraint, CheckConstraint, DateTime, Index
 )
 from sqlalchemy.orm import relationship
 from config.db import Base
@@ -14,6 +15,8 @@ class CartItem(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     prod_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
+    # Last time the line was written; carts untouched for CART_RETENTION_DAYS are purged
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # --- Use STRINGS for related models to prevent circular imports ---
     user = relationship(
@@ -31,7 +34,9 @@ class CartItem(Base):
     __table_args__ = (
         UniqueConstraint('user_id', 'prod_id', name='uq_user_product_cart'),
         # Ensure DB enforces positive quantity (adjust if 0 is allowed for some reason)
-        CheckConstraint('quantity > 0', name='check_cart_item_quantity_positive')
+        CheckConstraint('quantity > 0', name='check_cart_item_quantity_positive'),
+        # Purge checks "does this user have any recently touched line?"
+        Index('ix_cart_items_user_updated', 'user_id', 'updated_at'),
     )
 
 # --- Ensure User and Product models are defined elsewhere ---
@@ -0,0 +1,61 @@
+# domain/cart/purger.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from config import db as db_config
+from config.settings import settings
+from .repository import CartRepository
+
+logger = logging.getLogger(__name__)
+
+cart_repository = CartRepository()
+
+def purge_abandoned_carts(batch_size: Optional[int] = None, retention_days: Optional[int] = None) -> int:
+    """
+    Deletes lines of carts untouched for the retention period, one small committed batch at a
+    time so no transaction holds many row locks. Logs progress per batch; returns rows deleted.
+    """
+    if db_config.SessionLocal is None:
+        logger.error("Cart purger: database session factory is not available.")
+        return 0
+    batch_size = batch_size or settings.CART_PURGE_BATCH_SIZE
+    retention_days = retention_days or settings.CART_RETENTION_DAYS
+    # Fixed for the whole run, so carts touched mid-run are never picked up
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    total_deleted = 0
+    batches = 0
+    db = db_config.SessionLocal()
+    try:
+        while True:
+            deleted = cart_repository.delete_abandoned(db, cutoff, batch_size=batch_size)
+            if not deleted:
+                break
+            total_deleted += deleted
+            batches += 1
+            logger.info(f"Cart purger: batch {batches} deleted {deleted} line(s), {total_deleted} so far (cutoff {cutoff:%Y-%m-%d %H:%M}).")
+            if deleted < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return total_deleted
+
+async def run_cart_purger(interval_seconds: Optional[int] = None):
+    """Background task: periodically deletes abandoned cart lines."""
+    interval_seconds = interval_seconds or settings.CART_PURGE_INTERVAL_SECONDS
+    logger.info(f"Cart purger started (interval={interval_seconds}s, retention={settings.CART_RETENTION_DAYS} days).")
+    while True:
+        try:
+            # DB work is blocking; keep it off the event loop
+            deleted = await asyncio.to_thread(purge_abandoned_carts)
+            if deleted:
+                logger.info(f"Cart purger removed {deleted} abandoned cart line(s).")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Cart purger run failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
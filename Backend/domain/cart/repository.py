@@ -1,17 +1,43 @@
 # domain/cart/repository.py
 import starlette.status as stat
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, and_, delete, select, literal, case, exists
+from sqlalchemy.orm import Session, joinedload, aliased
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Optional, List
+from typing import Optional, List, Dict
+from datetime import datetime
+from collections import namedtuple
 from . import models
+from config.db import dialect_insert
+from .store import WriteBackCartStore, cart_store
+from domain.product.models import Product
+from domain.inventory.models import Inventory, StockReservation, reserved_units, stock_on_hand
 # Ensure Product model can be imported if needed for type hinting, but relationship uses string
 # from domain.product.models import Product
 
+# What add_quantity_guarded returns: the line after the add, with its product and availability
+AddedLine = namedtuple("AddedLine", ["id", "quantity", "product", "line_total", "available_stock"])
+
 class CartRepository:
+    """
+    Cart lines. With a write-back store (CART_STORE_MODE="write_back") line reads come from the
+    store and line writes are staged there, reaching cart_items on the store's flush; stored lines
+    then carry the product id as their id. Otherwise every method reads and writes cart_items.
+    """
+
+    def __init__(self, store: Optional[WriteBackCartStore] = cart_store):
+        self.store = store
 
     def get_cart_item(self, db: Session, user_id: int, prod_id: int) -> Optional[models.CartItem]:
         """Gets a specific cart item, eagerly loading the product."""
+        if self.store is not None:
+            quantity = self.store.get_lines(db, user_id).get(prod_id)
+            if quantity is None:
+                return None
+            # Transient (never added to the session); the store stays the source of truth
+            cart_item = models.CartItem(id=prod_id, user_id=user_id, prod_id=prod_id, quantity=quantity)
+            cart_item.product = db.get(Product, prod_id)
+            return cart_item
         try:
             return db.query(models.CartItem)\
                      .options(joinedload(models.CartItem.product))\
@@ -25,6 +51,8 @@ class CartRepository:
     def get_user_cart_items(self, db: Session, user_id: int) -> List[models.CartItem]:
         """Gets all cart items for a user, eagerly loading product details."""
         print(f"REPOSITORY: Fetching cart items for user {user_id} with joinedload(product)")
+        if self.store is not None:
+            self.store.flush_user(db, user_id) # Checkout reads cart_items; write pending lines first
         try:
             items = db.query(models.CartItem)\
                       .options(joinedload(models.CartItem.product))\
@@ -44,6 +72,210 @@ class CartRepository:
             print(f"UNEXPECTED ERROR in get_user_cart_items for user {user_id}: {e}")
             raise # <<< CORRECTED INDENTATION HERE (ensure it's under the 'except Exception')
 
+    def lock_checkout_lines(self, db: Session, user_id: int) -> List:
+        """
+        Checkout read: the user's cart lines with current product prices, cart rows locked
+        (FOR UPDATE) in prod_id order so concurrent checkouts of the same cart serialize.
+        Pending write-back changes are written to cart_items first.
+        """
+        if self.store is not None:
+            self.store.flush_user(db, user_id)
+        return db.query(models.CartItem.prod_id, models.CartItem.quantity, Product.price)\
+                 .join(Product, Product.id == models.CartItem.prod_id)\
+                 .filter(models.CartItem.user_id == user_id)\
+                 .order_by(models.CartItem.prod_id)\
+                 .with_for_update(of=models.CartItem)\
+                 .all()
+
+    def get_cart_with_totals(self, db: Session, user_id: int) -> List:
+        """
+        Loads the whole cart in ONE query: each row carries the cart line, its product, the stock
+        still available to this user (their own hold counts as theirs) and the line total, plus
+        cart-wide total_cost / item_count computed by window sums over the same rows.
+        """
+        if self.store is not None:
+            return self._lines_with_totals(db, self.store.get_lines(db, user_id), user_id=user_id)
+        line_total = (Product.price * models.CartItem.quantity).label("line_total")
+        available_stock = (
+            func.coalesce(stock_on_hand() - reserved_units(), 0)
+            + func.coalesce(StockReservation.quantity, 0)
+        ).label("available_stock")
+        try:
+            return db.query(
+                        models.CartItem.id,
+                        models.CartItem.prod_id,
+                        models.CartItem.quantity,
+                        Product,
+                        available_stock,
+                        line_total,
+                        func.sum(Product.price * models.CartItem.quantity).over().label("total_cost"),
+                        func.sum(models.CartItem.quantity).over().label("item_count"),
+                    )\
+                     .join(Product, Product.id == models.CartItem.prod_id)\
+                     .outerjoin(Inventory, Inventory.prod_id == models.CartItem.prod_id)\
+                     .outerjoin(
+                         StockReservation,
+                         and_(StockReservation.user_id == models.CartItem.user_id,
+                              StockReservation.prod_id == models.CartItem.prod_id),
+                     )\
+                     .filter(models.CartItem.user_id == user_id)\
+                     .order_by(models.CartItem.id)\
+                     .all()
+        except SQLAlchemyError as e:
+            print(f"DATABASE ERROR - get_cart_with_totals for user {user_id}: {e}")
+            db.rollback()
+            raise
+
+    def get_line_states(self, db: Session, user_id: Optional[int], prod_ids: List[int]) -> List:
+        """
+        For a batch edit, ONE query over the requested products: (prod_id, cart quantity or None,
+        stock available to this user). Products that don't exist are simply absent.
+        With user_id=None (guest carts) there is no stored line or own hold to join.
+        """
+        if user_id is not None and self.store is not None:
+            lines = self.store.get_lines(db, user_id)
+            quantity = case(lines, value=Product.id) if lines else literal(None)
+            available_stock = (
+                func.coalesce(stock_on_hand() - reserved_units(), 0)
+                + func.coalesce(StockReservation.quantity, 0)
+            ).label("available_stock")
+            return db.query(Product.id, quantity.label("quantity"), available_stock)\
+                     .outerjoin(Inventory, Inventory.prod_id == Product.id)\
+                     .outerjoin(StockReservation,
+                                and_(StockReservation.prod_id == Product.id, StockReservation.user_id == user_id))\
+                     .filter(Product.id.in_(prod_ids))\
+                     .all()
+        if user_id is None:
+            available_stock = func.coalesce(stock_on_hand() - reserved_units(), 0).label("available_stock")
+            return db.query(Product.id, literal(None).label("quantity"), available_stock)\
+                     .outerjoin(Inventory, Inventory.prod_id == Product.id)\
+                     .filter(Product.id.in_(prod_ids))\
+                     .all()
+        available_stock = (
+            func.coalesce(stock_on_hand() - reserved_units(), 0)
+            + func.coalesce(StockReservation.quantity, 0)
+        ).label("available_stock")
+        return db.query(Product.id, models.CartItem.quantity, available_stock)\
+                 .outerjoin(models.CartItem,
+                            and_(models.CartItem.prod_id == Product.id, models.CartItem.user_id == user_id))\
+                 .outerjoin(Inventory, Inventory.prod_id == Product.id)\
+                 .outerjoin(StockReservation,
+                            and_(StockReservation.prod_id == Product.id, StockReservation.user_id == user_id))\
+                 .filter(Product.id.in_(prod_ids))\
+                 .all()
+
+    def get_guest_cart_with_totals(self, db: Session, quantities: Dict[int, int]) -> List:
+        """Guest-cart counterpart of get_cart_with_totals; the lines come from the client token."""
+        return self._lines_with_totals(db, quantities)
+
+    def _lines_with_totals(self, db: Session, quantities: Dict[int, int], user_id: Optional[int] = None) -> List:
+        """
+        get_cart_with_totals for lines held outside cart_items (guest token or write-back store):
+        quantities are inlined as a CASE over product ids. Same row shape (id is the product id);
+        products that no longer exist drop out. With a user_id, their own holds count as available.
+        """
+        if not quantities:
+            return []
+        quantity = case(quantities, value=Product.id)
+        available_stock = func.coalesce(stock_on_hand() - reserved_units(), 0)
+        if user_id is not None:
+            available_stock = available_stock + func.coalesce(StockReservation.quantity, 0)
+        query = db.query(
+                    Product.id.label("id"),
+                    Product.id.label("prod_id"),
+                    quantity.label("quantity"),
+                    Product,
+                    available_stock.label("available_stock"),
+                    (Product.price * quantity).label("line_total"),
+                    func.sum(Product.price * quantity).over().label("total_cost"),
+                    func.sum(quantity).over().label("item_count"),
+                 )\
+                 .outerjoin(Inventory, Inventory.prod_id == Product.id)
+        if user_id is not None:
+            query = query.outerjoin(StockReservation,
+                                    and_(StockReservation.prod_id == Product.id, StockReservation.user_id == user_id))
+        return query.filter(Product.id.in_(list(quantities)))\
+                    .order_by(Product.id)\
+                    .all()
+
+    def add_quantity_guarded(self, db: Session, user_id: int, prod_id: int, quantity: int):
+        """
+        Add-to-cart in ONE statement (no commit):
+            INSERT INTO cart_items (user_id, prod_id, quantity)
+            SELECT :user, :prod, :n FROM products WHERE id = :prod AND <available> >= :n
+            ON CONFLICT (user_id, prod_id) DO UPDATE SET quantity = cart_items.quantity + excluded.quantity
+            WHERE <available> >= cart_items.quantity + excluded.quantity
+            RETURNING id, quantity, <available>, (SELECT <column> FROM products WHERE id = :prod)...
+        <available> is the stock this user may hold (stock on hand - reserved + their own hold);
+        the user's own hold doesn't change it, so it is still right once the hold is updated.
+        Relies on uq_user_product_cart; concurrent adds of the same line serialize on that row.
+        Returns an AddedLine (product as a dict), or None if the product is unknown or stock is
+        insufficient. With a write-back store the same check runs as one read and the new
+        quantity is staged.
+        """
+        if self.store is not None:
+            new_quantity = self.store.get_lines(db, user_id).get(prod_id, 0) + quantity
+            line = next(iter(self._lines_with_totals(db, {prod_id: new_quantity}, user_id)), None)
+            if line is None or line.available_stock < new_quantity:
+                return None
+            self.store.stage(db, user_id, {prod_id: new_quantity})
+            product = {column.key: getattr(line.Product, column.key) for column in Product.__table__.columns}
+            return AddedLine(prod_id, new_quantity, product, line.line_total, line.available_stock)
+        own_hold = select(StockReservation.quantity)\
+            .where(StockReservation.user_id == user_id, StockReservation.prod_id == prod_id)\
+            .scalar_subquery()
+        unreserved = select(stock_on_hand() - reserved_units())\
+            .where(Inventory.prod_id == prod_id)\
+            .scalar_subquery()
+        available = func.coalesce(unreserved, 0) + func.coalesce(own_hold, 0)
+
+        now = datetime.utcnow()
+        source = select(literal(user_id), literal(prod_id), literal(quantity), literal(now))\
+            .where(Product.id == prod_id, available >= quantity)
+        stmt = dialect_insert(db, models.CartItem).from_select(["user_id", "prod_id", "quantity", "updated_at"], source)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "prod_id"],
+            set_={"quantity": models.CartItem.quantity + stmt.excluded.quantity, "updated_at": now},
+            where=available >= models.CartItem.quantity + stmt.excluded.quantity,
+        ).returning(
+            models.CartItem.id, models.CartItem.quantity, available.label("available_stock"),
+            *(select(column).where(Product.id == prod_id).scalar_subquery().label(f"product_{column.key}")
+              for column in Product.__table__.columns),
+        )
+        row = db.execute(stmt).one_or_none()
+        if row is None:
+            return None
+        product = {column.key: row._mapping[f"product_{column.key}"] for column in Product.__table__.columns}
+        return AddedLine(row.id, row.quantity, product, product["price"] * row.quantity, row.available_stock)
+
+    def set_quantities(self, db: Session, user_id: int, quantities: dict) -> None:
+        """
+        Writes final cart quantities ({prod_id: quantity}) without committing: one DELETE for
+        lines going to 0 and one INSERT ... ON CONFLICT (user_id, prod_id) DO UPDATE for the rest.
+        With a write-back store they are staged instead and applied to the store on commit.
+        """
+        if self.store is not None:
+            self.store.stage(db, user_id, quantities)
+            return
+        removed = [prod_id for prod_id, quantity in quantities.items() if quantity <= 0]
+        kept = {prod_id: quantity for prod_id, quantity in quantities.items() if quantity > 0}
+        if removed:
+            db.execute(
+                delete(models.CartItem)
+                .where(models.CartItem.user_id == user_id, models.CartItem.prod_id.in_(removed))
+                .execution_options(synchronize_session=False)
+            )
+        if kept:
+            now = datetime.utcnow()
+            stmt = dialect_insert(db, models.CartItem).values(
+                [{"user_id": user_id, "prod_id": prod_id, "quantity": quantity, "updated_at": now}
+                 for prod_id, quantity in kept.items()]
+            )
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["user_id", "prod_id"],
+                set_={"quantity": stmt.excluded.quantity, "updated_at": stmt.excluded.updated_at},
+            ))
+
     def add_item(self, db: Session, user_id: int, prod_id: int, quantity: int) -> models.CartItem:
         """Adds a new item. Assumes validation (stock, product exists) done before call."""
         db_item = models.CartItem(
@@ -73,6 +305,10 @@ class CartRepository:
             self.remove_item(db, cart_item) # Use the remove method
             return None # Indicate removal
 
+        if self.store is not None:
+            self._commit_staged(db, cart_item.user_id, {cart_item.prod_id: new_quantity}, "updating quantity")
+            cart_item.quantity = new_quantity
+            return cart_item
         cart_item.quantity = new_quantity
         try:
             # Add instance to session to track changes (SQLAlchemy usually does this automatically for loaded objects)
@@ -91,6 +327,9 @@ class CartRepository:
         """Removes a specific cart item instance."""
         prod_id = cart_item.prod_id
         user_id = cart_item.user_id
+        if self.store is not None:
+            self._commit_staged(db, user_id, {prod_id: 0}, "removing item")
+            return
         try:
             db.delete(cart_item)
             db.commit()
@@ -100,17 +339,75 @@ class CartRepository:
             print(f"DATABASE ERROR - remove_item: {e}")
             raise HTTPException(status_code=stat.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error removing item.") from e
 
-    def clear_user_cart(self, db: Session, user_id: int) -> int:
-        """Removes all items for a user. Returns the count deleted."""
+    def clear_user_cart(self, db: Session, user_id: int, commit: bool = True) -> int:
+        """Removes all items for a user. Returns the count deleted. commit=False joins the caller's transaction."""
+        if self.store is not None:
+            lines = self.store.get_lines(db, user_id)
+            if commit:
+                self._commit_staged(db, user_id, {prod_id: 0 for prod_id in lines}, "clearing cart")
+            else:
+                # Checkout: the rows go in the caller's transaction too, so a second checkout that
+                # was waiting on the row locks (or runs on a worker whose cache never saw this one)
+                # finds the cart empty. The staged zeros update the cache once it commits.
+                db.query(models.CartItem)\
+                  .filter(models.CartItem.user_id == user_id)\
+                  .delete(synchronize_session=False)
+                self.store.stage(db, user_id, {prod_id: 0 for prod_id in lines})
+            return len(lines)
         try:
             # Use synchronize_session=False for potentially better performance on bulk delete
             num_deleted = db.query(models.CartItem)\
                             .filter(models.CartItem.user_id == user_id)\
                             .delete(synchronize_session='fetch') # 'fetch' or False common strategies
+            if not commit:
+                return num_deleted
             db.commit()
             print(f"REPOSITORY: Cleared {num_deleted} items for user {user_id}")
             return num_deleted
         except SQLAlchemyError as e:
             db.rollback()
             print(f"DATABASE ERROR - clear_user_cart for user {user_id}: {e}")
-            raise HTTPException(status_code=stat.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error clearing cart.") from e
\ No newline at end of file
+            raise HTTPException(status_code=stat.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error clearing cart.") from e
+
+    def delete_abandoned(self, db: Session, cutoff: datetime, batch_size: int) -> int:
+        """
+        Deletes up to `batch_size` lines of abandoned carts (no line of that user touched since
+        `cutoff`) and commits, as one short statement:
+            DELETE FROM cart_items WHERE id IN (SELECT id ... ORDER BY updated_at LIMIT n)
+        Rows locked by an in-flight cart write are skipped (SKIP LOCKED on Postgres).
+        Their stock holds expired long before (RESERVATION_TTL_SECONDS). Returns rows deleted.
+        """
+        recent = aliased(models.CartItem)
+        batch = select(models.CartItem.id)\
+            .where(
+                models.CartItem.updated_at < cutoff,
+                ~exists().where(recent.user_id == models.CartItem.user_id, recent.updated_at >= cutoff),
+            )\
+            .order_by(models.CartItem.updated_at)\
+            .limit(batch_size)\
+            .with_for_update(skip_locked=True)
+        try:
+            user_ids = db.execute(
+                delete(models.CartItem)
+                .where(models.CartItem.id.in_(batch))
+                .returning(models.CartItem.user_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"DATABASE ERROR - delete_abandoned (cutoff {cutoff}): {e}")
+            raise
+        if self.store is not None and user_ids:
+            self.store.forget(user_ids)
+        return len(user_ids)
+
+    def _commit_staged(self, db: Session, user_id: int, quantities: Dict[int, int], action: str) -> None:
+        """Write-back counterpart of the commits above: stages the lines and commits the session."""
+        try:
+            self.store.stage(db, user_id, quantities)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"DATABASE ERROR - {action} for user {user_id}: {e}")
+            raise HTTPException(status_code=stat.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Database error {action}.") from e
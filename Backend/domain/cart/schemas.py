@@ -1,6 +1,6 @@
 # domain/cart/schemas.py
-from pydantic import BaseModel, Field, ConfigDict # Use ConfigDict for Pydantic v2
-from typing import Optional, List
+from pydantic import BaseModel, Field, ConfigDict, model_validator # Use ConfigDict for Pydantic v2
+from typing import Optional, List, Literal
 
 # --- Import the Product schema ---
 try:
@@ -38,11 +38,28 @@ class CartItemUpdate(BaseModel):
     # class Config: # Pydantic v1
     #    orm_mode = True
 
+# One operation of a batch cart edit (PATCH /cart/), applied in list order
+class CartOperation(CartItemBase):
+    op: Literal["add", "set", "remove"] = Field(..., example="set", description="add: increase by quantity, set: exact quantity (0 removes), remove: drop the line")
+    quantity: Optional[int] = Field(None, ge=0, example=2, description="Required for add (> 0) and set")
+
+    @model_validator(mode="after")
+    def check_quantity(self):
+        if self.op == "add" and not self.quantity:
+            raise ValueError("'add' requires a quantity greater than 0.")
+        if self.op == "set" and self.quantity is None:
+            raise ValueError("'set' requires a quantity.")
+        return self
+
 # Schema for returning items (includes nested product)
 class CartItemOut(CartItemBase):
     id: int
     quantity: int # Override from Base if needed, ensure it's present
     product: ProductRead # Expects nested product data
+    # Filled in by GET /cart/ (computed in the cart query)
+    line_total: Optional[float] = Field(None, description="price x quantity")
+    available_stock: Optional[int] = Field(None, description="Units this user can have of the product right now")
+    in_stock: Optional[bool] = Field(None, description="True if the requested quantity is still available")
 
     # Use model_config for Pydantic v2
     model_config = ConfigDict(from_attributes=True)
@@ -52,11 +69,15 @@ class CartItemOut(CartItemBase):
 # Schema for returning the whole cart
 class CartOut(BaseModel):
     items: List[CartItemOut] = Field(..., description="List of items in the cart, including product details")
-    # Optional calculated fields can be added later if needed
-    # total_cost: Optional[float] = None
-    # item_count: Optional[int] = None
+    total_cost: float = Field(0.0, description="Sum of line totals, computed by the database")
+    item_count: int = Field(0, description="Total quantity across all lines")
+    shipping_fee: float = Field(0.0, description="Shipping fee checkout will charge for this cart")
 
     # Use model_config for Pydantic v2
     model_config = ConfigDict(from_attributes=True)
     # class Config: # Pydantic v1
-    #    orm_mode = True
\ No newline at end of file
+    #    orm_mode = True
+
+# Guest cart (no login): same payload plus the re-issued signed token to send back next time
+class GuestCartOut(CartOut):
+    token: str = Field(..., description="Signed guest cart token; send it back in the X-Guest-Cart header (also set as a cookie)")
@@ -1,12 +1,13 @@
 # domain/cart/service.py
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import List, Optional, Dict, Tuple
 from . import schemas, models
 from .repository import CartRepository
 # --- Adjust these imports based on your project structure ---
 from domain.product.repository import ProductRepository # To check product exists/details
-from domain.inventory.repository import InventoryRepository # To check stock
+from domain.inventory.repository import InventoryRepository, ReservationRepository # To check and hold stock
+from config.settings import settings
 # Import the specific models if needed for type hinting or checks
 from domain.product.models import Product as ProductModel
 from domain.inventory.models import Inventory as InventoryModel
@@ -16,11 +17,13 @@ class CartService:
         self,
         cart_repository: CartRepository = CartRepository(),
         product_repository: ProductRepository = ProductRepository(),
-        inventory_repository: InventoryRepository = InventoryRepository()
+        inventory_repository: InventoryRepository = InventoryRepository(),
+        reservation_repository: ReservationRepository = ReservationRepository()
     ):
         self.cart_repository = cart_repository
         self.product_repository = product_repository
         self.inventory_repository = inventory_repository
+        self.reservation_repository = reservation_repository
 
     def _get_product_or_404(self, db: Session, product_id: int) -> ProductModel:
         """ Helper to get product, raising 404 if not found. """
@@ -32,133 +35,230 @@ class CartService:
             )
         return product
 
-    def _get_available_stock(self, db: Session, product_id: int) -> int:
+    def _get_available_stock(self, db: Session, product_id: int, user_id: int) -> int:
         """
-        Helper to get current available stock for a product.
+        Helper to get stock available to this user: stock minus other carts' active holds
+        (the user's own hold counts as available to them).
         Raises 404 if product doesn't exist (via _get_product_or_404).
         Returns 0 if no inventory record.
         """
         self._get_product_or_404(db, product_id) # Ensure product exists first
 
-        inventory = self.inventory_repository.get_inventory_by_prod_id(db, product_id) # Adapt method name if needed
-        stock = inventory.stock if inventory and inventory.stock is not None else 0
+        stock = self.reservation_repository.get_available_stock(db, product_id, user_id=user_id)
         # print(f"SERVICE DEBUG: Stock check for prod_id {product_id}: {stock}")
-        return stock
-
-    def get_cart(self, db: Session, user_id: int) -> schemas.CartOut:
-        """Gets the user's cart items, ensuring product details are loaded for output."""
-        print(f"SERVICE: get_cart called for user_id: {user_id}")
-        items_db: List[models.CartItem] = self.cart_repository.get_user_cart_items(db, user_id)
-        print(f"SERVICE: Found {len(items_db)} raw items in DB for user {user_id}.")
-
-        items_out: List[schemas.CartItemOut] = []
-        for item in items_db:
-            print(f"SERVICE: Processing CartItem id={item.id}, prod_id={item.prod_id}, quantity={item.quantity}")
-
-            # Verify product relationship was loaded (crucial check)
-            if not hasattr(item, 'product') or item.product is None:
-                # This indicates a failure in eager loading (repo) or relationship definition (model)
-                print(f"SERVICE CRITICAL ERROR: Product relationship not loaded for CartItem id={item.id}, prod_id={item.prod_id}!")
-                # Don't try to validate, raise immediately
+        return stock or 0
+
+    def _hold_stock(self, db: Session, user_id: int, product_id: int, quantity: int) -> None:
+        """
+        Takes (or resizes) the user's time-limited hold for a cart line, without committing;
+        the following cart write commits both. Raises 400 if a concurrent cart took the stock first.
+        """
+        held = self.reservation_repository.hold(
+            db, user_id, product_id, quantity,
+            ttl_seconds=settings.RESERVATION_TTL_SECONDS, commit=False
+        )
+        if not held:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot reserve {quantity} of product {product_id}. Not enough stock is available."
+            )
+
+    def _cart_from_rows(self, rows) -> dict:
+        """Shapes cart rows (see CartRepository.get_cart_with_totals) into the CartOut payload."""
+        total_cost = round(rows[0].total_cost, 2) if rows else 0.0
+        return {
+            "items": [
+                {
+                    "id": row.id,
+                    "prod_id": row.prod_id,
+                    "quantity": row.quantity,
+                    "product": row.Product,
+                    "line_total": round(row.line_total, 2),
+                    "available_stock": max(row.available_stock, 0),
+                    "in_stock": row.available_stock >= row.quantity,
+                }
+                for row in rows
+            ],
+            "total_cost": total_cost,
+            "item_count": rows[0].item_count if rows else 0,
+            "shipping_fee": settings.SHIPPING_FEE if total_cost > 0 else 0.0, # Same rule as checkout
+        }
+
+    def get_cart(self, db: Session, user_id: int) -> dict:
+        """
+        Gets the user's cart with totals and per-line availability, all computed by the database
+        in a single query. Rows are returned as-is; the response model validates them once.
+        """
+        return self._cart_from_rows(self.cart_repository.get_cart_with_totals(db, user_id))
+
+    def get_guest_cart(self, db: Session, items: Dict[int, int]) -> dict:
+        """Same payload as get_cart for a guest cart carried in a client token (read-only)."""
+        return self._cart_from_rows(self.cart_repository.get_guest_cart_with_totals(db, items))
+
+    def _resolve_operations(
+        self, db: Session, user_id: Optional[int], current: Optional[Dict[int, int]],
+        operations: List[schemas.CartOperation]
+    ) -> Dict[int, int]:
+        """
+        Folds a batch of operations into final quantities and validates them against stock with
+        one query. Starting quantities come from cart_items for a user, or from `current` for a
+        guest cart. Returns {prod_id: new_quantity} for the lines that change.
+        Raises 404 for unknown products and 400 if any changed line exceeds available stock.
+        """
+        prod_ids = list(dict.fromkeys(op.prod_id for op in operations))
+        states = {row.id: row for row in self.cart_repository.get_line_states(db, user_id, prod_ids)}
+        missing = [prod_id for prod_id in prod_ids if prod_id not in states]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Products not found: {missing}. No changes were made."
+            )
+
+        if current is None:
+            existing = {prod_id: states[prod_id].quantity or 0 for prod_id in prod_ids}
+        else:
+            existing = {prod_id: current.get(prod_id, 0) for prod_id in prod_ids}
+        quantities = dict(existing)
+        for op in operations:
+            if op.op == "add":
+                quantities[op.prod_id] += op.quantity
+            elif op.op == "set":
+                quantities[op.prod_id] = op.quantity
+            else:
+                quantities[op.prod_id] = 0
+        changed = {
+            prod_id: quantity for prod_id, quantity in quantities.items()
+            if quantity != existing[prod_id]
+        }
+        short = {
+            prod_id: max(states[prod_id].available_stock, 0)
+            for prod_id, quantity in changed.items() if quantity > states[prod_id].available_stock
+        }
+        if short:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient stock (product id: available): {short}. No changes were made."
+            )
+        return changed
+
+    def _write_quantities(self, db: Session, user_id: int, changed: Dict[int, int]) -> None:
+        """ Holds stock for and stores the changed lines in bulk, committing once. """
+        if not changed:
+            return
+        try:
+            held = self.reservation_repository.hold_many(
+                db, user_id, changed, ttl_seconds=settings.RESERVATION_TTL_SECONDS
+            )
+            if not held:
+                db.rollback()
                 raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Internal Server Error: Failed to load product details for cart item (Product ID {item.prod_id})."
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Stock changed while updating the cart. No changes were made; please retry."
                 )
+            self.cart_repository.set_quantities(db, user_id, changed)
+            db.commit()
+        except HTTPException:
+            raise
+        except Exception as e:
+            db.rollback()
+            print(f"SERVICE ERROR: writing cart lines failed for user {user_id}: {e}")
+            raise HTTPException(status_code=500, detail="Internal error updating cart.") from e
 
-            product_name = getattr(item.product, 'name', 'N/A') # Safe access for logging
-            print(f"SERVICE:   Product data appears loaded: id={item.product.id}, name='{product_name}'")
-
-            # Attempt Pydantic Validation (This is where 500 happens if data mismatch)
-            try:
-                # Ensure schemas.ProductRead fields match the actual item.product attributes
-                validated_item = schemas.CartItemOut.model_validate(item) # Pydantic V2
-                # validated_item = schemas.CartItemOut.from_orm(item) # Pydantic V1
-                items_out.append(validated_item)
-                print(f"SERVICE:   Successfully validated CartItem id={item.id} into CartItemOut.")
-            except Exception as validation_error:
-                # Log detailed error if validation fails
-                print(f"SERVICE ERROR: Pydantic validation FAILED for CartItem id={item.id}, prod_id={item.prod_id}")
-                print(f"SERVICE ERROR DETAILS: {validation_error}")
-                # Log the raw data causing the failure
-                print(f"SERVICE ERROR DATA DUMP: CartItem={vars(item)}, Product={vars(item.product)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Server error processing cart item (Product ID {item.prod_id}). Check server logs for validation details."
-                ) from validation_error # Preserve original exception trace
+    def apply_operations(
+        self, db: Session, user_id: int, operations: List[schemas.CartOperation]
+    ) -> dict:
+        """
+        Applies a batch of add / set / remove operations as one unit: one query loads existing
+        lines and availability for every product involved, all stock is validated before anything
+        is written, holds and cart lines are written in bulk, and everything commits once.
+        Raises 404 for unknown products and 400 (changing nothing) if any line exceeds stock.
+        Returns the resulting cart.
+        """
+        changed = self._resolve_operations(db, user_id, None, operations)
+        self._write_quantities(db, user_id, changed)
+        return self.get_cart(db, user_id)
 
-        print(f"SERVICE: Finished processing. Returning CartOut with {len(items_out)} validated items for user {user_id}.")
-        return schemas.CartOut(items=items_out)
+    def apply_guest_operations(
+        self, db: Session, items: Dict[int, int], operations: List[schemas.CartOperation]
+    ) -> Tuple[dict, Dict[int, int]]:
+        """
+        Applies the same operations to a guest cart carried in a client token. Stock is checked
+        with one read-only query; nothing is written and no stock is held for guests.
+        Returns (cart, new {prod_id: quantity} to encode into the next token).
+        """
+        changed = self._resolve_operations(db, None, items, operations)
+        merged = {**items, **changed}
+        new_items = {prod_id: quantity for prod_id, quantity in merged.items() if quantity > 0}
+        return self.get_guest_cart(db, new_items), new_items
 
+    def merge_guest_cart(self, db: Session, user_id: int, items: Dict[int, int]) -> dict:
+        """
+        Folds a guest cart into the user's cart at login as one batch: guest quantities are added
+        to existing lines and capped at what is available, so a stale guest cart never fails the
+        login flow. Unknown products are skipped. Returns the resulting cart.
+        """
+        if items:
+            changed = {}
+            for row in self.cart_repository.get_line_states(db, user_id, list(items)):
+                current = row.quantity or 0
+                target = max(current, min(current + items[row.id], row.available_stock))
+                if target != current:
+                    changed[row.id] = target
+            self._write_quantities(db, user_id, changed)
+        return self.get_cart(db, user_id)
 
     def add_or_update_item(
         self, db: Session, user_id: int, item_data: schemas.CartItemCreate
     ) -> schemas.CartItemOut:
         """
-        Adds item or increases quantity. Validates product existence and stock.
+        Adds item or increases quantity. Hot path: one guarded upsert (stock checked inside the
+        statement, product and availability returned by it), the stock hold and one commit.
+        Existence/stock diagnostics only run when the upsert matched nothing.
         Returns the state of the cart item after operation.
         """
         prod_id = item_data.prod_id
         requested_quantity_increase = item_data.quantity # Qty to ADD in this request
 
-        # 1. Check stock (includes product existence check via helper)
-        available_stock = self._get_available_stock(db, prod_id)
+        row = self.cart_repository.add_quantity_guarded(db, user_id, prod_id, requested_quantity_increase)
+        if row is None:
+            db.rollback()
+            self._raise_add_failure(db, user_id, prod_id, requested_quantity_increase)
 
-        # 2. Get existing cart item
+        # The hold is the authoritative guard against other carts; it rolls back the upsert on failure
+        self._hold_stock(db, user_id, prod_id, row.quantity)
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"SERVICE ERROR: add_or_update - commit failed for prod_id {prod_id}, user {user_id}: {e}")
+            raise HTTPException(status_code=500, detail="Internal error updating cart item.") from e
+
+        return schemas.CartItemOut.model_validate({
+            "id": row.id,
+            "prod_id": prod_id,
+            "quantity": row.quantity,
+            "product": row.product,
+            "line_total": round(row.line_total, 2),
+            "available_stock": max(row.available_stock, 0),
+            "in_stock": row.available_stock >= row.quantity,
+        }, from_attributes=True)
+
+    def _raise_add_failure(self, db: Session, user_id: int, prod_id: int, quantity: int):
+        """Explains why the guarded add-to-cart upsert matched no row (failure path only)."""
+        available_stock = self._get_available_stock(db, prod_id, user_id) # 404 if the product doesn't exist
         existing_cart_item = self.cart_repository.get_cart_item(db, user_id, prod_id)
-
-        updated_item_db: Optional[models.CartItem] = None
-
         if existing_cart_item:
-            # --- UPDATE existing item ---
-            print(f"SERVICE: add_or_update - Updating existing item prod_id={prod_id}, user={user_id}.")
-            new_total_quantity = existing_cart_item.quantity + requested_quantity_increase
-
-            if new_total_quantity > available_stock:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=(f"Cannot add {requested_quantity_increase}. Requested total ({new_total_quantity}) "
-                            f"exceeds available stock ({available_stock}). "
-                            f"You already have {existing_cart_item.quantity} in cart.")
-                )
-
-            updated_item_db = self.cart_repository.update_item_quantity(
-                db, existing_cart_item, new_total_quantity
-            )
-            # update_item_quantity returns None if it removed the item (e.g., new_qty <= 0)
-            # This path shouldn't be hit if requested_quantity_increase > 0.
-            if updated_item_db is None:
-                 print(f"SERVICE ERROR: update_item_quantity unexpectedly returned None for prod_id {prod_id}")
-                 raise HTTPException(status_code=500, detail="Internal error updating cart item.")
-
-        else:
-            # --- ADD NEW item ---
-            print(f"SERVICE: add_or_update - Adding new item prod_id={prod_id}, user={user_id}.")
-            if requested_quantity_increase > available_stock:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Cannot add {requested_quantity_increase}. Only {available_stock} available in stock."
-                )
-
-            updated_item_db = self.cart_repository.add_item(
-                db, user_id, prod_id, requested_quantity_increase
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=(f"Cannot add {quantity}. Requested total ({existing_cart_item.quantity + quantity}) "
+                        f"exceeds available stock ({available_stock}). "
+                        f"You already have {existing_cart_item.quantity} in cart.")
             )
-
-        # This check is redundant if repository raises on error, but good safeguard.
-        if updated_item_db is None:
-             print(f"SERVICE ERROR: add_or_update - DB operation returned None unexpectedly for prod_id {prod_id}")
-             raise HTTPException(status_code=500, detail="Internal Server Error: Failed to get cart item after update.")
-
-        # --- Validate and Return Result ---
-        try:
-            # The repository refresh should ensure product is loaded.
-            validated_item = schemas.CartItemOut.model_validate(updated_item_db) # Pydantic V2
-            # validated_item = schemas.CartItemOut.from_orm(updated_item_db) # Pydantic V1
-            print(f"SERVICE: add_or_update - Successfully validated item prod_id={prod_id}, user={user_id}.")
-            return validated_item
-        except Exception as e:
-            print(f"SERVICE ERROR: Failed Pydantic validation after add/update for prod_id {prod_id}, user {user_id}: {e}")
-            print(f"SERVICE ERROR DATA DUMP: DB Item={vars(updated_item_db)}, Product={vars(getattr(updated_item_db, 'product', None))}")
-            raise HTTPException(status_code=500, detail="Failed to format cart item after update. Check server logs.") from e
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot add {quantity}. Only {available_stock} available in stock."
+        )
 
 
     def set_item_quantity(
@@ -183,7 +283,7 @@ class CartService:
         # --- End Input Validation ---
 
         # 1. Check Stock (includes product existence)
-        available_stock = self._get_available_stock(db, prod_id)
+        available_stock = self._get_available_stock(db, prod_id, user_id)
         if quantity > available_stock:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -199,7 +299,8 @@ class CartService:
                 detail=f"Product ID {prod_id} not found in your cart. Cannot set quantity."
             )
 
-        # 3. Update quantity in repository (will handle quantity > 0)
+        # 3. Resize the stock hold, then update quantity in repository (commits both)
+        self._hold_stock(db, user_id, prod_id, quantity)
         updated_item_db = self.cart_repository.update_item_quantity(db, existing_cart_item, quantity)
 
         # Should not be None if quantity > 0
@@ -231,6 +332,7 @@ class CartService:
                 detail=f"Product ID {prod_id} not found in cart."
             )
         try:
+            self.reservation_repository.release(db, user_id, prod_id, commit=False)
             self.cart_repository.remove_item(db, cart_item)
             print(f"SERVICE: remove_item - Successfully removed item prod_id={prod_id} for user {user_id}.")
         except HTTPException as e:
@@ -245,6 +347,7 @@ class CartService:
         """Clears all items from the user's cart. Returns count deleted."""
         print(f"SERVICE: clear_cart called for user {user_id}")
         try:
+            self.reservation_repository.release_all_for_user(db, user_id, commit=False)
             deleted_count = self.cart_repository.clear_user_cart(db, user_id)
             print(f"SERVICE: clear_cart - Removed {deleted_count} items for user {user_id}.")
             return deleted_count
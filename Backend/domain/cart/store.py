@@ -0,0 +1,416 @@
+# domain/cart/store.py
+"""
+Write-back cart store (CART_STORE_MODE="write_back"; the default "direct" mode writes cart_items
+on every edit and never touches this module's store).
+
+Cart lines of active users live in a Redis-compatible key/value backend:
+
+    cart:{user_id}   hash  prod_id -> quantity ("0" marks a removed line), "_" once loaded from cart_items
+    cart:dirty       set   user ids with changes not yet written to cart_items
+
+CartRepository stages line changes on the SQLAlchemy session; only when the transaction (which
+also holds the stock) commits are they appended to an fsync'd journal and applied to the
+backend. A background task flushes dirty carts to cart_items in batched upserts on an interval,
+a user's cart is flushed before checkout reads it, and everything is flushed on shutdown.
+Journal segments are only deleted after the carts they cover are committed to cart_items; on
+startup any leftover segments are replayed into cart_items, so a crash loses no committed edit.
+
+Each process journals to its own file (CART_STORE_JOURNAL_PATH suffixed with its pid), so
+workers can share one path. A starting process also replays the files of processes that are
+no longer running, e.g. a worker that crashed and was replaced.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, event, or_
+from sqlalchemy.orm import Session
+
+from config.db import dialect_insert
+from config.settings import settings
+from . import models
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "cart:dirty"
+LOADED_FIELD = "_"
+_SESSION_KEY = "pending_cart_lines"
+
+
+def cart_key(user_id: int) -> str:
+    return f"cart:{user_id}"
+
+
+class LocalCartBackend:
+    """
+    In-process stand-in for Redis implementing the handful of commands the store uses, with the
+    same signatures and string values as redis-py (decode_responses=True). Used for
+    CART_STORE_URL="memory://" and in tests.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, object] = {}
+        self._expires_at: Dict[str, float] = {}
+        self._lock = threading.Lock() # Sync endpoints run on worker threads
+
+    def _get(self, key: str, default_factory=None):
+        deadline = self._expires_at.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires_at.pop(key, None)
+        if key not in self._data and default_factory is not None:
+            self._data[key] = default_factory()
+        return self._data.get(key)
+
+    def hexists(self, name: str, key: str) -> bool:
+        with self._lock:
+            return key in (self._get(name) or {})
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._get(name) or {})
+
+    def hset(self, name: str, mapping: Dict[str, str]) -> int:
+        with self._lock:
+            hash_ = self._get(name, dict)
+            added = len(set(mapping) - set(hash_))
+            hash_.update({field: str(value) for field, value in mapping.items()})
+            return added
+
+    def hsetnx(self, name: str, key: str, value: str) -> bool:
+        with self._lock:
+            hash_ = self._get(name, dict)
+            if key in hash_:
+                return False
+            hash_[key] = str(value)
+            return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            removed = 0
+            for name in names:
+                removed += self._get(name) is not None
+                self._data.pop(name, None)
+                self._expires_at.pop(name, None)
+            return removed
+
+    def expire(self, name: str, seconds: int) -> bool:
+        with self._lock:
+            if self._get(name) is None:
+                return False
+            self._expires_at[name] = time.monotonic() + seconds
+            return True
+
+    def persist(self, name: str) -> bool:
+        with self._lock:
+            return self._expires_at.pop(name, None) is not None
+
+    def sadd(self, name: str, *values) -> int:
+        with self._lock:
+            members = self._get(name, set)
+            added = len({str(value) for value in values} - members)
+            members.update(str(value) for value in values)
+            return added
+
+    def srem(self, name: str, *values) -> int:
+        with self._lock:
+            members = self._get(name) or set()
+            removed = len({str(value) for value in values} & members)
+            members.difference_update(str(value) for value in values)
+            return removed
+
+    def sismember(self, name: str, value) -> bool:
+        with self._lock:
+            return str(value) in (self._get(name) or set())
+
+    def spop(self, name: str, count: Optional[int] = None):
+        with self._lock:
+            members = self._get(name) or set()
+            popped = [members.pop() for _ in range(min(count or 1, len(members)))]
+            return popped if count is not None else (popped[0] if popped else None)
+
+
+def _process_running(pid: int) -> bool:
+    """Whether a process with this pid exists on this host (signal 0 only checks)."""
+    if pid == os.getpid() or os.name == "nt": # os.kill can't probe on Windows: assume it's alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except (ProcessLookupError, OverflowError):
+        return False
+    except PermissionError:
+        return True # Exists, owned by another user
+    return True
+
+
+class CartJournal:
+    """
+    Append-only log of committed cart line changes, one JSON line
+    [user_id, {prod_id: quantity}, time_ns] per commit, fsync'd before the change is applied to
+    the backend. Every process writes its own file, <path>.<pid>, so workers sharing a journal
+    path never interleave lines or discard each other's entries. rotate() seals this process's
+    file into a segment (<path>.<pid>.<time_ns>); segments are discarded once a flush has written
+    everything they cover. orphaned() finds the files of processes that are no longer running.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.base_path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_pid = None
+
+    @property
+    def path(self) -> str:
+        # Resolved on use: the store is created at import time, possibly before the worker forks
+        return f"{self.base_path}.{os.getpid()}"
+
+    def append(self, user_id: int, quantities: Dict[int, int]) -> None:
+        line = json.dumps(
+            [user_id, {str(prod_id): quantity for prod_id, quantity in quantities.items()}, time.time_ns()],
+            separators=(",", ":"),
+        )
+        with self._lock:
+            if self._file is None or self._file_pid != os.getpid():
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._file_pid = os.getpid()
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def rotate(self) -> List[str]:
+        """Seals this process's file (if it has entries) and returns its sealed segments, oldest first."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            path = self.path
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                os.replace(path, f"{path}.{time.time_ns()}")
+        return self.segments()
+
+    def segments(self) -> List[str]:
+        """This process's sealed segments, oldest first."""
+        return sorted(glob.glob(f"{glob.escape(self.path)}.[0-9]*"), key=lambda path: int(path.rsplit(".", 1)[1]))
+
+    def orphaned(self) -> List[str]:
+        """
+        Journal files, sealed or not, left by processes that are no longer running (including
+        the unsuffixed file and segments of older versions).
+        """
+        orphans = [self.base_path] if os.path.exists(self.base_path) else []
+        for path in glob.glob(f"{glob.escape(self.base_path)}.[0-9]*"):
+            owner = path[len(self.base_path) + 1:].split(".", 1)[0]
+            if owner.isdigit() and not _process_running(int(owner)):
+                orphans.append(path)
+        return orphans
+
+    def read(self, segments: Iterable[str]) -> Dict[int, Dict[int, int]]:
+        """Folds segments into the latest quantity per (user, product), in commit order across files."""
+        entries = []
+        for segment in segments:
+            try:
+                with open(segment, encoding="utf-8") as journal_file:
+                    for line in journal_file:
+                        try:
+                            user_id, quantities, *rest = json.loads(line)
+                        except ValueError:
+                            logger.warning(f"Cart journal: skipping torn line in {segment}.")
+                            continue # A crash mid-write can only tear the last line
+                        entries.append((rest[0] if rest else 0, user_id, quantities))
+            except FileNotFoundError:
+                continue # Replayed and discarded by another worker that started at the same time
+        patches: Dict[int, Dict[int, int]] = {}
+        for _, user_id, quantities in sorted(entries, key=lambda entry: entry[0]): # Stable: file order on ties
+            patches.setdefault(int(user_id), {}).update(
+                {int(prod_id): int(quantity) for prod_id, quantity in quantities.items()}
+            )
+        return patches
+
+    def discard(self, segments: Iterable[str]) -> None:
+        for segment in segments:
+            try:
+                os.remove(segment)
+            except FileNotFoundError:
+                pass
+
+
+def write_cart_patches(db: Session, patches: Dict[int, Dict[int, int]]) -> None:
+    """
+    Writes {user_id: {prod_id: quantity}} to cart_items without committing: one DELETE for lines
+    at 0 and one INSERT ... ON CONFLICT DO UPDATE for the rest, skipping rows already up to date.
+    """
+    removed = [
+        and_(models.CartItem.user_id == user_id, models.CartItem.prod_id.in_(prod_ids))
+        for user_id, prod_ids in (
+            (user_id, [prod_id for prod_id, quantity in lines.items() if quantity <= 0])
+            for user_id, lines in patches.items()
+        ) if prod_ids
+    ]
+    now = datetime.utcnow()
+    kept = [
+        {"user_id": user_id, "prod_id": prod_id, "quantity": quantity, "updated_at": now}
+        for user_id, lines in patches.items() for prod_id, quantity in lines.items() if quantity > 0
+    ]
+    if removed:
+        db.execute(
+            delete(models.CartItem).where(or_(*removed)).execution_options(synchronize_session=False)
+        )
+    if kept:
+        stmt = dialect_insert(db, models.CartItem).values(kept)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "prod_id"],
+            set_={"quantity": stmt.excluded.quantity, "updated_at": stmt.excluded.updated_at},
+            where=models.CartItem.quantity != stmt.excluded.quantity,
+        ))
+
+
+class WriteBackCartStore:
+    def __init__(self, backend, journal: CartJournal, idle_seconds: Optional[int] = None):
+        self.backend = backend
+        self.journal = journal
+        self.idle_seconds = idle_seconds or settings.CART_STORE_IDLE_SECONDS
+
+    # --- Reads ---
+    def _read(self, user_id: int) -> Dict[int, int]:
+        """Raw line states, including 0 for removed lines."""
+        return {
+            int(prod_id): int(quantity)
+            for prod_id, quantity in self.backend.hgetall(cart_key(user_id)).items() if prod_id != LOADED_FIELD
+        }
+
+    def _load(self, db: Session, user_id: int) -> None:
+        """Fills the cache from cart_items without overwriting lines changed since (HSETNX)."""
+        key = cart_key(user_id)
+        rows = db.query(models.CartItem.prod_id, models.CartItem.quantity)\
+                 .filter(models.CartItem.user_id == user_id)\
+                 .all()
+        for prod_id, quantity in rows:
+            self.backend.hsetnx(key, str(prod_id), str(quantity))
+        self.backend.hset(key, mapping={LOADED_FIELD: "1"})
+        self.backend.expire(key, self.idle_seconds)
+
+    def get_lines(self, db: Session, user_id: int) -> Dict[int, int]:
+        """The user's current cart {prod_id: quantity}; loaded from cart_items on a cache miss."""
+        if not self.backend.hexists(cart_key(user_id), LOADED_FIELD):
+            self._load(db, user_id)
+        return {prod_id: quantity for prod_id, quantity in self._read(user_id).items() if quantity > 0}
+
+    # --- Writes (staged on the session, applied after commit) ---
+    def stage(self, db: Session, user_id: int, quantities: Dict[int, int]) -> None:
+        db.info.setdefault(_SESSION_KEY, {}).setdefault(user_id, {}).update(quantities)
+
+    def apply(self, user_id: int, quantities: Dict[int, int]) -> None:
+        """Journals, then caches, committed line changes and marks the cart dirty."""
+        self.journal.append(user_id, quantities)
+        key = cart_key(user_id)
+        self.backend.hset(key, mapping={str(prod_id): str(max(quantity, 0)) for prod_id, quantity in quantities.items()})
+        self.backend.persist(key) # Dirty carts never expire
+        self.backend.sadd(DIRTY_KEY, user_id)
+
+    # --- Flushing ---
+    def _flush_users(self, db: Session, user_ids: List[int]) -> int:
+        patches = {user_id: lines for user_id in user_ids if (lines := self._read(user_id))}
+        try:
+            write_cart_patches(db, patches)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.backend.sadd(DIRTY_KEY, *user_ids) # Retried on the next flush
+            raise
+        for user_id in patches:
+            self.backend.expire(cart_key(user_id), self.idle_seconds)
+        return len(patches)
+
+    def flush(self, db: Session, batch_size: Optional[int] = None) -> int:
+        """
+        Writes every dirty cart to cart_items, one batched upsert + commit per batch of carts.
+        Journal segments sealed before the flush are discarded only if every batch succeeded.
+        Returns the number of carts written.
+        """
+        batch_size = batch_size or settings.CART_STORE_FLUSH_BATCH_SIZE
+        segments = self.journal.rotate()
+        flushed = 0
+        while True:
+            user_ids = [int(user_id) for user_id in self.backend.spop(DIRTY_KEY, batch_size) or []]
+            if not user_ids:
+                break
+            flushed += self._flush_users(db, user_ids)
+        self.journal.discard(segments)
+        return flushed
+
+    def flush_user(self, db: Session, user_id: int) -> None:
+        """Writes one user's pending changes to cart_items now (before checkout reads them)."""
+        if self.backend.srem(DIRTY_KEY, user_id):
+            self._flush_users(db, [user_id])
+
+    def forget(self, user_ids: Iterable[int]) -> None:
+        """Drops cached carts whose rows were deleted behind the store (carts with pending edits stay)."""
+        stale = [cart_key(user_id) for user_id in set(user_ids) if not self.backend.sismember(DIRTY_KEY, user_id)]
+        if stale:
+            self.backend.delete(*stale)
+
+    def recover(self, db: Session) -> int:
+        """
+        Replays journal files left by previous processes (this pid's, if it was reused, and those
+        of processes no longer running) into cart_items. Returns carts written.
+        """
+        segments = self.journal.rotate() + self.journal.orphaned()
+        if not segments:
+            return 0
+        patches = self.journal.read(segments)
+        try:
+            write_cart_patches(db, patches)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        # Cached copies may predate the replayed lines
+        self.backend.delete(*(cart_key(user_id) for user_id in patches))
+        self.journal.discard(segments)
+        return len(patches)
+
+
+def _create_cart_store() -> Optional[WriteBackCartStore]:
+    mode = settings.CART_STORE_MODE
+    if mode == "direct":
+        return None
+    if mode != "write_back":
+        raise ValueError(f"Unknown CART_STORE_MODE '{mode}' (expected 'direct' or 'write_back').")
+    url = settings.CART_STORE_URL
+    if url.startswith("memory://"):
+        backend = LocalCartBackend()
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CART_STORE_URL points at Redis but the 'redis' package is not installed.") from e
+        backend = redis.Redis.from_url(url, decode_responses=True)
+    else:
+        raise ValueError(f"Unsupported CART_STORE_URL '{url}' (expected memory:// or redis://).")
+    logger.info(f"Cart store: write-back to cart_items via {url.split('://')[0]} backend.")
+    return WriteBackCartStore(backend, CartJournal(settings.CART_STORE_JOURNAL_PATH, fsync=settings.CART_STORE_JOURNAL_FSYNC))
+
+# None in direct mode
+cart_store = _create_cart_store()
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session):
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending or cart_store is None:
+        return
+    for user_id, quantities in pending.items():
+        try:
+            cart_store.apply(user_id, quantities)
+        except Exception as e:
+            logger.error(f"Cart store: failed to apply committed changes for user {user_id}: {e}", exc_info=True)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,62 @@
+# domain/category/endpoints.py
+from fastapi import APIRouter, Depends, Query, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from . import schemas
+from . import service
+from domain.product.schemas import ProductRead
+from config.db import get_db
+
+# Prefix is added in main.py
+router = APIRouter(
+    tags=["Categories"],
+    responses={404: {"description": "Category not found"}},
+)
+
+def get_category_service() -> service.CategoryService:
+    return service.category_service
+
+@router.get(
+    "/",
+    response_model=List[schemas.CategoryNode],
+    summary="Get the category tree",
+    description="Returns the category hierarchy with per-node product and in-stock counts. Pass `root_id` to fetch a single subtree.",
+)
+def read_category_tree(
+    root_id: Optional[int] = Query(None, ge=1, description="Only return the subtree rooted at this category"),
+    db: Session = Depends(get_db),
+    cat_service: service.CategoryService = Depends(get_category_service)
+):
+    """ Returns the nested category tree built from one indexed prefix query. """
+    return cat_service.get_tree(db, root_id=root_id)
+
+@router.get(
+    "/{category_id}/products",
+    response_model=List[ProductRead],
+    summary="List products under a category",
+    description="Lists products in the category and all of its sub-categories, with pagination.",
+)
+def read_category_products(
+    category_id: int,
+    skip: int = Query(0, ge=0, description="Number of product records to skip"),
+    limit: int = Query(100, ge=1, le=500, description="Maximum number of product records to return"),
+    db: Session = Depends(get_db),
+    cat_service: service.CategoryService = Depends(get_category_service)
+):
+    """ Lists products under a category node using a prefix match on the product category. """
+    return cat_service.get_products(db, category_id=category_id, skip=skip, limit=limit)
+
+@router.post(
+    "/rebuild",
+    response_model=schemas.CategoryRebuildResult,
+    status_code=status.HTTP_200_OK,
+    summary="Rebuild category counters (Admin)",
+    description="Recomputes the category tree and its counters from the products table. Use once to backfill existing data.",
+)
+def rebuild_category_tree(
+    db: Session = Depends(get_db),
+    cat_service: service.CategoryService = Depends(get_category_service)
+):
+    """ Backfills the category tree from existing products. """
+    return cat_service.rebuild(db)
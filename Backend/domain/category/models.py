@@ -0,0 +1,46 @@
+# domain/category/models.py
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from typing import List, Optional
+from config.db import Base
+
+# Separator used in Product.category strings, e.g. "Electronics > Audio"
+PATH_SEPARATOR = " > "
+
+class Category(Base):
+    """
+    Materialized-path node of the category tree.
+    `path` is the full normalized category string ("Electronics > Audio"),
+    so a subtree is every row whose path equals the node or starts with "<path> > ".
+    """
+    __tablename__ = "categories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String, unique=True, nullable=False)
+    name = Column(String, nullable=False)
+    parent_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
+    # Counters are maintained incrementally by the product and inventory write paths.
+    # Each count covers the node's whole subtree.
+    product_count = Column(Integer, nullable=False, default=0)
+    in_stock_count = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def normalize_path(raw: Optional[str]) -> Optional[str]:
+        """Normalizes 'A>B >  C' into 'A > B > C'. Returns None for empty values."""
+        if raw is None:
+            return None
+        segments = [segment.strip() for segment in raw.split(">")]
+        segments = [segment for segment in segments if segment]
+        return PATH_SEPARATOR.join(segments) if segments else None
+
+    @staticmethod
+    def ancestor_paths(path: str) -> List[str]:
+        """Returns every path from the root down to (and including) `path`."""
+        segments = path.split(PATH_SEPARATOR)
+        return [PATH_SEPARATOR.join(segments[:i + 1]) for i in range(len(segments))]
+
+    def __repr__(self):
+        return f"<Category(id={self.id}, path='{self.path}', products={self.product_count})>"
+
+# text_pattern_ops lets Postgres answer `path LIKE 'prefix%'` from the btree index
+Index("ix_category_path_prefix", Category.path, postgresql_ops={"path": "text_pattern_ops"})
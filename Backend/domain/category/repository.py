@@ -0,0 +1,128 @@
+# domain/category/repository.py
+from sqlalchemy import or_, case
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from .models import Category, PATH_SEPARATOR
+from domain.product.models import Product
+
+def subtree_filter(column, path: str):
+    """SQL filter matching `path` itself and every descendant path (prefix match, index friendly)."""
+    return or_(column == path, column.startswith(path + PATH_SEPARATOR, autoescape=True))
+
+class CategoryRepository:
+    # NOTE: Write helpers here do NOT commit. They are called from the product/inventory
+    # repositories so that counter updates land in the same transaction as the product write.
+
+    def get_by_id(self, db: Session, category_id: int) -> Optional[Category]:
+        return db.query(Category).filter(Category.id == category_id).first()
+
+    def get_by_path(self, db: Session, path: str) -> Optional[Category]:
+        return db.query(Category).filter(Category.path == path).first()
+
+    def get_subtree(self, db: Session, root_path: Optional[str] = None) -> List[Category]:
+        """Fetches all nodes (or one subtree) in a single prefix-range query, ordered by path."""
+        query = db.query(Category)
+        if root_path:
+            query = query.filter(subtree_filter(Category.path, root_path))
+        return query.order_by(Category.path).all()
+
+    def get_paths_with_products(self, db: Session) -> List[str]:
+        """Returns every category path that currently has at least one product."""
+        rows = db.query(Category.path).filter(Category.product_count > 0).order_by(Category.path).all()
+        return [row[0] for row in rows]
+
+    def get_products_under(self, db: Session, path: str, skip: int = 0, limit: int = 100) -> List[Product]:
+        """Lists products in a node's subtree using a prefix match on products.category."""
+        return db.query(Product)\
+                 .filter(subtree_filter(Product.category, path))\
+                 .order_by(Product.id)\
+                 .offset(skip).limit(limit).all()
+
+    def ensure_path(self, db: Session, path: str) -> Category:
+        """Creates any missing nodes along `path` (flush only) and returns the leaf node."""
+        ancestors = Category.ancestor_paths(path)
+        existing = {
+            node.path: node
+            for node in db.query(Category).filter(Category.path.in_(ancestors)).all()
+        }
+        parent: Optional[Category] = None
+        for depth, node_path in enumerate(ancestors):
+            node = existing.get(node_path)
+            if node is None:
+                node = Category(
+                    path=node_path,
+                    name=node_path.split(PATH_SEPARATOR)[-1],
+                    parent_id=parent.id if parent else None,
+                    depth=depth,
+                    product_count=0,
+                    in_stock_count=0,
+                )
+                db.add(node)
+                db.flush() # Need the id for the next child
+            parent = node
+        return parent
+
+    def adjust_counts(
+        self, db: Session, path: Optional[str], product_delta: int = 0, in_stock_delta: int = 0
+    ) -> None:
+        """Applies counter deltas to a node and all its ancestors in one UPDATE."""
+        if not path or (product_delta == 0 and in_stock_delta == 0):
+            return
+        if product_delta > 0:
+            self.ensure_path(db, path)
+        db.query(Category)\
+          .filter(Category.path.in_(Category.ancestor_paths(path)))\
+          .update(
+              {
+                  Category.product_count: Category.product_count + product_delta,
+                  Category.in_stock_count: Category.in_stock_count + in_stock_delta,
+              },
+              synchronize_session=False,
+          )
+
+    def adjust_in_stock_for_products(self, db: Session, in_stock_deltas: Dict[int, int]) -> None:
+        """
+        Applies in-stock deltas ({prod_id: +1/-1}) for products whose stock crossed zero.
+        Deltas are summed per ancestor path and written in one UPDATE, however many products changed.
+        """
+        in_stock_deltas = {prod_id: delta for prod_id, delta in in_stock_deltas.items() if delta}
+        if not in_stock_deltas:
+            return
+        rows = db.query(Product.id, Product.category)\
+                 .filter(Product.id.in_(list(in_stock_deltas)), Product.category.isnot(None))\
+                 .all()
+        per_path: Dict[str, int] = {}
+        for prod_id, category in rows:
+            for path in Category.ancestor_paths(category):
+                per_path[path] = per_path.get(path, 0) + in_stock_deltas[prod_id]
+        per_path = {path: delta for path, delta in per_path.items() if delta}
+        if not per_path:
+            return
+        db.query(Category)\
+          .filter(Category.path.in_(list(per_path)))\
+          .update(
+              {Category.in_stock_count: Category.in_stock_count + case(per_path, value=Category.path)},
+              synchronize_session=False,
+          )
+
+    def rebuild_counts(self, db: Session) -> int:
+        """
+        Recomputes the whole tree from products/inventory (backfill for existing data).
+        Commits. Returns the number of category nodes after the rebuild.
+        """
+        from domain.inventory.models import Inventory # Local import: inventory imports this module
+
+        db.query(Category).update(
+            {Category.product_count: 0, Category.in_stock_count: 0}, synchronize_session=False
+        )
+        rows = db.query(Product, Inventory.stock)\
+                 .outerjoin(Inventory, Inventory.prod_id == Product.id)\
+                 .filter(Product.category.isnot(None))\
+                 .all()
+        for product, stock in rows:
+            path = Category.normalize_path(product.category)
+            if path != product.category:
+                product.category = path # Older rows may predate normalization
+            self.adjust_counts(db, path, product_delta=1, in_stock_delta=1 if (stock or 0) > 0 else 0)
+        db.commit()
+        return db.query(Category).count()
@@ -0,0 +1,20 @@
+# domain/category/schemas.py
+from pydantic import BaseModel, Field, ConfigDict
+from typing import List, Optional
+
+class CategoryRead(BaseModel):
+    id: int
+    name: str = Field(..., example="Audio")
+    path: str = Field(..., example="Electronics > Audio")
+    parent_id: Optional[int] = None
+    depth: int = Field(..., example=1)
+    product_count: int = Field(..., description="Products in this node's subtree")
+    in_stock_count: int = Field(..., description="Products in this node's subtree with stock > 0")
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CategoryNode(CategoryRead):
+    children: List["CategoryNode"] = Field(default_factory=list)
+
+class CategoryRebuildResult(BaseModel):
+    node_count: int
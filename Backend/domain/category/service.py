@@ -0,0 +1,47 @@
+# domain/category/service.py
+from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from typing import Dict, List, Optional
+from . import schemas
+from .models import Category
+from .repository import CategoryRepository
+from domain.product.models import Product
+
+class CategoryService:
+    def __init__(self, repository: CategoryRepository = CategoryRepository()):
+        self.repository = repository
+
+    def get_category_or_404(self, db: Session, category_id: int) -> Category:
+        category = self.repository.get_by_id(db, category_id)
+        if category is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+        return category
+
+    def get_tree(self, db: Session, root_id: Optional[int] = None) -> List[schemas.CategoryNode]:
+        """Builds the nested tree (or the subtree under `root_id`) from a single prefix query."""
+        root_path = self.get_category_or_404(db, root_id).path if root_id is not None else None
+        rows = self.repository.get_subtree(db, root_path=root_path)
+
+        nodes: Dict[int, schemas.CategoryNode] = {
+            row.id: schemas.CategoryNode.model_validate(row) for row in rows
+        }
+        roots: List[schemas.CategoryNode] = []
+        for row in rows:
+            parent = nodes.get(row.parent_id) if row.parent_id is not None else None
+            if parent is None:
+                roots.append(nodes[row.id]) # Top of the requested (sub)tree
+            else:
+                parent.children.append(nodes[row.id])
+        return roots
+
+    def get_products(self, db: Session, category_id: int, skip: int = 0, limit: int = 100) -> List[Product]:
+        """Lists products anywhere under the given category node."""
+        category = self.get_category_or_404(db, category_id)
+        return self.repository.get_products_under(db, category.path, skip=skip, limit=limit)
+
+    def rebuild(self, db: Session) -> schemas.CategoryRebuildResult:
+        """Recomputes all category counters from the products table."""
+        return schemas.CategoryRebuildResult(node_count=self.repository.rebuild_counts(db))
+
+# Instantiate the service
+category_service = CategoryService()
@@ -1,5 +1,5 @@
 # backend/domain/inventory/endpoints.py # Corrected path assumption
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, WebSocket
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
@@ -7,6 +7,11 @@ from typing import List, Optional
 from . import schemas
 from . import service # Assumes service.py contains InventoryService and an instance named inventory_service
 from config.db import get_db # Import database session dependency
+from domain.category.models import Category
+from websocket_manager import manager as ws_manager
+from .events import product_room, category_room
+
+MAX_STOCK_SUBSCRIPTIONS = 100 # Rooms a single stock WebSocket may watch
 
 # --- Define the Router WITHOUT the prefix ---
 router = APIRouter(
@@ -41,11 +46,74 @@ def read_all_inventory(
         print(f"Error fetching all inventory: {e}") # Replace with proper logging
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error fetching inventory list")
 
+@router.get(
+    "/low-stock", # Declared before "/{prod_id}" so it is not captured by the path parameter
+    response_model=List[schemas.LowStockItem],
+    summary="List products at or below their reorder threshold",
+    description="Served from a partial index that only contains low-stock rows, lowest stock first.",
+)
+def read_low_stock_inventory(
+    skip: int = Query(0, ge=0, description="Number of items to skip"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of items to return"),
+    db: Session = Depends(get_db),
+    inv_service: service.InventoryService = Depends(get_inventory_service)
+):
+    """ Low-stock report for admins. Threshold crossings are also pushed to the admin WebSocket. """
+    try:
+        return inv_service.get_low_stock(db=db, skip=skip, limit=limit)
+    except Exception as e:
+        print(f"Error fetching low-stock inventory: {e}") # Replace with proper logging
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error fetching low-stock inventory")
+
+@router.post(
+    "/decrement",
+    response_model=List[schemas.InventoryOut],
+    summary="Atomically decrement stock for several products",
+    description="Removes stock for several products in one conditional statement. All-or-nothing: if any product lacks stock, nothing changes.",
+)
+def decrement_inventory_bulk(
+    items: List[schemas.InventoryAdjustItem] = Body(..., min_length=1),
+    db: Session = Depends(get_db),
+    inv_service: service.InventoryService = Depends(get_inventory_service)
+):
+    """ Atomic multi-SKU decrement. Raises 400 if any SKU has insufficient stock. """
+    try:
+        return inv_service.decrement_stock_bulk(db=db, items=items)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error bulk-decrementing inventory: {e}") # Replace with proper logging
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error decrementing inventory")
+
+@router.put(
+    "/bulk", # Declared before "/{prod_id}" so it is not captured by the path parameter
+    response_model=List[schemas.InventoryBulkResult],
+    summary="Bulk update stock levels",
+    description="Applies many absolute (`stock`) or relative (`delta`) stock entries in a single transaction and returns a per-SKU result. Missing inventory records are created.",
+)
+def bulk_update_inventory(
+    items: List[schemas.InventoryBulkItem] = Body(..., min_length=1),
+    db: Session = Depends(get_db),
+    inv_service: service.InventoryService = Depends(get_inventory_service)
+):
+    """
+    Warehouse sync endpoint.
+    - Each entry has `prod_id` and exactly one of `stock` or `delta`.
+    - Unknown products are reported as `not_found`; negative results are `rejected`.
+    """
+    try:
+        return inv_service.apply_bulk_update(db=db, items=items)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error applying bulk inventory update ({len(items)} entries): {e}") # Replace with proper logging
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error applying bulk inventory update")
+
 @router.get(
     "/{prod_id}", # Path relative to prefix -> final path is /inventory/{prod_id}
     response_model=schemas.InventoryOut,
     summary="Get current stock for a specific product",
-    description="Retrieves the inventory details for a given product ID. If no inventory record exists, one might be created with 0 stock automatically.",
+    description="Retrieves the inventory details for a given product ID. If no inventory record exists, a stock of 0 is reported.",
 )
 def read_inventory_for_product(
     prod_id: int,
@@ -55,7 +123,7 @@ def read_inventory_for_product(
     """
     Fetches inventory for a product ID.
     - Raises 404 if the *product* itself doesn't exist (handled by service).
-    - Returns inventory (possibly creating it with stock 0 if missing).
+    - Returns inventory (stock 0 if no record exists; nothing is created).
     """
     try:
         inventory = inv_service.get_stock_by_prod_id(db=db, product_id=prod_id)
@@ -110,7 +178,7 @@ def update_inventory_for_product(
 ):
     """
     Updates the stock count for an existing inventory record.
-    - Requires the new `stock` value in the body.
+    - Requires the new `stock` value in the body; `reorder_threshold` is optional.
     - Raises 404 if the product or its inventory record doesn't exist (handled by service).
     """
     try:
@@ -122,4 +190,102 @@ def update_inventory_for_product(
         raise e
     except Exception as e:
         print(f"Error updating inventory for prod_id {prod_id}: {e}") # Replace with proper logging
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error updating inventory")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error updating inventory")
+
+
+@router.post(
+    "/{prod_id}/decrement",
+    response_model=schemas.InventoryOut,
+    summary="Atomically decrement stock for a product",
+    description="Removes `quantity` units only if enough stock is available, in a single conditional update.",
+)
+def decrement_inventory_for_product(
+    prod_id: int,
+    adjustment: schemas.InventoryAdjust = Body(...),
+    db: Session = Depends(get_db),
+    inv_service: service.InventoryService = Depends(get_inventory_service)
+):
+    """
+    Atomic conditional decrement.
+    - Raises 404 if the product has no inventory record.
+    - Raises 400 if stock is insufficient (stock is left unchanged).
+    """
+    try:
+        return inv_service.decrement_stock(db=db, product_id=prod_id, quantity=adjustment.quantity)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error decrementing inventory for prod_id {prod_id}: {e}") # Replace with proper logging
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error decrementing inventory")
+
+
+@router.post(
+    "/{prod_id}/increment",
+    response_model=schemas.InventoryOut,
+    summary="Atomically increment stock for a product",
+    description="Adds `quantity` units in a single atomic update.",
+)
+def increment_inventory_for_product(
+    prod_id: int,
+    adjustment: schemas.InventoryAdjust = Body(...),
+    db: Session = Depends(get_db),
+    inv_service: service.InventoryService = Depends(get_inventory_service)
+):
+    """ Atomic increment. Raises 404 if the product has no inventory record. """
+    try:
+        return inv_service.increment_stock(db=db, product_id=prod_id, quantity=adjustment.quantity)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error incrementing inventory for prod_id {prod_id}: {e}") # Replace with proper logging
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error incrementing inventory")
+
+
+@router.put(
+    "/{prod_id}/shards",
+    response_model=schemas.InventoryOut,
+    summary="Configure sharded stock counters for a hot product",
+    description="Splits the product's stock across `shard_count` rows so concurrent decrements don't queue on one row lock (0 or 1 turns sharding off). Reads keep returning a single stock figure.",
+)
+def configure_inventory_shards(
+    prod_id: int,
+    config: schemas.InventoryShardConfig = Body(...),
+    db: Session = Depends(get_db),
+    inv_service: service.InventoryService = Depends(get_inventory_service)
+):
+    """ Opt-in write scaling for promoted products. Raises 404 if the product has no inventory record. """
+    try:
+        return inv_service.configure_shards(db=db, product_id=prod_id, shard_count=config.shard_count)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error configuring shards for prod_id {prod_id}: {e}") # Replace with proper logging
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error configuring inventory shards")
+
+
+@router.websocket("/ws/stock")
+async def websocket_stock_updates(
+    websocket: WebSocket,
+    product_id: List[int] = Query([], description="Product ids to watch (repeatable)"),
+    category: List[str] = Query([], description="Category paths to watch, e.g. 'Electronics > Audio' (repeatable)"),
+):
+    """
+    Public WebSocket for live stock levels.
+    - `product_id` rooms receive `{"type": "stock_update", ...}` frames.
+    - `category` rooms receive `{"type": "stock_updates", "items": [...]}` for SKUs anywhere in the subtree.
+    Updates are coalesced server-side: at most one per SKU per STOCK_EVENT_INTERVAL_SECONDS.
+    """
+    rooms = [product_room(pid) for pid in dict.fromkeys(product_id)]
+    rooms += [category_room(path) for path in dict.fromkeys(Category.normalize_path(c) for c in category) if path]
+    if not rooms or len(rooms) > MAX_STOCK_SUBSCRIPTIONS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await ws_manager.connect(websocket, rooms[0])
+    for room in rooms[1:]:
+        ws_manager.join(websocket, room)
+    try:
+        await ws_manager.receive_until_disconnect(websocket)
+    finally:
+        for room in rooms:
+            ws_manager.disconnect(websocket, room)
@@ -0,0 +1,219 @@
+# domain/inventory/events.py
+"""
+Live stock-level push.
+
+Inventory write paths mark the products they touched as dirty on the SQLAlchemy session.
+When (and only when) the transaction commits, those ids are handed to the in-process
+publisher. A background task flushes the dirty set once per interval: it publishes the ids
+on the notification bus, so every API worker learns about writes made by any other worker.
+Each worker then re-reads the current levels for all changed SKUs in one query and
+broadcasts to its own per-product and per-category WebSocket rooms. A hot SKU therefore
+produces at most one frame per interval, however many writes it receives.
+
+Low-stock alerts ride the same path: a write that moves a product across its reorder
+threshold queues an alert, which is broadcast to the admin notifications room after commit.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from config import db as db_config
+from config.settings import settings
+from domain.category.models import Category
+from notification_bus import get_notification_bus
+from websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = "dirty_stock_product_ids"
+_ALERTS_SESSION_KEY = "pending_low_stock_alerts"
+ADMIN_ROOM = "admin_notifications"
+BUS_KIND = "stock_changes"
+
+def product_room(product_id: int) -> str:
+    return f"stock:product:{product_id}"
+
+def category_room(category_path: str) -> str:
+    return f"stock:category:{category_path}"
+
+def mark_stock_dirty(db: Session, product_ids: Iterable[int]) -> None:
+    """Records products whose stock or holds changed; published after the session commits."""
+    db.info.setdefault(_SESSION_KEY, set()).update(product_ids)
+
+def queue_low_stock_alerts(db: Session, alerts: Dict[int, dict]) -> None:
+    """Records threshold crossings ({prod_id: alert}); broadcast to admins after the session commits."""
+    if alerts:
+        db.info.setdefault(_ALERTS_SESSION_KEY, {}).update(alerts)
+
+
+def low_stock_alert(product_id: int, stock: int, reorder_threshold: int) -> dict:
+    """Alert payload for a product whose stock crossed its reorder threshold (either direction)."""
+    return {
+        "prod_id": product_id,
+        "stock": stock,
+        "reorder_threshold": reorder_threshold,
+        "state": "low" if stock <= reorder_threshold else "recovered",
+        "timestamp": time.time(),
+    }
+
+
+class StockEventPublisher:
+    def __init__(self):
+        self._dirty: Set[int] = set()
+        self._alerts: Dict[int, dict] = {} # Latest crossing per product wins
+        self._lock = threading.Lock() # Commits happen on worker threads (sync endpoints)
+        # Changes from every worker (this one included), as received from the bus
+        self._received: Set[int] = set()
+        self._received_alerts: Dict[int, dict] = {}
+
+    def mark_dirty(self, product_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(product_ids)
+
+    def _take_dirty(self) -> Set[int]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def add_alerts(self, alerts: Dict[int, dict]) -> None:
+        with self._lock:
+            self._alerts.update(alerts)
+
+    def _take_alerts(self) -> Dict[int, dict]:
+        with self._lock:
+            alerts, self._alerts = self._alerts, {}
+        return alerts
+
+    async def publish_local_changes(self) -> bool:
+        """Sends this worker's committed changes since the last flush to all workers. Returns whether any."""
+        dirty = self._take_dirty()
+        alerts = self._take_alerts()
+        if not dirty and not alerts:
+            return False
+        await get_notification_bus().publish(BUS_KIND, {
+            "product_ids": sorted(dirty),
+            "alerts": list(alerts.values()),
+        })
+        return True
+
+    async def receive_changes(self, payload: dict) -> None:
+        """Bus handler: merges another worker's (or our own) changes into the next flush."""
+        self._received.update(payload.get("product_ids", ()))
+        for alert in payload.get("alerts", ()):
+            self._received_alerts[alert["prod_id"]] = alert
+
+    def _watched_rooms(self) -> Set[str]:
+        return {room for room in list(manager.active_connections) if room.startswith("stock:")}
+
+    def _load_levels(self, product_ids: List[int]) -> List[dict]:
+        """Current stock for the dirty SKUs in one joined query."""
+        from domain.inventory.models import Inventory, reserved_units, stock_on_hand
+        from domain.product.models import Product
+
+        db = db_config.SessionLocal()
+        try:
+            rows = db.query(
+                Product.id,
+                Product.category,
+                func.coalesce(stock_on_hand(), 0),
+                func.coalesce(reserved_units(), 0),
+            ).outerjoin(Inventory, Inventory.prod_id == Product.id)\
+             .filter(Product.id.in_(product_ids))\
+             .all()
+        finally:
+            db.close()
+        return [
+            {
+                "prod_id": prod_id,
+                "category": category,
+                "stock": stock,
+                "available_stock": max(stock - reserved, 0),
+                "in_stock": stock - reserved > 0,
+            }
+            for prod_id, category, stock, reserved in rows
+        ]
+
+    def _load_names(self, product_ids: List[int]) -> Dict[int, str]:
+        from domain.product.models import Product
+
+        db = db_config.SessionLocal()
+        try:
+            return dict(db.query(Product.id, Product.name).filter(Product.id.in_(product_ids)).all())
+        finally:
+            db.close()
+
+    async def flush_alerts(self) -> int:
+        """Broadcasts received low-stock alerts to this worker's admin room. Returns the number sent."""
+        alerts, self._received_alerts = self._received_alerts, {}
+        if not alerts or ADMIN_ROOM not in manager.active_connections:
+            return 0
+        names = await asyncio.to_thread(self._load_names, sorted(alerts))
+        for prod_id, alert in sorted(alerts.items()):
+            message = {"type": "low_stock_alert", "name": names.get(prod_id), **alert}
+            await manager.broadcast(json.dumps(message), room=ADMIN_ROOM, key=f"low_stock:{prod_id}")
+        return len(alerts)
+
+    async def flush(self) -> int:
+        """
+        Publishes local changes to the bus, then sends one coalesced update per changed SKU
+        received so far to this worker's sockets. Returns the number of SKUs sent.
+        """
+        await self.publish_local_changes()
+        await self.flush_alerts()
+        dirty, self._received = self._received, set()
+        watched = self._watched_rooms()
+        if not dirty or not watched:
+            return 0 # Nobody is listening: drop the updates instead of querying
+
+        levels = await asyncio.to_thread(self._load_levels, sorted(dirty))
+        per_category: Dict[str, List[dict]] = {}
+        for level in levels:
+            room = product_room(level["prod_id"])
+            if room in watched:
+                await manager.broadcast(json.dumps({"type": "stock_update", **level}), room=room)
+            if level["category"]:
+                for path in Category.ancestor_paths(level["category"]):
+                    if category_room(path) in watched:
+                        per_category.setdefault(path, []).append(level)
+        for path, items in per_category.items():
+            # One frame per category room, however many of its SKUs changed
+            message = json.dumps({"type": "stock_updates", "category": path, "items": items})
+            await manager.broadcast(message, room=category_room(path))
+        return len(levels)
+
+
+stock_event_publisher = StockEventPublisher()
+get_notification_bus().subscribe(BUS_KIND, stock_event_publisher.receive_changes)
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session):
+    dirty = session.info.pop(_SESSION_KEY, None)
+    if dirty:
+        stock_event_publisher.mark_dirty(dirty)
+    alerts = session.info.pop(_ALERTS_SESSION_KEY, None)
+    if alerts:
+        stock_event_publisher.add_alerts(alerts)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_ALERTS_SESSION_KEY, None)
+
+async def run_stock_event_publisher(interval_seconds: Optional[float] = None):
+    """Background task: flushes coalesced stock updates and low-stock alerts to WebSocket subscribers."""
+    interval_seconds = interval_seconds or settings.STOCK_EVENT_INTERVAL_SECONDS
+    logger.info(f"Stock event publisher started (interval={interval_seconds}s).")
+    while True:
+        try:
+            await stock_event_publisher.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stock event publisher flush failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
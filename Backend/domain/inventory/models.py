@@ -1,11 +1,13 @@
 # app/domain/inventory/models.py
-from sqlalchemy import Column, Integer, ForeignKey, Index
+from sqlalchemy import Column, Integer, ForeignKey, Index, DateTime, UniqueConstraint, text, select, func, case
 from sqlalchemy.orm import relationship
 from config.db import Base
 # Assuming your product model is in app.product.models
 # Adjust the import path if necessary
 from domain.product.models import Product
 
+DEFAULT_REORDER_THRESHOLD = 10 # Used when a product has no explicit reorder threshold
+
 class Inventory(Base):
     __tablename__ = "inventory"
 
@@ -13,11 +15,92 @@ class Inventory(Base):
     # Use the actual primary key column name from the Product model
     prod_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), unique=True, index=True, nullable=False)
     stock = Column(Integer, nullable=False, default=0) # Default stock to 0
+    # Units held by active cart reservations (see StockReservation). Available = stock - reserved.
+    # For sharded products the shards count them and this is a cached total, like stock.
+    reserved = Column(Integer, nullable=False, default=0, server_default="0")
+    # Stock at or below this level counts as "low" (served by the partial index below)
+    reorder_threshold = Column(
+        Integer, nullable=False, default=DEFAULT_REORDER_THRESHOLD, server_default=str(DEFAULT_REORDER_THRESHOLD)
+    )
+    # > 1 switches the product to sharded counters (see InventoryShard). Sharding is invisible to
+    # callers: read stock through stock_on_hand() and write it through InventoryRepository.
+    shard_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Define the relationship (optional but good practice)
     # The back_populates should match the relationship name in Product model if you define one there
     product = relationship("Product", back_populates="inventory_item")
 
+    __table_args__ = (
+        # Partial index: only rows at or below their reorder threshold are indexed, so the
+        # low-stock listing and alert queries read a handful of entries instead of the table.
+        Index(
+            "ix_inventory_low_stock", "stock", "prod_id",
+            postgresql_where=text("stock <= reorder_threshold"),
+            sqlite_where=text("stock <= reorder_threshold"),
+        ),
+    )
+
+
+class StockReservation(Base):
+    """
+    Time-limited hold of stock for one user's cart line.
+    `quantity` is always mirrored in Inventory.reserved (in the shards, for a sharded product);
+    the expiry sweeper deletes expired holds and gives their units back in batches.
+    """
+    __tablename__ = "stock_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    prod_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True) # Sweeper scans by expiry
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'prod_id', name='uq_reservation_user_product'),
+    )
+
+class InventoryShard(Base):
+    """
+    One slice of a hot product's stock. For a sharded product the shards hold all of it:
+    `stock` is the shard's unreserved units and `reserved` the units held from it, so
+    concurrent decrements, holds and releases spread over `shard_count` rows instead of
+    queueing on the single inventory row. Inventory.stock and Inventory.reserved are then
+    cached totals refreshed by the shard rebalancer.
+    """
+    __tablename__ = "inventory_shards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prod_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    shard_no = Column(Integer, nullable=False)
+    stock = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        UniqueConstraint('prod_id', 'shard_no', name='uq_inventory_shard'),
+    )
+
+
+def _shard_total(column):
+    return select(func.coalesce(func.sum(column), 0))\
+        .where(InventoryShard.prod_id == Inventory.prod_id)\
+        .correlate(Inventory)\
+        .scalar_subquery()
+
+def stock_on_hand():
+    """
+    SQL expression for a product's real stock: the stock column for ordinary rows,
+    or the sum of its shards (unreserved plus held units) for sharded ones. Use it (not
+    Inventory.stock) in reads; available stock is stock_on_hand() - reserved_units().
+    """
+    return case(
+        (Inventory.shard_count > 1, _shard_total(InventoryShard.stock + InventoryShard.reserved)),
+        else_=Inventory.stock,
+    )
+
+def reserved_units():
+    """SQL expression for a product's held units: the reserved column, or the sum over its shards."""
+    return case((Inventory.shard_count > 1, _shard_total(InventoryShard.reserved)), else_=Inventory.reserved)
+
 # Optional: Add an index for prod_id if not already done by index=True
 # Index("ix_inventory_prod_id", Inventory.prod_id, unique=True)
 
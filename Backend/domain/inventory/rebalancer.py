@@ -0,0 +1,49 @@
+# domain/inventory/rebalancer.py
+import asyncio
+import logging
+from typing import Optional
+
+from config import db as db_config
+from config.settings import settings
+from .repository import InventoryRepository
+
+logger = logging.getLogger(__name__)
+
+inventory_repository = InventoryRepository()
+
+def rebalance_sharded_products() -> int:
+    """
+    Rebalances every sharded product, one short committed transaction per product so the
+    shard locks are only held briefly. Returns the number of products that were rewritten.
+    """
+    if db_config.SessionLocal is None:
+        logger.error("Shard rebalancer: database session factory is not available.")
+        return 0
+    rebalanced = 0
+    db = db_config.SessionLocal()
+    try:
+        for product_id in inventory_repository.shard_repository.get_sharded_product_ids(db):
+            if inventory_repository.rebalance_shards(db, product_id):
+                rebalanced += 1
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return rebalanced
+
+async def run_shard_rebalancer(interval_seconds: Optional[int] = None):
+    """Background task: keeps shards of hot products evenly filled and their cached totals in sync."""
+    interval_seconds = interval_seconds or settings.SHARD_REBALANCE_INTERVAL_SECONDS
+    logger.info(f"Shard rebalancer started (interval={interval_seconds}s).")
+    while True:
+        try:
+            # DB work is blocking; keep it off the event loop
+            rebalanced = await asyncio.to_thread(rebalance_sharded_products)
+            if rebalanced:
+                logger.debug(f"Shard rebalancer updated {rebalanced} product(s).")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Shard rebalancer run failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
@@ -1,25 +1,252 @@
 # app/domain/inventory/repository.py
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete, case, func, and_, or_, select
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from . import models, schemas
+from config.db import dialect_insert
+from domain.category.repository import CategoryRepository
+from domain.product.models import Product
+from .events import mark_stock_dirty, queue_low_stock_alerts, low_stock_alert
+
+def even_split(units: int, shard_count: int) -> Dict[int, int]:
+    """{shard_no: stock} spreading `units` as evenly as possible over `shard_count` shards."""
+    base, remainder = divmod(max(units, 0), shard_count)
+    return {shard_no: base + (1 if shard_no < remainder else 0) for shard_no in range(shard_count)}
+
+
+class InventoryShardRepository:
+    """
+    Sharded stock counters for hot SKUs (Inventory.shard_count > 1). All of a sharded product's
+    units live in its InventoryShard rows (stock = unreserved, reserved = held by carts), so
+    concurrent decrements, holds and releases land on different rows and never touch the
+    inventory row. Nothing here commits; callers own the transaction.
+    Lock order is always inventory row first, then shards (in shard_no order); the hot paths
+    lock only the one shard they update.
+    """
+    RANDOM_ATTEMPTS = 2 # Random single-shard tries before falling back to draining several shards
+
+    def get_shard_counts(self, db: Session, product_ids: List[int]) -> Dict[int, int]:
+        """{prod_id: shard_count} for the sharded products among `product_ids` (plain read, no locks)."""
+        rows = db.query(models.Inventory.prod_id, models.Inventory.shard_count)\
+                 .filter(models.Inventory.prod_id.in_(product_ids), models.Inventory.shard_count > 1)\
+                 .all()
+        return {prod_id: shard_count for prod_id, shard_count in rows}
+
+    def get_sharded_product_ids(self, db: Session) -> List[int]:
+        rows = db.query(models.Inventory.prod_id).filter(models.Inventory.shard_count > 1).all()
+        return [prod_id for (prod_id,) in rows]
+
+    def lock_shards(self, db: Session, product_ids: List[int]) -> Dict[int, Dict[int, Tuple[int, int]]]:
+        """Row-locks the shards of the given products. Returns {prod_id: {shard_no: (stock, reserved)}}."""
+        rows = db.query(models.InventoryShard.prod_id, models.InventoryShard.shard_no,
+                        models.InventoryShard.stock, models.InventoryShard.reserved)\
+                 .filter(models.InventoryShard.prod_id.in_(product_ids))\
+                 .order_by(models.InventoryShard.prod_id, models.InventoryShard.shard_no)\
+                 .with_for_update()\
+                 .all()
+        shards: Dict[int, Dict[int, Tuple[int, int]]] = {}
+        for prod_id, shard_no, stock, reserved in rows:
+            shards.setdefault(prod_id, {})[shard_no] = (stock, reserved)
+        return shards
+
+    def take(self, db: Session, product_id: int, quantity: int) -> bool:
+        """Removes `quantity` unreserved units from a sharded product. False if its shards don't hold enough."""
+        return self._move(db, product_id, quantity, models.InventoryShard.stock)
+
+    def reserve(self, db: Session, product_id: int, delta: int) -> bool:
+        """
+        Moves `delta` units of a sharded product from unreserved to held (or back, if negative)
+        within its shards. False if the shards don't have that many units to move.
+        """
+        if delta > 0:
+            return self._move(db, product_id, delta, models.InventoryShard.stock, models.InventoryShard.reserved)
+        return self._move(db, product_id, -delta, models.InventoryShard.reserved, models.InventoryShard.stock)
+
+    def _move(self, db: Session, product_id: int, quantity: int, source, target=None) -> bool:
+        """
+        Moves `quantity` units out of one shard column (`source`) into another (`target`, or out
+        of the product if None). Fast path: ONE conditional UPDATE on a random shard that can
+        cover the whole amount, so concurrent writers rarely touch the same row. If no single
+        shard can (or we keep losing races), drains several shards under lock.
+        """
+        values = {source.key: source - quantity}
+        if target is not None:
+            values[target.key] = target + quantity
+        for _ in range(self.RANDOM_ATTEMPTS):
+            candidate = select(models.InventoryShard.id)\
+                .where(models.InventoryShard.prod_id == product_id, source >= quantity)\
+                .order_by(func.random())\
+                .limit(1)\
+                .scalar_subquery()
+            stmt = (
+                update(models.InventoryShard)
+                .where(models.InventoryShard.id == candidate, source >= quantity)
+                .values(values)
+                .returning(models.InventoryShard.id)
+                .execution_options(synchronize_session=False)
+            )
+            if db.execute(stmt).scalar_one_or_none() is not None:
+                return True
+        return self._drain(db, product_id, quantity, source, target)
+
+    def _drain(self, db: Session, product_id: int, quantity: int, source, target) -> bool:
+        """Slow path of _move(): locks all shards of the product and moves from the fullest first."""
+        position = 0 if source.key == "stock" else 1
+        shards = self.lock_shards(db, [product_id]).get(product_id, {})
+        if sum(levels[position] for levels in shards.values()) < quantity:
+            return False
+        remaining = quantity
+        moved: Dict[int, int] = {}
+        for shard_no, levels in sorted(shards.items(), key=lambda item: -item[1][position]):
+            moved[shard_no] = min(levels[position], remaining)
+            remaining -= moved[shard_no]
+            if not remaining:
+                break
+        amount = case(moved, value=models.InventoryShard.shard_no)
+        values = {source.key: source - amount}
+        if target is not None:
+            values[target.key] = target + amount
+        db.execute(
+            update(models.InventoryShard)
+            .where(models.InventoryShard.prod_id == product_id, models.InventoryShard.shard_no.in_(list(moved)))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+        return True
+
+    def add(self, db: Session, quantities: Dict[int, int], shard_counts: Dict[int, int]) -> None:
+        """Returns units to sharded products, each to one random shard, in ONE UPDATE."""
+        if not quantities:
+            return
+        targets = [
+            and_(models.InventoryShard.prod_id == prod_id,
+                 models.InventoryShard.shard_no == random.randrange(shard_counts[prod_id]))
+            for prod_id in quantities
+        ]
+        db.execute(
+            update(models.InventoryShard)
+            .where(or_(*targets))
+            .values(stock=models.InventoryShard.stock + case(quantities, value=models.InventoryShard.prod_id))
+            .execution_options(synchronize_session=False)
+        )
+
+    def write_levels(self, db: Session, product_id: int, levels: Dict[int, int]) -> None:
+        """Sets the unreserved stock of existing shards ({shard_no: stock}) in one UPDATE."""
+        if not levels:
+            return
+        db.execute(
+            update(models.InventoryShard)
+            .where(models.InventoryShard.prod_id == product_id, models.InventoryShard.shard_no.in_(list(levels)))
+            .values(stock=case(levels, value=models.InventoryShard.shard_no))
+            .execution_options(synchronize_session=False)
+        )
+
+    def reshard(self, db: Session, product_id: int, units: int, shard_count: int, reserved: int = 0) -> None:
+        """
+        Replaces a product's shards with `shard_count` fresh shards holding `units` unreserved and
+        `reserved` held units in total (shard_count 0 removes them).
+        """
+        db.execute(
+            delete(models.InventoryShard)
+            .where(models.InventoryShard.prod_id == product_id)
+            .execution_options(synchronize_session=False)
+        )
+        if shard_count > 1:
+            held = even_split(reserved, shard_count)
+            db.execute(
+                dialect_insert(db, models.InventoryShard),
+                [
+                    {"prod_id": product_id, "shard_no": shard_no, "stock": stock, "reserved": held[shard_no]}
+                    for shard_no, stock in even_split(units, shard_count).items()
+                ],
+            )
+
 
 class InventoryRepository:
+    def __init__(
+        self,
+        category_repository: CategoryRepository = CategoryRepository(),
+        shard_repository: InventoryShardRepository = InventoryShardRepository(),
+    ):
+        self.category_repository = category_repository
+        self.shard_repository = shard_repository
+
+    def _record_stock_change(
+        self, db: Session, product_id: int, old_stock: Optional[int], new_stock: int,
+        reorder_threshold: Optional[int] = None, previous_threshold: Optional[int] = None
+    ) -> None:
+        """Single-SKU form of _record_stock_changes."""
+        thresholds = {product_id: reorder_threshold} if reorder_threshold is not None else None
+        previous = {product_id: previous_threshold} if previous_threshold is not None else None
+        self._record_stock_changes(db, {product_id: (old_stock, new_stock)}, thresholds, previous)
+
+    def _record_stock_changes(
+        self, db: Session, changes: Dict[int, Tuple[Optional[int], int]],
+        thresholds: Optional[Dict[int, int]] = None,
+        previous_thresholds: Optional[Dict[int, int]] = None,
+    ) -> None:
+        """
+        Single hook for every stock write ({prod_id: (old_stock, new_stock)}), called before
+        the write is committed. Keeps the category in-stock counters in sync when stock crosses zero
+        and queues a live stock update that is pushed once the transaction commits.
+        Products listed in `thresholds` ({prod_id: reorder_threshold}, usually taken from the
+        write's RETURNING clause) are checked for threshold crossings, which queue admin alerts.
+        An old_stock of None means the row is new: it counts as out of stock and not low, so a
+        new SKU only alerts if it starts at or below its threshold (and never as "recovered").
+        """
+        mark_stock_dirty(db, changes.keys())
+        in_stock_deltas: Dict[int, int] = {}
+        alerts: Dict[int, dict] = {}
+        for product_id, (old_stock, new_stock) in changes.items():
+            was_in_stock = (old_stock or 0) > 0
+            is_in_stock = (new_stock or 0) > 0
+            if was_in_stock != is_in_stock:
+                in_stock_deltas[product_id] = 1 if is_in_stock else -1
+            if thresholds and product_id in thresholds:
+                threshold = thresholds[product_id]
+                old_threshold = (previous_thresholds or {}).get(product_id, threshold)
+                was_low = old_stock is not None and old_stock <= old_threshold
+                if was_low != ((new_stock or 0) <= threshold):
+                    alerts[product_id] = low_stock_alert(product_id, new_stock or 0, threshold)
+        self.category_repository.adjust_in_stock_for_products(db, in_stock_deltas)
+        queue_low_stock_alerts(db, alerts)
 
     def get_inventory_by_prod_id(self, db: Session, product_id: int) -> Optional[models.Inventory]:
         """Fetches inventory record by product ID."""
         return db.query(models.Inventory).filter(models.Inventory.prod_id == product_id).first()
 
-    def get_all_inventory(self, db: Session, skip: int = 0, limit: int = 100) -> List[models.Inventory]:
-         """Fetches all inventory records with pagination."""
-         return db.query(models.Inventory).offset(skip).limit(limit).all()
+    def get_all_inventory(self, db: Session, skip: int = 0, limit: int = 100) -> List[Tuple[models.Inventory, int, int]]:
+         """Fetches (inventory, stock on hand, reserved) rows with pagination (sharded counts are summed)."""
+         return db.query(models.Inventory, models.stock_on_hand(), models.reserved_units()).offset(skip).limit(limit).all()
+
+    def get_stock_on_hand(self, db: Session, product_ids: List[int]) -> Dict[int, int]:
+        """{prod_id: stock on hand} in one read, whether or not the products are sharded."""
+        rows = db.query(models.Inventory.prod_id, models.stock_on_hand())\
+                 .filter(models.Inventory.prod_id.in_(product_ids))\
+                 .all()
+        return {prod_id: stock for prod_id, stock in rows}
+
+    def get_reserved_units(self, db: Session, product_ids: List[int]) -> Dict[int, int]:
+        """{prod_id: units held by carts} in one read (lock the stock first if the answer must hold)."""
+        rows = db.query(models.Inventory.prod_id, models.reserved_units())\
+                 .filter(models.Inventory.prod_id.in_(product_ids))\
+                 .all()
+        return {prod_id: reserved for prod_id, reserved in rows}
 
     def create_inventory(self, db: Session, inventory: schemas.InventoryCreate) -> models.Inventory:
         """Creates a new inventory record."""
+        reorder_threshold = inventory.reorder_threshold
+        if reorder_threshold is None:
+            reorder_threshold = models.DEFAULT_REORDER_THRESHOLD
         db_inventory = models.Inventory(
             prod_id=inventory.prod_id,
-            stock=inventory.stock
+            stock=inventory.stock,
+            reorder_threshold=reorder_threshold
         )
         db.add(db_inventory)
+        self._record_stock_change(db, inventory.prod_id, None, inventory.stock, reorder_threshold)
         db.commit()
         db.refresh(db_inventory)
         return db_inventory
@@ -27,16 +254,325 @@ class InventoryRepository:
     def update_inventory(
         self, db: Session, product_id: int, inventory_update: schemas.InventoryUpdate
     ) -> Optional[models.Inventory]:
-        """Updates stock for an inventory record identified by product ID."""
+        """
+        Updates stock (and optionally the reorder threshold) for an inventory record identified by product ID.
+        The new stock must cover the units held by carts (callers check under lock_stock_levels).
+        """
         db_inventory = self.get_inventory_by_prod_id(db, product_id)
         if db_inventory:
-            db_inventory.stock = inventory_update.stock
+            old_stock = db_inventory.stock
+            new_stock = inventory_update.stock
+            if db_inventory.shard_count > 1:
+                # Sharded: spread the new level over fresh shards, keeping the units held by carts
+                shards = self.shard_repository.lock_shards(db, [product_id]).get(product_id, {})
+                old_stock = sum(stock + reserved for stock, reserved in shards.values())
+                db_inventory.reserved = sum(reserved for _, reserved in shards.values())
+                self.shard_repository.reshard(
+                    db, product_id, inventory_update.stock - db_inventory.reserved,
+                    db_inventory.shard_count, db_inventory.reserved
+                )
+                new_stock = self.get_stock_on_hand(db, [product_id])[product_id]
+            previous_threshold = db_inventory.reorder_threshold
+            if inventory_update.reorder_threshold is not None:
+                db_inventory.reorder_threshold = inventory_update.reorder_threshold
+            self._record_stock_change(
+                db, product_id, old_stock, new_stock,
+                db_inventory.reorder_threshold, previous_threshold
+            )
+            db_inventory.stock = new_stock
             db.add(db_inventory)
             db.commit()
             db.refresh(db_inventory)
             return db_inventory
         return None
 
+    # --- Atomic stock primitives ---
+    # Each change is a single conditional UPDATE ... RETURNING: the stock check happens
+    # inside the statement, so no row lock is held across Python code and concurrent
+    # buyers cannot oversell. Pass commit=False to compose them into a larger transaction.
+    # Sharded products are decremented on one of their shards instead of the inventory row;
+    # their category counters and alerts follow when the rebalancer syncs the cached total.
+
+    def decrement_stock(
+        self, db: Session, product_id: int, quantity: int, commit: bool = True
+    ) -> Optional[int]:
+        """
+        UPDATE inventory SET stock = stock - :n WHERE prod_id = :id AND stock - reserved >= :n RETURNING stock.
+        Units held by other carts' reservations are never sold.
+        Returns the new stock, or None if the record is missing or available stock is insufficient.
+        """
+        if self.shard_repository.get_shard_counts(db, [product_id]):
+            new_stock = None
+            if self.shard_repository.take(db, product_id, quantity):
+                mark_stock_dirty(db, [product_id])
+                new_stock = self.get_stock_on_hand(db, [product_id]).get(product_id)
+            if commit:
+                db.commit()
+            return new_stock
+
+        stmt = (
+            update(models.Inventory)
+            .where(
+                models.Inventory.prod_id == product_id,
+                models.Inventory.shard_count <= 1, # Re-checked under the row lock if sharding was just enabled
+                models.Inventory.stock - models.Inventory.reserved >= quantity,
+            )
+            .values(stock=models.Inventory.stock - quantity)
+            .returning(models.Inventory.stock, models.Inventory.reorder_threshold)
+            .execution_options(synchronize_session=False)
+        )
+        row = db.execute(stmt).one_or_none()
+        new_stock = None
+        if row is not None:
+            new_stock, reorder_threshold = row
+            self._record_stock_change(db, product_id, new_stock + quantity, new_stock, reorder_threshold)
+        if commit:
+            db.commit()
+        return new_stock
+
+    def increment_stock(
+        self, db: Session, product_id: int, quantity: int, commit: bool = True
+    ) -> Optional[int]:
+        """Atomically adds `quantity` to stock. Returns the new stock, or None if no record exists."""
+        shard_counts = self.shard_repository.get_shard_counts(db, [product_id])
+        if shard_counts:
+            self.shard_repository.add(db, {product_id: quantity}, shard_counts)
+            mark_stock_dirty(db, [product_id])
+            new_stock = self.get_stock_on_hand(db, [product_id]).get(product_id)
+            if commit:
+                db.commit()
+            return new_stock
+
+        stmt = (
+            update(models.Inventory)
+            .where(models.Inventory.prod_id == product_id, models.Inventory.shard_count <= 1)
+            .values(stock=models.Inventory.stock + quantity)
+            .returning(models.Inventory.stock, models.Inventory.reorder_threshold)
+            .execution_options(synchronize_session=False)
+        )
+        row = db.execute(stmt).one_or_none()
+        new_stock = None
+        if row is not None:
+            new_stock, reorder_threshold = row
+            self._record_stock_change(db, product_id, new_stock - quantity, new_stock, reorder_threshold)
+        if commit:
+            db.commit()
+        return new_stock
+
+    def decrement_stock_bulk(
+        self, db: Session, quantities: Dict[int, int], commit: bool = True
+    ) -> Optional[Dict[int, int]]:
+        """
+        Decrements several SKUs in ONE conditional UPDATE (per-row amounts via CASE).
+        All-or-nothing: returns {prod_id: new_stock} when every SKU had enough stock,
+        otherwise None. On failure the statement is rolled back when commit=True;
+        with commit=False the caller owns the transaction and must roll it back.
+        """
+        if not quantities:
+            return {}
+        sharded = self.shard_repository.get_shard_counts(db, list(quantities))
+        plain = {prod_id: qty for prod_id, qty in quantities.items() if prod_id not in sharded}
+        rows = []
+        if plain:
+            amount = case(plain, value=models.Inventory.prod_id)
+            stmt = (
+                update(models.Inventory)
+                .where(
+                    models.Inventory.prod_id.in_(list(plain)),
+                    models.Inventory.shard_count <= 1,
+                    models.Inventory.stock - models.Inventory.reserved >= amount,
+                )
+                .values(stock=models.Inventory.stock - amount)
+                .returning(models.Inventory.prod_id, models.Inventory.stock, models.Inventory.reorder_threshold)
+                .execution_options(synchronize_session=False)
+            )
+            rows = db.execute(stmt).all()
+        new_stocks = {prod_id: stock for prod_id, stock, _ in rows}
+        succeeded = len(new_stocks) == len(plain) and all(
+            self.shard_repository.take(db, prod_id, quantities[prod_id]) for prod_id in sorted(sharded)
+        )
+        if not succeeded:
+            if commit:
+                db.rollback()
+            return None
+        if sharded:
+            mark_stock_dirty(db, sharded.keys())
+            new_stocks.update(self.get_stock_on_hand(db, list(sharded)))
+        self._record_stock_changes(
+            db,
+            {prod_id: (stock + quantities[prod_id], stock) for prod_id, stock, _ in rows},
+            {prod_id: threshold for prod_id, _, threshold in rows},
+        )
+        if commit:
+            db.commit()
+        return new_stocks
+
+    def lock_stock_levels(self, db: Session, product_ids: List[int], include_sharded: bool = True) -> Dict[int, int]:
+        """
+        Reads and row-locks the stock on hand of existing inventory records, in prod_id order
+        (a deterministic lock order avoids deadlocks between concurrent bulk writers).
+        Sharded products also have their shards locked and summed; with include_sharded=False
+        they are left out entirely (for writers that only touch them through single-shard
+        conditional UPDATEs, which lock just the shard they change).
+        """
+        query = db.query(models.Inventory.prod_id, models.Inventory.stock, models.Inventory.shard_count)\
+                  .filter(models.Inventory.prod_id.in_(product_ids))
+        if not include_sharded:
+            query = query.filter(models.Inventory.shard_count <= 1)
+        rows = query.order_by(models.Inventory.prod_id).with_for_update().all()
+        levels = {prod_id: stock for prod_id, stock, _ in rows}
+        sharded = [prod_id for prod_id, _, shard_count in rows if shard_count > 1]
+        if sharded:
+            for prod_id, shards in self.shard_repository.lock_shards(db, sharded).items():
+                levels[prod_id] = sum(stock + reserved for stock, reserved in shards.values())
+        return levels
+
+    def upsert_stock_levels(self, db: Session, new_stocks: Dict[int, int], old_stocks: Dict[int, int]) -> Dict[int, int]:
+        """
+        Writes absolute stock levels for many products in ONE statement:
+        INSERT ... VALUES (...) ON CONFLICT (prod_id) DO UPDATE SET stock = excluded.stock RETURNING.
+        `old_stocks` ({prod_id: stock} for rows that already existed) feeds the stock-change hook;
+        products missing from it are treated as newly created. Each new level must cover the
+        units held by carts (callers check under lock_stock_levels).
+        Does not commit. Returns {prod_id: stock on hand} after the write.
+        """
+        if not new_stocks:
+            return {}
+        stmt = dialect_insert(db, models.Inventory).values(
+            [{"prod_id": prod_id, "stock": stock} for prod_id, stock in new_stocks.items()]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["prod_id"], set_={"stock": stmt.excluded.stock}
+        ).returning(
+            models.Inventory.prod_id, models.Inventory.stock, models.Inventory.reorder_threshold,
+            models.Inventory.shard_count,
+        )
+        rows = db.execute(stmt).all()
+        written = {row.prod_id: row.stock for row in rows}
+        sharded = [row for row in rows if row.shard_count > 1]
+        if sharded:
+            locked = self.shard_repository.lock_shards(db, [row.prod_id for row in sharded])
+            for row in sharded:
+                reserved = sum(held for _, held in locked.get(row.prod_id, {}).values())
+                self.shard_repository.reshard(db, row.prod_id, row.stock - reserved, row.shard_count, reserved)
+                db.execute(
+                    update(models.Inventory)
+                    .where(models.Inventory.prod_id == row.prod_id)
+                    .values(reserved=reserved)
+                    .execution_options(synchronize_session=False)
+                )
+            written.update(self.get_stock_on_hand(db, [row.prod_id for row in sharded]))
+        self._record_stock_changes(
+            db,
+            {prod_id: (old_stocks.get(prod_id), stock) for prod_id, stock in written.items()},
+            {row.prod_id: row.reorder_threshold for row in rows},
+        )
+        return written
+
+    def get_stock_levels(self, db: Session, product_ids: List[int]) -> Dict[int, int]:
+        """Returns {prod_id: available stock} for the given products (missing records are omitted)."""
+        rows = db.query(models.Inventory.prod_id, models.stock_on_hand() - models.reserved_units())\
+                 .filter(models.Inventory.prod_id.in_(product_ids))\
+                 .all()
+        return {prod_id: stock for prod_id, stock in rows}
+
+    def get_low_stock(self, db: Session, skip: int = 0, limit: int = 100) -> List[tuple]:
+        """
+        Products at or below their reorder threshold, lowest stock first:
+        (prod_id, name, category, stock, reserved, reorder_threshold) rows.
+        The filter repeats the partial index predicate verbatim so the planner serves it from ix_inventory_low_stock.
+        """
+        return db.query(
+                    models.Inventory.prod_id, Product.name, Product.category,
+                    models.Inventory.stock, models.Inventory.reserved, models.Inventory.reorder_threshold,
+                 )\
+                 .join(Product, Product.id == models.Inventory.prod_id)\
+                 .filter(models.Inventory.stock <= models.Inventory.reorder_threshold)\
+                 .order_by(models.Inventory.stock, models.Inventory.prod_id)\
+                 .offset(skip)\
+                 .limit(limit)\
+                 .all()
+
+    def get_low_stock_categories(self, db: Session) -> List[str]:
+        """Distinct categories that currently have at least one product at or below its threshold."""
+        rows = db.query(Product.category)\
+                 .join(models.Inventory, models.Inventory.prod_id == Product.id)\
+                 .filter(models.Inventory.stock <= models.Inventory.reorder_threshold, Product.category.isnot(None))\
+                 .distinct()\
+                 .all()
+        return sorted(category for (category,) in rows)
+
+    # --- Sharded counters (opt-in per hot SKU) ---
+
+    def _lock_inventory(self, db: Session, product_id: int) -> Optional[models.Inventory]:
+        return db.query(models.Inventory)\
+                 .filter(models.Inventory.prod_id == product_id)\
+                 .with_for_update()\
+                 .populate_existing()\
+                 .first()
+
+    def configure_shards(self, db: Session, product_id: int, shard_count: int) -> Optional[models.Inventory]:
+        """
+        Switches a product to `shard_count` stock shards (0 or 1 turns sharding off), moving its
+        unreserved and held units between the inventory row and the shards. Commits.
+        Returns the inventory record, or None if the product has no inventory record.
+        """
+        db_inventory = self._lock_inventory(db, product_id)
+        if db_inventory is None:
+            db.rollback()
+            return None
+        if db_inventory.shard_count > 1:
+            shards = self.shard_repository.lock_shards(db, [product_id]).get(product_id, {})
+            free = sum(stock for stock, _ in shards.values())
+            reserved = sum(held for _, held in shards.values())
+        else:
+            reserved = db_inventory.reserved
+            free = max(db_inventory.stock - reserved, 0)
+        new_stock = free + reserved
+        shard_count = shard_count if shard_count > 1 else 0
+        self.shard_repository.reshard(db, product_id, free, shard_count, reserved)
+        self._record_stock_change(db, product_id, db_inventory.stock, new_stock, db_inventory.reorder_threshold)
+        db_inventory.stock = new_stock
+        db_inventory.reserved = reserved
+        db_inventory.shard_count = shard_count
+        db.commit()
+        db.refresh(db_inventory)
+        return db_inventory
+
+    def rebalance_shards(self, db: Session, product_id: int, min_fill_ratio: float = 0.5) -> bool:
+        """
+        Evens out a sharded product's shards once any of them has drained below `min_fill_ratio`
+        of its fair share (so random picks keep finding stock), and syncs the cached
+        Inventory.stock and Inventory.reserved totals, which also catches up category counters,
+        low-stock alerts and the low-stock index. Commits. Returns True if anything was written.
+        """
+        db_inventory = self._lock_inventory(db, product_id)
+        if db_inventory is None or db_inventory.shard_count <= 1:
+            db.rollback()
+            return False
+        shards = self.shard_repository.lock_shards(db, [product_id]).get(product_id, {})
+        free = sum(stock for stock, _ in shards.values())
+        reserved = sum(held for _, held in shards.values())
+        fair_share = free // db_inventory.shard_count
+        changed = False
+        if len(shards) != db_inventory.shard_count:
+            self.shard_repository.reshard(db, product_id, free, db_inventory.shard_count, reserved)
+            changed = True
+        elif fair_share and min(stock for stock, _ in shards.values()) < fair_share * min_fill_ratio:
+            self.shard_repository.write_levels(db, product_id, even_split(free, db_inventory.shard_count))
+            changed = True
+
+        new_stock = free + reserved
+        if db_inventory.stock != new_stock:
+            self._record_stock_change(db, product_id, db_inventory.stock, new_stock, db_inventory.reorder_threshold)
+            db_inventory.stock = new_stock
+            changed = True
+        if db_inventory.reserved != reserved:
+            db_inventory.reserved = reserved
+            changed = True
+        db.commit()
+        return changed
+
     def find_or_create_inventory(self, db: Session, product_id: int, initial_stock: int = 0) -> models.Inventory:
         """Finds inventory by product ID, or creates it if it doesn't exist."""
         db_inventory = self.get_inventory_by_prod_id(db, product_id)
@@ -49,7 +585,239 @@ class InventoryRepository:
          """Deletes inventory record by product ID."""
          db_inventory = self.get_inventory_by_prod_id(db, product_id)
          if db_inventory:
+             self._record_stock_change(db, product_id, db_inventory.stock, 0)
+             if db_inventory.shard_count > 1:
+                 self.shard_repository.reshard(db, product_id, 0, 0)
              db.delete(db_inventory)
              db.commit()
              return db_inventory
-         return None
\ No newline at end of file
+         return None
+
+
+class ReservationRepository:
+    """
+    Stock holds for cart lines. Inventory.reserved mirrors the sum of all hold quantities,
+    so availability is a single primary-key read: stock - reserved.
+    Write helpers take commit=False so the cart write and the hold commit together.
+    For sharded products, held units move between a shard's stock and reserved columns instead,
+    one shard per hold or release, and the inventory row is not written.
+    """
+
+    def __init__(self, shard_repository: InventoryShardRepository = InventoryShardRepository()):
+        self.shard_repository = shard_repository
+
+    def get_available_stock(self, db: Session, product_id: int, user_id: Optional[int] = None) -> Optional[int]:
+        """
+        Available units for a product in ONE indexed query. When `user_id` is given, that
+        user's own hold is added back (it is already theirs). Returns None if no inventory record.
+        """
+        query = db.query(models.stock_on_hand() - models.reserved_units())
+        if user_id is not None:
+            query = db.query(
+                models.stock_on_hand() - models.reserved_units()
+                + func.coalesce(models.StockReservation.quantity, 0)
+            ).outerjoin(
+                models.StockReservation,
+                and_(
+                    models.StockReservation.prod_id == models.Inventory.prod_id,
+                    models.StockReservation.user_id == user_id,
+                ),
+            )
+        row = query.filter(models.Inventory.prod_id == product_id).first()
+        return None if row is None else max(row[0], 0)
+
+    def _lock_hold(self, db: Session, user_id: int, product_id: int) -> models.StockReservation:
+        """
+        Ensures the (user, product) hold row exists, then locks it. Concurrent requests for
+        the same cart line serialize on this row, so the reserved counter never drifts.
+        """
+        stmt = dialect_insert(db, models.StockReservation).values(
+            user_id=user_id, prod_id=product_id, quantity=0, expires_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["user_id", "prod_id"])
+        db.execute(stmt)
+        return db.query(models.StockReservation)\
+                 .filter(models.StockReservation.user_id == user_id,
+                         models.StockReservation.prod_id == product_id)\
+                 .with_for_update()\
+                 .populate_existing()\
+                 .one()
+
+    def hold(
+        self, db: Session, user_id: int, product_id: int, quantity: int,
+        ttl_seconds: int, commit: bool = True
+    ) -> bool:
+        """
+        Sets the user's hold on a product to `quantity` units and refreshes its expiry.
+        The extra units are taken with a conditional UPDATE (stock - reserved >= delta),
+        so holds can never exceed stock. Returns False if not enough stock is available;
+        with commit=False the caller must then roll back its transaction.
+        """
+        reservation = self._lock_hold(db, user_id, product_id)
+        delta = quantity - reservation.quantity
+        if delta != 0:
+            if not self._adjust_reserved(db, product_id, delta):
+                if commit:
+                    db.rollback()
+                return False
+            mark_stock_dirty(db, [product_id])
+        reservation.quantity = quantity
+        reservation.expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        if commit:
+            db.commit()
+        return True
+
+    def _adjust_reserved(self, db: Session, product_id: int, delta: int) -> bool:
+        """Moves `delta` units into (or out of) one product's reserved count. False if stock is short."""
+        stmt = update(models.Inventory).where(
+            models.Inventory.prod_id == product_id,
+            models.Inventory.shard_count <= 1, # Sharded products never write the inventory row
+        )
+        if delta > 0:
+            stmt = stmt.where(models.Inventory.stock - models.Inventory.reserved >= delta)
+        stmt = stmt.values(reserved=models.Inventory.reserved + delta)\
+                   .returning(models.Inventory.prod_id)\
+                   .execution_options(synchronize_session=False)
+        if db.execute(stmt).scalar_one_or_none() is not None:
+            return True
+        if self.shard_repository.get_shard_counts(db, [product_id]):
+            # Sharded: the units move within one shard instead
+            return self.shard_repository.reserve(db, product_id, delta)
+        return False
+
+    def hold_many(
+        self, db: Session, user_id: int, quantities: Dict[int, int], ttl_seconds: int
+    ) -> bool:
+        """
+        Batch form of hold(): sets the user's holds to {prod_id: quantity} (0 drops the hold).
+        Hold rows are created and locked with one statement each, and all ordinary products'
+        reserved counters move in ONE conditional UPDATE. Never commits; returns False if any
+        product lacks stock, in which case the caller must roll back.
+        """
+        if not quantities:
+            return True
+        db.execute(
+            dialect_insert(db, models.StockReservation).values([
+                {"user_id": user_id, "prod_id": prod_id, "quantity": 0, "expires_at": datetime.utcnow()}
+                for prod_id in quantities
+            ]).on_conflict_do_nothing(index_elements=["user_id", "prod_id"])
+        )
+        reservations = db.query(models.StockReservation)\
+                         .filter(models.StockReservation.user_id == user_id,
+                                 models.StockReservation.prod_id.in_(list(quantities)))\
+                         .order_by(models.StockReservation.prod_id)\
+                         .with_for_update()\
+                         .populate_existing()\
+                         .all()
+        deltas = {
+            r.prod_id: quantities[r.prod_id] - r.quantity
+            for r in reservations if quantities[r.prod_id] != r.quantity
+        }
+        sharded = self.shard_repository.get_shard_counts(db, list(deltas)) if deltas else {}
+        plain = {prod_id: delta for prod_id, delta in deltas.items() if prod_id not in sharded}
+        if plain:
+            amount = case(plain, value=models.Inventory.prod_id)
+            updated = db.execute(
+                update(models.Inventory)
+                .where(
+                    models.Inventory.prod_id.in_(list(plain)),
+                    models.Inventory.shard_count <= 1,
+                    or_(amount <= 0, models.Inventory.stock - models.Inventory.reserved >= amount),
+                )
+                .values(reserved=models.Inventory.reserved + amount)
+                .returning(models.Inventory.prod_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if len(updated) != len(plain):
+                return False
+        for prod_id in sorted(sharded):
+            if not self._adjust_reserved(db, prod_id, deltas[prod_id]):
+                return False
+        if deltas:
+            mark_stock_dirty(db, deltas.keys())
+
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        for reservation in reservations:
+            if quantities[reservation.prod_id] > 0:
+                reservation.quantity = quantities[reservation.prod_id]
+                reservation.expires_at = expires_at
+        dropped = [r.id for r in reservations if quantities[r.prod_id] <= 0]
+        if dropped:
+            db.execute(
+                delete(models.StockReservation)
+                .where(models.StockReservation.id.in_(dropped))
+                .execution_options(synchronize_session=False)
+            )
+        return True
+
+    def release(self, db: Session, user_id: int, product_id: int, commit: bool = True) -> int:
+        """Drops a user's hold on one product. Returns the number of units released."""
+        return self._release_where(
+            db,
+            (models.StockReservation.user_id == user_id, models.StockReservation.prod_id == product_id),
+            commit=commit,
+        )
+
+    def release_all_for_user(self, db: Session, user_id: int, commit: bool = True) -> int:
+        """Drops every hold of a user (cart cleared or checked out). Returns units released."""
+        return self._release_where(db, (models.StockReservation.user_id == user_id,), commit=commit)
+
+    def release_expired(self, db: Session, batch_size: int, now: Optional[datetime] = None) -> int:
+        """
+        Releases up to `batch_size` expired holds and commits. Rows locked by an in-flight
+        cart write are skipped (SKIP LOCKED on Postgres). Holds are locked in prod_id order, as
+        everywhere else (see _release_where). Returns the number of holds removed.
+        """
+        now = now or datetime.utcnow()
+        rows = db.query(models.StockReservation.id, models.StockReservation.prod_id, models.StockReservation.quantity)\
+                 .filter(models.StockReservation.expires_at <= now)\
+                 .order_by(models.StockReservation.prod_id, models.StockReservation.id)\
+                 .limit(batch_size)\
+                 .with_for_update(skip_locked=True)\
+                 .all()
+        if not rows:
+            db.rollback()
+            return 0
+        self._apply_release(db, [row.id for row in rows], rows)
+        db.commit()
+        return len(rows)
+
+    def _release_where(self, db: Session, criteria, commit: bool) -> int:
+        # Lock order everywhere: holds (by prod_id), then their inventory rows. Checkout releases
+        # the user's holds before locking its inventory rows, so it can't deadlock with the sweeper.
+        rows = db.query(models.StockReservation.id, models.StockReservation.prod_id, models.StockReservation.quantity)\
+                 .filter(*criteria)\
+                 .order_by(models.StockReservation.prod_id)\
+                 .with_for_update()\
+                 .all()
+        released = self._apply_release(db, [row.id for row in rows], rows)
+        if commit:
+            db.commit()
+        return released
+
+    def _apply_release(self, db: Session, reservation_ids: List[int], rows) -> int:
+        """Deletes the given holds and takes their units off Inventory.reserved in one UPDATE (or off the shards)."""
+        if not reservation_ids:
+            return 0
+        per_product: Dict[int, int] = {}
+        for row in rows:
+            if row.quantity:
+                per_product[row.prod_id] = per_product.get(row.prod_id, 0) + row.quantity
+        db.execute(
+            delete(models.StockReservation)
+            .where(models.StockReservation.id.in_(reservation_ids))
+            .execution_options(synchronize_session=False)
+        )
+        if per_product:
+            mark_stock_dirty(db, per_product.keys())
+            updated = db.execute(
+                update(models.Inventory)
+                .where(models.Inventory.prod_id.in_(list(per_product)), models.Inventory.shard_count <= 1)
+                .values(reserved=models.Inventory.reserved - case(per_product, value=models.Inventory.prod_id))
+                .returning(models.Inventory.prod_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            rest = [prod_id for prod_id in per_product if prod_id not in set(updated)]
+            if rest: # Sharded products: their units go back within one shard each
+                for prod_id in sorted(self.shard_repository.get_shard_counts(db, rest)):
+                    self.shard_repository.reserve(db, prod_id, -per_product[prod_id])
+        return sum(per_product.values())
@@ -1,5 +1,6 @@
 # app/domain/inventory/schemas.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Literal
 
 # Base Schema
 class InventoryBase(BaseModel):
@@ -8,16 +9,59 @@ class InventoryBase(BaseModel):
 
 # Schema for Creating Inventory (requires prod_id and stock)
 class InventoryCreate(InventoryBase):
-    pass
+    reorder_threshold: Optional[int] = Field(None, ge=0, example=10, description="Low-stock threshold (defaults to 10)")
 
 # Schema for Updating Inventory (only requires stock)
 class InventoryUpdate(BaseModel):
     stock: int = Field(..., ge=0, example=75, description="New stock quantity (must be non-negative)")
+    reorder_threshold: Optional[int] = Field(None, ge=0, example=10, description="New low-stock threshold (unchanged if omitted)")
 
 # Schema for Reading/Outputting Inventory (returns prod_id and stock)
 class InventoryOut(BaseModel):
     prod_id: int
     stock: int
+    reserved: Optional[int] = Field(None, description="Units currently held by cart reservations")
+    reorder_threshold: Optional[int] = Field(None, description="Stock at or below this level is reported as low")
 
     class Config:
-        from_attributes = True # Pydantic V2 (orm_mode in V1)
\ No newline at end of file
+        from_attributes = True # Pydantic V2 (orm_mode in V1)
+
+# Schema for atomic stock adjustments (decrement / increment by a positive amount)
+class InventoryAdjust(BaseModel):
+    quantity: int = Field(..., gt=0, example=2, description="Units to remove or add (must be > 0)")
+
+# Schema for one line of a bulk stock adjustment
+class InventoryAdjustItem(InventoryAdjust):
+    prod_id: int = Field(..., example=1, description="The ID of the related product")
+
+# Schema for one entry of a bulk stock sync: either an absolute `stock` or a relative `delta`
+class InventoryBulkItem(BaseModel):
+    prod_id: int = Field(..., example=1, description="The ID of the related product")
+    stock: Optional[int] = Field(None, ge=0, example=75, description="New absolute stock quantity")
+    delta: Optional[int] = Field(None, example=-3, description="Relative change applied to the current stock")
+
+    @model_validator(mode="after")
+    def check_stock_or_delta(self):
+        if (self.stock is None) == (self.delta is None):
+            raise ValueError("Provide exactly one of 'stock' or 'delta'.")
+        return self
+
+# Per-SKU outcome of a bulk stock sync
+class InventoryBulkResult(BaseModel):
+    prod_id: int
+    status: Literal["updated", "created", "not_found", "rejected"]
+    stock: Optional[int] = None
+    detail: Optional[str] = None
+
+# Opt-in sharded counters for a hot product (0 or 1 disables sharding)
+class InventoryShardConfig(BaseModel):
+    shard_count: int = Field(..., ge=0, le=64, example=8, description="Number of stock shards (0 or 1 turns sharding off)")
+
+# One row of the low-stock report
+class LowStockItem(BaseModel):
+    prod_id: int
+    name: str
+    category: Optional[str] = None
+    stock: int
+    reserved: int
+    reorder_threshold: int
@@ -1,7 +1,7 @@
 # app/domain/inventory/service.py
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import List, Optional, Dict
 from . import schemas, models
 from .repository import InventoryRepository
 from domain.product.repository import ProductRepository # Correct import path
@@ -25,15 +25,31 @@ class InventoryService:
             )
         return product
 
-    def get_stock_by_prod_id(self, db: Session, product_id: int) -> models.Inventory:
-        """Gets inventory for a product, creating it with 0 stock if it doesn't exist."""
-        self._check_product_exists(db, product_id)
-        inventory = self.repository.find_or_create_inventory(db, product_id, initial_stock=0)
-        return inventory
+    def get_stock_by_prod_id(self, db: Session, product_id: int) -> schemas.InventoryOut:
+        """
+        Gets inventory for a product in one joined read. Products without an inventory
+        record report 0 stock; nothing is written on this read path.
+        """
+        row = self.product_repository.get_product_with_stock(db, product_id)
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product with id {product_id} not found."
+            )
+        _, stock, reserved, reorder_threshold = row
+        return schemas.InventoryOut(
+            prod_id=product_id, stock=stock, reserved=reserved, reorder_threshold=reorder_threshold
+        )
 
-    def get_all(self, db: Session, skip: int = 0, limit: int = 100) -> List[models.Inventory]:
-         """Gets all inventory records."""
-         return self.repository.get_all_inventory(db, skip=skip, limit=limit)
+    def get_all(self, db: Session, skip: int = 0, limit: int = 100) -> List[schemas.InventoryOut]:
+         """Gets all inventory records (stock of sharded products is reported as their total)."""
+         return [
+             schemas.InventoryOut(
+                 prod_id=inventory.prod_id, stock=stock,
+                 reserved=reserved, reorder_threshold=inventory.reorder_threshold,
+             )
+             for inventory, stock, reserved in self.repository.get_all_inventory(db, skip=skip, limit=limit)
+         ]
 
     def add_new_inventory(self, db: Session, inventory: schemas.InventoryCreate) -> models.Inventory:
         """Adds a new inventory record, ensuring product exists and inventory doesn't."""
@@ -64,6 +80,16 @@ class InventoryService:
         # 1. Ensure the product itself exists. This raises 404 if not.
         self._check_product_exists(db, product_id)
 
+        # Units held by carts can't be taken away here (locked so no hold lands in between)
+        if self.repository.lock_stock_levels(db, [product_id]):
+            held = self.repository.get_reserved_units(db, [product_id]).get(product_id, 0)
+            if inventory_update.stock < held:
+                db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Cannot set stock to {inventory_update.stock}: {held} unit(s) are held in carts."
+                )
+
         # 2. Try to update using the repository method (which first tries to get the item)
         #    We expect this might return None if the inventory record is missing.
         updated_inventory = self.repository.update_inventory(db, product_id, inventory_update)
@@ -72,7 +98,9 @@ class InventoryService:
             # 3. If update_inventory returned None, the inventory record didn't exist.
             #    Create it now using the provided stock level.
             print(f"Inventory record for prod_id {product_id} not found. Creating with stock {inventory_update.stock}.")
-            create_schema = schemas.InventoryCreate(prod_id=product_id, stock=inventory_update.stock)
+            create_schema = schemas.InventoryCreate(
+                prod_id=product_id, stock=inventory_update.stock, reorder_threshold=inventory_update.reorder_threshold
+            )
             # Use the repository's create method directly
             # This will commit the new record to the DB.
             updated_inventory = self.repository.create_inventory(db, create_schema)
@@ -82,6 +110,153 @@ class InventoryService:
         return updated_inventory
     # --- END MODIFIED METHOD ---
 
+    def get_low_stock(self, db: Session, skip: int = 0, limit: int = 100) -> List[schemas.LowStockItem]:
+        """Products at or below their reorder threshold, served from the partial low-stock index."""
+        rows = self.repository.get_low_stock(db, skip=skip, limit=limit)
+        return [
+            schemas.LowStockItem(
+                prod_id=prod_id, name=name, category=category,
+                stock=stock, reserved=reserved, reorder_threshold=reorder_threshold,
+            )
+            for prod_id, name, category, stock, reserved, reorder_threshold in rows
+        ]
+
+    def decrement_stock(self, db: Session, product_id: int, quantity: int) -> schemas.InventoryOut:
+        """
+        Atomically removes `quantity` units. Raises 404 if the product has no inventory
+        record and 400 if stock is insufficient; stock is never driven below zero.
+        """
+        new_stock = self.repository.decrement_stock(db, product_id, quantity)
+        if new_stock is None:
+            self._raise_adjust_failure(db, product_id, quantity)
+        return schemas.InventoryOut(prod_id=product_id, stock=new_stock)
+
+    def increment_stock(self, db: Session, product_id: int, quantity: int) -> schemas.InventoryOut:
+        """Atomically adds `quantity` units. Raises 404 if the product has no inventory record."""
+        new_stock = self.repository.increment_stock(db, product_id, quantity)
+        if new_stock is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Inventory for product id {product_id} not found."
+            )
+        return schemas.InventoryOut(prod_id=product_id, stock=new_stock)
+
+    def decrement_stock_bulk(
+        self, db: Session, items: List[schemas.InventoryAdjustItem]
+    ) -> List[schemas.InventoryOut]:
+        """
+        Atomically decrements several SKUs in one statement. Either every SKU is
+        decremented or none is (400 listing the SKUs that could not be satisfied).
+        """
+        quantities: Dict[int, int] = {}
+        for item in items:
+            quantities[item.prod_id] = quantities.get(item.prod_id, 0) + item.quantity
+
+        new_stocks = self.repository.decrement_stock_bulk(db, quantities)
+        if new_stocks is None:
+            current = self.repository.get_stock_levels(db, list(quantities))
+            failed = sorted(
+                prod_id for prod_id, qty in quantities.items() if current.get(prod_id, 0) < qty
+            )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient stock or missing inventory for product ids: {failed}. No stock was changed."
+            )
+        return [schemas.InventoryOut(prod_id=prod_id, stock=stock) for prod_id, stock in sorted(new_stocks.items())]
+
+    def apply_bulk_update(
+        self, db: Session, items: List[schemas.InventoryBulkItem], chunk_size: int = 1000
+    ) -> List[schemas.InventoryBulkResult]:
+        """
+        Applies a warehouse sync of absolute (`stock`) and relative (`delta`) entries in ONE
+        transaction. Per chunk: one product-existence read, one ordered row-locking stock read
+        and one upsert statement. Entries for the same product apply in order.
+        Unknown products are reported as `not_found`; entries that would drive stock below
+        zero, or below the units held by carts, are `rejected`. Returns one result per product,
+        in first-seen order, with the stock on hand after the write.
+        """
+        results: List[schemas.InventoryBulkResult] = []
+        ordered_ids = list(dict.fromkeys(item.prod_id for item in items))
+        items_by_product: Dict[int, List[schemas.InventoryBulkItem]] = {}
+        for item in items:
+            items_by_product.setdefault(item.prod_id, []).append(item)
+
+        try:
+            for start in range(0, len(ordered_ids), chunk_size):
+                chunk_ids = ordered_ids[start:start + chunk_size]
+                existing_products = self.product_repository.get_existing_ids(db, chunk_ids)
+                old_stocks = self.repository.lock_stock_levels(db, [pid for pid in chunk_ids if pid in existing_products])
+                held = self.repository.get_reserved_units(db, list(old_stocks)) if old_stocks else {}
+
+                new_stocks: Dict[int, int] = {}
+                chunk_results: Dict[int, schemas.InventoryBulkResult] = {}
+                for prod_id in chunk_ids:
+                    if prod_id not in existing_products:
+                        chunk_results[prod_id] = schemas.InventoryBulkResult(
+                            prod_id=prod_id, status="not_found", detail=f"Product with id {prod_id} not found."
+                        )
+                        continue
+                    stock = old_stocks.get(prod_id, 0)
+                    for item in items_by_product[prod_id]:
+                        stock = item.stock if item.stock is not None else stock + item.delta
+                    if stock < 0:
+                        chunk_results[prod_id] = schemas.InventoryBulkResult(
+                            prod_id=prod_id, status="rejected", stock=old_stocks.get(prod_id),
+                            detail="Resulting stock would be negative."
+                        )
+                        continue
+                    if stock < held.get(prod_id, 0):
+                        chunk_results[prod_id] = schemas.InventoryBulkResult(
+                            prod_id=prod_id, status="rejected", stock=old_stocks.get(prod_id),
+                            detail=f"Resulting stock would be below the {held[prod_id]} unit(s) held in carts."
+                        )
+                        continue
+                    new_stocks[prod_id] = stock
+
+                written = self.repository.upsert_stock_levels(db, new_stocks, old_stocks)
+                for prod_id, stock in written.items():
+                    chunk_results[prod_id] = schemas.InventoryBulkResult(
+                        prod_id=prod_id, status="updated" if prod_id in old_stocks else "created", stock=stock
+                    )
+                results.extend(chunk_results[prod_id] for prod_id in chunk_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return results
+
+    def configure_shards(self, db: Session, product_id: int, shard_count: int) -> schemas.InventoryOut:
+        """
+        Turns sharded stock counters on (shard_count > 1) or off (0/1) for a hot product.
+        Callers keep seeing one stock figure either way. Raises 404 if there is no inventory record.
+        """
+        inventory = self.repository.configure_shards(db, product_id, shard_count)
+        if inventory is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Inventory for product id {product_id} not found."
+            )
+        return schemas.InventoryOut(
+            prod_id=product_id, stock=inventory.stock,
+            reserved=inventory.reserved, reorder_threshold=inventory.reorder_threshold,
+        )
+
+    def _raise_adjust_failure(self, db: Session, product_id: int, quantity: int):
+        """Explains why a conditional decrement matched no row (only runs on the failure path)."""
+        inventory = self.repository.get_inventory_by_prod_id(db, product_id)
+        if inventory is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Inventory for product id {product_id} not found."
+            )
+        stock = self.repository.get_stock_on_hand(db, [product_id]).get(product_id, 0)
+        reserved = stock - self.repository.get_stock_levels(db, [product_id]).get(product_id, stock)
+        available = max(stock - reserved, 0)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot remove {quantity}. Only {available} available in stock ({reserved} reserved)."
+        )
+
     def ensure_inventory_record_exists(self, db: Session, product_id: int):
          """Ensures an inventory record exists for a product, creating one with 0 stock if not."""
          # This should commit if it creates a new record
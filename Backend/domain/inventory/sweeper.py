@@ -0,0 +1,52 @@
+# domain/inventory/sweeper.py
+import asyncio
+import logging
+from typing import Optional
+
+from config import db as db_config
+from config.settings import settings
+from .repository import ReservationRepository
+
+logger = logging.getLogger(__name__)
+
+reservation_repository = ReservationRepository()
+
+def sweep_expired_reservations(batch_size: Optional[int] = None) -> int:
+    """
+    Releases all currently expired holds, one small committed batch at a time so that
+    no transaction holds many row locks. Returns the number of holds released.
+    """
+    if db_config.SessionLocal is None:
+        logger.error("Reservation sweeper: database session factory is not available.")
+        return 0
+    batch_size = batch_size or settings.RESERVATION_SWEEP_BATCH_SIZE
+    total_released = 0
+    db = db_config.SessionLocal()
+    try:
+        while True:
+            released = reservation_repository.release_expired(db, batch_size=batch_size)
+            total_released += released
+            if released < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return total_released
+
+async def run_reservation_sweeper(interval_seconds: Optional[int] = None):
+    """Background task: periodically releases expired stock reservations."""
+    interval_seconds = interval_seconds or settings.RESERVATION_SWEEP_INTERVAL_SECONDS
+    logger.info(f"Reservation sweeper started (interval={interval_seconds}s).")
+    while True:
+        try:
+            # DB work is blocking; keep it off the event loop
+            released = await asyncio.to_thread(sweep_expired_reservations)
+            if released:
+                logger.info(f"Reservation sweeper released {released} expired hold(s).")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Reservation sweeper run failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
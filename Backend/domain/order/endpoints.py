@@ -4,14 +4,16 @@
 print("✅ Loaded domain.order.endpoints router") # Keep this for confirmation during startup
 import logging
 import asyncio
+import json
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
     HTTPException,
     WebSocket,
-    WebSocketDisconnect,
     Query, # Query is needed if you ever re-add token auth via query param
     status,
 )
@@ -34,27 +36,35 @@ except ImportError:
          # Create a dummy manager to prevent NameErrors during startup, but WS won't function.
          class DummyWsManager:
              async def connect(self, *args, **kwargs): logging.warning("Using DummyWsManager: connect called")
+             async def receive_until_disconnect(self, *args, **kwargs): logging.warning("Using DummyWsManager: receive_until_disconnect called")
              def disconnect(self, *args, **kwargs): logging.warning("Using DummyWsManager: disconnect called")
              async def send_personal_message(self, *args, **kwargs): logging.warning("Using DummyWsManager: send_personal_message called")
              async def broadcast(self, *args, **kwargs): logging.warning("Using DummyWsManager: broadcast called")
+             def stats(self): return {}
              active_connections = {}
          ws_manager = DummyWsManager()
 
 # --- Domain Specific Imports ---
-from .schemas import OrderCreate, OrderResponse # Assuming OrderStatusUpdatePayload is defined below or in schemas.py
+from .schemas import OrderCreate, OrderResponse, OrderPage, SalesKpis, DailySales, DeliveryInfoResponse, OrderStatusBulkUpdate, OrderStatusBulkResult # Assuming OrderStatusUpdatePayload is defined below or in schemas.py
 from .service import OrderService
+from .repository import OrderRollupRepository
 from .models import Order
+from .events import order_room, queue_status_changes, user_room
+from config import db as db_config
+from domain.inventory.events import product_room
+from notification_bus import get_notification_bus
 
 # --- Authentication Imports (Keep as per your setup) ---
 try:
     from ..authentication.models import User as AuthUser
-    from security.jwt import get_current_user
+    from security.jwt import get_current_user, get_user_from_token
     # from security.jwt import get_current_user_from_token # Keep if you re-add token auth
 except ImportError as e:
     # Log the error but allow startup, other endpoints might work
     logging.error(f"⚠️ Failed to import authentication dependencies: {e}. Auth-related endpoints might fail.")
     # Define dummy dependencies if needed to prevent NameErrors at route definition time
     async def get_current_user(): raise HTTPException(status_code=500, detail="Auth dependency missing")
+    def get_user_from_token(*args, **kwargs): return None
 
 # --- Database Import ---
 try:
@@ -84,6 +94,16 @@ ORDER_STATUSES_VALUES = [
     'pending', 'pending_cod', 'processing', 'shipped', 'delivered', 'cancelled',
 ]
 
+# Forward moves allowed by bulk transitions (PATCH /status); delivered and cancelled are final
+ORDER_STATUS_TRANSITIONS = {
+    'pending': {'pending_cod', 'processing', 'cancelled'},
+    'pending_cod': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+
 # --- Pydantic Model for PATCH Request Body ---
 # Define it here if not in schemas.py
 class OrderStatusUpdatePayload(BaseModel):
@@ -135,18 +155,41 @@ def create_order_endpoint(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not process the order due to an internal error.")
 
 
-@router.get("/", response_model=List[OrderResponse], status_code=status.HTTP_200_OK)
+# --- Listing parameters shared by the paginated order endpoints ---
+ORDER_PAGE_DEFAULT_LIMIT = 20
+ORDER_PAGE_MAX_LIMIT = 100
+
+def order_list_filters(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_from: Optional[datetime] = Query(None, description="Inclusive lower bound on created_at"),
+    created_to: Optional[datetime] = Query(None, description="Exclusive upper bound on created_at"),
+) -> dict:
+    """Validated status/date filters, as keyword arguments for OrderService listings."""
+    if status_filter is not None and status_filter not in ORDER_STATUSES_VALUES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status value. Must be one of: {', '.join(ORDER_STATUSES_VALUES)}"
+        )
+    return {"status": status_filter, "created_from": created_from, "created_to": created_to}
+
+
+@router.get("/", response_model=OrderPage, status_code=status.HTTP_200_OK)
 def get_order_history_endpoint(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(ORDER_PAGE_DEFAULT_LIMIT, ge=1, le=ORDER_PAGE_MAX_LIMIT),
+    filters: dict = Depends(order_list_filters),
     db: Session = Depends(get_db),
     current_user: AuthUser = Depends(get_current_user) # Requires working auth import
 ):
-    """Endpoint to fetch the order history for the currently authenticated user."""
+    """Endpoint to fetch one page of order history for the currently authenticated user, newest first."""
     logger.info(f"Received GET /orders request for user_id={current_user.id}")
     order_service = OrderService(db)
     try:
-        order_history_models = order_service.get_order_history(user_id=current_user.id)
-        logger.info(f"Returning {len(order_history_models)} orders for user {current_user.id}")
-        return order_history_models
+        orders, next_cursor = order_service.get_order_history(current_user.id, limit, cursor=cursor, **filters)
+        logger.info(f"Returning {len(orders)} orders for user {current_user.id}")
+        return OrderPage(items=orders, next_cursor=next_cursor)
+    except ValueError as e: # Malformed cursor
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching order history for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(
@@ -155,6 +198,59 @@ def get_order_history_endpoint(
         )
 
 
+@router.get("/addresses", response_model=List[DeliveryInfoResponse], status_code=status.HTTP_200_OK)
+def get_saved_addresses_endpoint(
+    db: Session = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """The current user's saved delivery addresses (one per distinct address used at checkout), newest first."""
+    try:
+        return OrderService(db).get_saved_addresses(current_user.id)
+    except Exception as e:
+        logger.error(f"Error fetching saved addresses for user {current_user.id}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An internal error occurred while fetching saved addresses."
+        )
+
+
+@router.patch("/status", response_model=OrderStatusBulkResult, status_code=status.HTTP_200_OK)
+def bulk_update_order_status_endpoint(
+    payload: OrderStatusBulkUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    # NOTE: Add admin role check dependency here if this should be admin-only
+):
+    """
+    Moves many orders to one status in a single transaction (e.g. ship a fulfillment batch).
+    Only orders whose current status may transition to the target are changed; the rest are
+    reported back. Admins get one combined notification for the whole batch.
+    """
+    new_status = payload.status.lower().strip()
+    if new_status not in ORDER_STATUSES_VALUES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid status value provided: {payload.status}")
+    from_statuses = [s for s, targets in ORDER_STATUS_TRANSITIONS.items() if new_status in targets]
+    logger.info(f"Received PATCH /orders/status for {len(payload.order_ids)} order(s) -> '{new_status}'.")
+
+    try:
+        result = OrderService(db).bulk_update_status(payload.order_ids, new_status, from_statuses)
+    except Exception as e:
+        logger.error(f"Database error during bulk status update to '{new_status}': {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during bulk status update.")
+
+    if result.updated:
+        notification = {
+            "type": "order_status_bulk_update",
+            "status": new_status,
+            "order_ids": result.updated,
+            "count": len(result.updated),
+        }
+        # Runs on the event loop after the response is sent (the update is already committed);
+        # goes through the bus so admins connected to other workers see it too
+        background_tasks.add_task(get_notification_bus().broadcast, json.dumps(notification), room="admin_notifications")
+    return result
+
+
 @router.patch("/{order_id}", response_model=OrderResponse, status_code=status.HTTP_200_OK)
 def update_order_status_endpoint(
     order_id: int,
@@ -198,6 +294,8 @@ def update_order_status_endpoint(
     db_order.status = new_status
 
     try:
+        OrderRollupRepository().record_status_change(db, db_order, original_status)
+        queue_status_changes(db, new_status, [(db_order.id, db_order.user_id)]) # Pushed to the customer after commit
         db.commit()
         db.refresh(db_order)
         logger.info(f"Successfully updated status for order ID {order_id} from '{original_status}' to '{db_order.status}'.")
@@ -221,14 +319,19 @@ def update_order_status_endpoint(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during status update.")
 
 
-@router.get("/admin/all", response_model=List[OrderResponse], status_code=status.HTTP_200_OK)
+@router.get("/admin/all", response_model=OrderPage, status_code=status.HTTP_200_OK)
 def get_all_orders_admin(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(ORDER_PAGE_DEFAULT_LIMIT, ge=1, le=ORDER_PAGE_MAX_LIMIT),
+    user_id: Optional[int] = Query(None),
+    filters: dict = Depends(order_list_filters),
     db: Session = Depends(get_db),
     # NOTE: Add admin role check dependency here if this should be admin-only
     # current_admin: AuthUser = Depends(get_admin_user) # Example dependency
 ):
     """
-    Public endpoint to fetch all orders in the system.
+    Public endpoint to page through all orders in the system, newest first,
+    optionally filtered by user, status and creation date.
     Consider adding admin authorization check.
     """
     # Example authorization check:
@@ -237,10 +340,11 @@ def get_all_orders_admin(
 
     logger.info("Request received for GET /orders/admin/all.")
     try:
-        # Consider adding pagination for large number of orders
-        orders = db.query(Order).order_by(Order.created_at.desc()).all()
+        orders, next_cursor = OrderService(db).list_orders(limit, cursor=cursor, user_id=user_id, **filters)
         logger.info(f"Returning {len(orders)} orders from /admin/all.")
-        return orders
+        return OrderPage(items=orders, next_cursor=next_cursor)
+    except ValueError as e: # Malformed cursor
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error retrieving all orders from /admin/all: {e}", exc_info=True)
         raise HTTPException(
@@ -248,17 +352,52 @@ def get_all_orders_admin(
             detail="Failed to retrieve orders due to a server error."
         )
 
+@router.get("/admin/stats/kpis", response_model=SalesKpis, status_code=status.HTTP_200_OK)
+def get_sales_kpis_admin(db: Session = Depends(get_db)):
+    """All-time order count, revenue and average order value, overall and per status (from the rollups)."""
+    try:
+        return OrderService(db).get_sales_kpis()
+    except Exception as e:
+        logger.error(f"Error reading sales KPIs: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to load sales KPIs.")
+
+
+@router.get("/admin/stats/daily", response_model=List[DailySales], status_code=status.HTTP_200_OK)
+def get_daily_sales_admin(
+    days: int = Query(30, ge=1, le=366),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    db: Session = Depends(get_db),
+):
+    """Daily order count, revenue and average order value for the last `days` UTC days (from the rollups)."""
+    if status_filter is not None and status_filter not in ORDER_STATUSES_VALUES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status value. Must be one of: {', '.join(ORDER_STATUSES_VALUES)}"
+        )
+    try:
+        return OrderService(db).get_daily_sales(days, status=status_filter)
+    except Exception as e:
+        logger.error(f"Error reading daily sales: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to load daily sales.")
+
 # =========================================
 # === WebSocket Endpoint ==================
 # =========================================
 
+@router.get("/admin/ws/stats", status_code=status.HTTP_200_OK)
+def get_websocket_stats_admin():
+    """This worker's WebSocket connections, send-queue depth, dropped frames and slow-client evictions."""
+    return ws_manager.stats()
+
+
 @router.websocket("/ws/admin/notifications")
 async def websocket_admin_notifications(websocket: WebSocket):
     """
     Public WebSocket endpoint for admin notifications.
-    Manages connection and sends periodic pings for keep-alive.
-    Relies on external triggers (e.g., Kafka consumer via Redis Pub/Sub or direct API calls)
-    calling ws_manager.broadcast to send data to connected clients.
+    Frames are pushed by ws_manager.broadcast (fed by the notification bus: Kafka consumer,
+    stock alerts, bulk status updates) through this connection's writer task; the handler
+    itself only waits for the client to go away. Keep-alive pings are protocol-level frames
+    sent by the server, so an idle connection never wakes up here.
     """
     client_host = websocket.client.host if websocket.client else "unknown"
     client_port = websocket.client.port if websocket.client else "unknown"
@@ -270,35 +409,10 @@ async def websocket_admin_notifications(websocket: WebSocket):
     logger.info(f"Admin WebSocket connected (public) from {client_host}:{client_port}. Current connections in room '{room}': {len(ws_manager.active_connections.get(room, set()))}")
 
     try:
-        # Optional: Send a confirmation message to the newly connected client
-        # await ws_manager.send_personal_message('{"type": "status", "message": "Connection established"}', websocket)
-
-        last_ping = asyncio.get_event_loop().time()
-        ping_interval = 30 # Send ping every 30 seconds
-
-        while True:
-            # --- Send Periodic Pings ---
-            now = asyncio.get_event_loop().time()
-            if now - last_ping > ping_interval:
-                try:
-                    # Send a simple ping message
-                    await websocket.send_text('{"type": "ping"}')
-                    logger.debug(f"Sent ping to client {client_host}:{client_port}")
-                    last_ping = now
-                except Exception as ping_err:
-                    # Log warning, break loop as connection is likely dead
-                    logger.warning(f"Failed to send ping to client {client_host}:{client_port}: {ping_err}. Closing connection.")
-                    break # Exit the loop, finally block will handle disconnect
-
-            # --- Efficiently Wait/Yield Control ---
-            # Sleep allows other asyncio tasks to run. Important for responsiveness.
-            await asyncio.sleep(1) # Yield control for 1 second
-
-    except WebSocketDisconnect as e:
-        # Catches disconnects initiated by the client or network issues detected during send/receive
-        logger.info(f"Admin WebSocket {client_host}:{client_port} disconnected: code={e.code}, reason='{e.reason}'")
+        await ws_manager.receive_until_disconnect(websocket)
+        logger.info(f"Admin WebSocket {client_host}:{client_port} disconnected.")
     except Exception as e:
-        # Catch unexpected errors within the WebSocket handler loop
+        # Catch unexpected errors while waiting on the connection
         logger.error(f"Unexpected error in admin WebSocket handler for {client_host}:{client_port}: {e}", exc_info=True)
         # Attempt to close the WebSocket connection gracefully if possible
         try:
@@ -311,6 +425,89 @@ async def websocket_admin_notifications(websocket: WebSocket):
         ws_manager.disconnect(websocket, room)
         logger.info(f"Cleaned up connection for admin WebSocket {client_host}:{client_port} from room '{room}'. Remaining connections: {len(ws_manager.active_connections.get(room, set()))}")
 
+
+MAX_TOPIC_SUBSCRIPTIONS = 100 # Topics a single customer WebSocket may subscribe to
+
+def _authenticate_websocket(token: str) -> Optional[int]:
+    """User id for a WebSocket token (short-lived session: the socket may stay open for hours)."""
+    db = db_config.SessionLocal()
+    try:
+        user = get_user_from_token(token, db)
+        return user.id if user else None
+    finally:
+        db.close()
+
+def _owns_order(user_id: int, order_id: int) -> bool:
+    db = db_config.SessionLocal()
+    try:
+        return db.query(Order.id).filter(Order.id == order_id, Order.user_id == user_id).first() is not None
+    finally:
+        db.close()
+
+async def _topic_room(user_id: int, topic: str) -> str:
+    """Room for a client topic ("order:<id>" for the user's own orders, "product:<id>" for stock), or ValueError."""
+    kind, _, raw_id = topic.partition(":")
+    if not raw_id.isdigit():
+        raise ValueError("Topic must look like 'order:<id>' or 'product:<id>'.")
+    if kind == "product":
+        return product_room(int(raw_id))
+    if kind == "order":
+        if not await asyncio.to_thread(_owns_order, user_id, int(raw_id)):
+            raise ValueError("Order not found.")
+        return order_room(int(raw_id))
+    raise ValueError(f"Unknown topic type '{kind}'.")
+
+@router.websocket("/ws/me")
+async def websocket_user_notifications(
+    websocket: WebSocket,
+    token: str = Query(..., description="Access token (browsers can't set headers on WebSockets)"),
+):
+    """
+    Authenticated WebSocket for one customer.
+    - Always receives `{"type": "order_status_update", "status", "order_ids"}` for the user's own orders.
+    - Clients may send `{"action": "subscribe" | "unsubscribe", "topic": "order:<id>" | "product:<id>"}`;
+      product topics deliver the same frames as /inventory/ws/stock. Each request is answered with
+      `{"type": "subscribed" | "unsubscribed", "topic"}` or `{"type": "error", "topic", "detail"}`.
+    """
+    user_id = await asyncio.to_thread(_authenticate_websocket, token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    home = user_room(user_id)
+    await ws_manager.connect(websocket, home)
+
+    async def handle_message(text: str):
+        try:
+            request = json.loads(text)
+            action, topic = request["action"], str(request["topic"])
+        except (ValueError, KeyError, TypeError):
+            await ws_manager.send_personal_message(json.dumps({"type": "error", "detail": "Expected {\"action\", \"topic\"}."}), websocket)
+            return
+        try:
+            room = await _topic_room(user_id, topic)
+            if not ws_manager.is_connected(websocket):
+                return # Evicted while the topic was being checked; joining would re-register a dead socket
+            if action == "subscribe":
+                if room not in ws_manager.rooms_of(websocket) and len(ws_manager.rooms_of(websocket)) > MAX_TOPIC_SUBSCRIPTIONS:
+                    raise ValueError("Too many subscriptions.")
+                ws_manager.join(websocket, room)
+            elif action == "unsubscribe":
+                if room in ws_manager.rooms_of(websocket):
+                    ws_manager.disconnect(websocket, room)
+            else:
+                raise ValueError(f"Unknown action '{action}'.")
+        except ValueError as e:
+            await ws_manager.send_personal_message(json.dumps({"type": "error", "topic": topic, "detail": str(e)}), websocket)
+            return
+        await ws_manager.send_personal_message(json.dumps({"type": f"{action}d", "topic": topic}), websocket)
+
+    try:
+        await ws_manager.receive_until_disconnect(websocket, on_message=handle_message)
+    finally:
+        for room in ws_manager.rooms_of(websocket):
+            ws_manager.disconnect(websocket, room)
+
 # Remember to include this router in your main FastAPI application (main.py)
 # Example: app.include_router(router)
 
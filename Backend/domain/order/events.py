@@ -0,0 +1,124 @@
+# domain/order/events.py
+"""
+Live order status push for customers.
+
+Status write paths queue (order id, owner id) pairs on the SQLAlchemy session. When (and only
+when) the transaction commits, they are handed to the in-process publisher, which wakes its
+background task and publishes them on the notification bus. Every API worker then looks up
+only the rooms that can care, `user:<owner id>` and `order:<order id>`, in its room index:
+delivery costs one lookup per changed order plus one frame per subscribed socket, however
+many sockets the worker holds. A batch that moves many of one customer's orders is a single
+`{"type": "order_status_update", "status": ..., "order_ids": [...]}` frame for that customer;
+a socket that is in both the owner's room and an order's room gets that order once.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from notification_bus import get_notification_bus
+from websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = "pending_order_status_changes"
+BUS_KIND = "order_status_changes"
+
+def user_room(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def order_room(order_id: int) -> str:
+    return f"order:{order_id}"
+
+def queue_status_changes(db: Session, new_status: str, changes: Iterable[Tuple[int, int]]) -> None:
+    """Records (order id, owner id) pairs moved to new_status; published after the session commits."""
+    changes = list(changes)
+    if changes:
+        db.info.setdefault(_SESSION_KEY, {}).setdefault(new_status, []).extend(changes)
+
+
+class OrderEventPublisher:
+    def __init__(self):
+        self._pending: Dict[str, List[Tuple[int, int]]] = {}
+        self._lock = threading.Lock() # Commits happen on worker threads (sync endpoints)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add(self, changes: Dict[str, List[Tuple[int, int]]]) -> None:
+        with self._lock:
+            for new_status, pairs in changes.items():
+                self._pending.setdefault(new_status, []).extend(pairs)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take(self) -> Dict[str, List[Tuple[int, int]]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    async def flush(self) -> int:
+        """Publishes everything committed since the last flush, one bus message per status. Returns orders sent."""
+        pending = self._take()
+        for new_status, pairs in pending.items():
+            await get_notification_bus().publish(BUS_KIND, {"status": new_status, "orders": pairs})
+        return sum(len(pairs) for pairs in pending.values())
+
+    def _frame(self, status: str, order_ids: List[int]) -> str:
+        return json.dumps({"type": "order_status_update", "status": status, "order_ids": order_ids})
+
+    async def deliver(self, payload: dict) -> None:
+        """
+        Bus handler: one frame per subscribed user room on this worker, plus one per socket
+        watching order rooms for orders its user room doesn't already cover.
+        """
+        rooms = manager.active_connections
+        order_ids_by_room: Dict[str, List[int]] = {}
+        order_ids_by_socket: Dict[object, List[int]] = {}
+        for order_id, user_id in payload["orders"]:
+            owner_sockets = rooms.get(user_room(user_id), ())
+            if owner_sockets:
+                order_ids_by_room.setdefault(user_room(user_id), []).append(order_id)
+            for websocket in rooms.get(order_room(order_id), ()):
+                if websocket not in owner_sockets:
+                    order_ids_by_socket.setdefault(websocket, []).append(order_id)
+        for room, order_ids in order_ids_by_room.items():
+            await manager.broadcast(self._frame(payload["status"], order_ids), room=room)
+        for websocket, order_ids in order_ids_by_socket.items():
+            await manager.send_personal_message(self._frame(payload["status"], order_ids), websocket)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set() # Anything committed before startup
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Order event publisher flush failed: {e}", exc_info=True)
+
+
+order_event_publisher = OrderEventPublisher()
+get_notification_bus().subscribe(BUS_KIND, order_event_publisher.deliver)
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    if changes:
+        order_event_publisher.add(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+
+async def run_order_event_publisher():
+    """Background task: publishes committed order status changes as soon as they happen (no polling)."""
+    logger.info("Order event publisher started.")
+    await order_event_publisher.run()
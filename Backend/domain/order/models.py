@@ -1,12 +1,16 @@
 # File: domain/order/models.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey # Added ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, UniqueConstraint # Added ForeignKey
 from sqlalchemy.orm import relationship # Optional: For relating back to User
 from datetime import datetime
 from config.db import Base # Assuming Base is correctly defined here
 
 class DeliveryInfo(Base):
+    """A user's saved delivery address; orders reference it instead of copying it."""
     __tablename__ = "delivery_info"
     id = Column(Integer, primary_key=True, index=True)
+    # Owner and SHA-256 of the normalized fields (see DeliveryInfoRepository); NULL on legacy per-order rows
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    content_hash = Column(String(64), nullable=True)
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     email = Column(String, nullable=False, index=True) # Added index to email potentially
@@ -21,21 +25,27 @@ class DeliveryInfo(Base):
     # Optional: Relationship to Order (One-to-Many)
     # orders = relationship("Order", back_populates="delivery_details")
 
+    # Checkout finds a returning address with one lookup on this key; it also serves "list by user"
+    __table_args__ = (
+        UniqueConstraint("user_id", "content_hash", name="uq_delivery_info_user_hash"),
+    )
+
 class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True, index=True)
     # --- Link to the User ---
     # IMPORTANT: Adjust 'users.id' if your user table/pk column is named differently
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False) # Indexed by ix_orders_user_created
     # ------------------------
     delivery_info_id = Column(Integer, ForeignKey('delivery_info.id'), nullable=False)
     subtotal = Column(Float, nullable=False)
     shipping_fee = Column(Float, nullable=False)
     total = Column(Float, nullable=False)
     payment_method = Column(String, nullable=False, default="cash_on_delivery")
-    status = Column(String, default="pending_cod", index=True) # Added status field if needed
-    created_at = Column(DateTime, default=datetime.utcnow, index=True) # Added index
+    status = Column(String, default="pending_cod") # Indexed by ix_orders_status_created
+    # Partition key on PostgreSQL (monthly ranges, see partitioning.py)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True) # Added index
 
     # Optional: Relationship back to User (Many-to-One)
     # owner = relationship("User", back_populates="orders") # Assumes User model has 'orders' relationship defined
@@ -43,5 +53,44 @@ class Order(Base):
     # Optional: Relationship to DeliveryInfo (Many-to-One)
     # delivery_details = relationship("DeliveryInfo", back_populates="orders")
 
-    # Optional: Relationship to Order Items (One-to-Many)
-    # items = relationship("OrderItem", back_populates="order") # Assumes OrderItem model exists
\ No newline at end of file
+    # Lines written at checkout (see OrderItem)
+    items = relationship("OrderItem", back_populates="order", order_by="OrderItem.id")
+
+    # Keyset pagination walks (created_at, id) newest first; these cover the filtered listings
+    __table_args__ = (
+        Index("ix_orders_status_created", "status", "created_at", "id"),
+        Index("ix_orders_user_created", "user_id", created_at.desc(), id.desc()),
+    )
+
+class OrderItem(Base):
+    """One checked-out cart line, priced from products at checkout time."""
+    __tablename__ = "order_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey('orders.id', ondelete="CASCADE"), nullable=False, index=True)
+    # The order's created_at: lines are partitioned with their order on PostgreSQL
+    order_created_at = Column(DateTime, nullable=False)
+    prod_id = Column(Integer, ForeignKey('products.id'), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False) # Price snapshot; later price changes don't touch past orders
+    line_total = Column(Float, nullable=False)
+
+    order = relationship("Order", back_populates="items")
+
+# --- Sales rollups (maintained in the order write path; see domain/order/rollups.py) ---
+class OrderDailyRollup(Base):
+    """Orders and revenue per UTC day of order creation and current status."""
+    __tablename__ = "order_daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+class OrderStatusRollup(Base):
+    """All-time orders and revenue per current status; the KPI cards read only this."""
+    __tablename__ = "order_status_rollups"
+
+    status = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,266 @@
+# domain/order/partitioning.py
+"""
+Monthly range partitioning for `orders` and `order_items` (PostgreSQL only).
+
+On PostgreSQL both tables are created as partitioned parents: orders by created_at and
+order_items by order_created_at (a copy of its order's created_at), so an order and its
+lines always live in the same month. Every insert then touches only the current month's
+small indexes, and old months can be moved out whole. PostgreSQL requires the partition key
+in every unique constraint, so the primary keys are (id, created_at) / (id, order_created_at)
+and the line -> order foreign key is composite; ids still come from one sequence each.
+
+Partitions are created ORDER_PARTITION_MONTHS_AHEAD months in advance at startup and by a
+daily background task; a DEFAULT partition catches anything outside them (it should stay
+empty: a month can't get its own partition while the default holds rows for it). Months older
+than ORDER_RETENTION_MONTHS are detached, exported to gzipped CSV and dropped by:
+
+    python -m domain.order.partitioning archive [--retention-months N] [--dry-run]
+
+Sales rollups are not touched, so archived months still count in the dashboard.
+
+SQLite (and an existing, unpartitioned PostgreSQL `orders`) keeps the plain tables from
+models.py; everything here is then a no-op apart from a warning.
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from config import db as db_config
+from config.settings import settings
+from .models import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Parent -> partition key. Children are named <parent>_pYYYY_MM (plus <parent>_default).
+PARTITIONED_TABLES = {"orders": "created_at", "order_items": "order_created_at"}
+_PARTITION_NAME = re.compile(r"^(?P<parent>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+# Debezium reads this publication; publish_via_partition_root keeps events under "orders"
+CDC_PUBLICATION = "dbz_publication"
+
+# Keep in sync with Order / OrderItem in models.py (these replace create_all for the two tables)
+_CREATE_PARENTS = [
+    """
+    CREATE TABLE orders (
+        id SERIAL NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        delivery_info_id INTEGER NOT NULL REFERENCES delivery_info (id),
+        subtotal FLOAT NOT NULL,
+        shipping_fee FLOAT NOT NULL,
+        total FLOAT NOT NULL,
+        payment_method VARCHAR NOT NULL,
+        status VARCHAR,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    """
+    CREATE TABLE order_items (
+        id SERIAL NOT NULL,
+        order_id INTEGER NOT NULL,
+        order_created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        prod_id INTEGER NOT NULL REFERENCES products (id),
+        quantity INTEGER NOT NULL,
+        unit_price FLOAT NOT NULL,
+        line_total FLOAT NOT NULL,
+        PRIMARY KEY (id, order_created_at),
+        FOREIGN KEY (order_id, order_created_at) REFERENCES orders (id, created_at) ON DELETE CASCADE
+    ) PARTITION BY RANGE (order_created_at)
+    """,
+]
+
+def _month_start(day: date, offset: int = 0) -> date:
+    index = day.year * 12 + (day.month - 1) + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(parent: str, month: date) -> str:
+    return f"{parent}_p{month:%Y_%m}"
+
+def _is_partitioned(conn: Connection, table: str) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+        {"t": table},
+    ).first() is not None
+
+def _monthly_partitions(conn: Connection, parent: str) -> List[Tuple[date, str]]:
+    """(month, partition name) of the parent's monthly partitions, oldest first."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": parent}).scalars()
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match and match["parent"] == parent:
+            months.append((date(int(match["year"]), int(match["month"]), 1), name))
+    return sorted(months)
+
+def _ensure_partitions(conn: Connection, months_ahead: int) -> int:
+    """Creates missing monthly partitions from this month to months_ahead ahead; returns how many."""
+    this_month = _month_start(datetime.utcnow().date())
+    created = 0
+    for parent in PARTITIONED_TABLES:
+        for offset in range(months_ahead + 1):
+            start = _month_start(this_month, offset)
+            name = partition_name(parent, start)
+            if inspect(conn).has_table(name):
+                continue
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{_month_start(start, 1).isoformat()}')"
+            ))
+            created += 1
+    return created
+
+def _ensure_cdc_publication(conn: Connection):
+    if conn.execute(text("SELECT 1 FROM pg_publication WHERE pubname = :p"), {"p": CDC_PUBLICATION}).first():
+        return
+    conn.execute(text(
+        f"CREATE PUBLICATION {CDC_PUBLICATION} FOR TABLE orders WITH (publish_via_partition_root = true)"
+    ))
+
+def create_partitioned_order_tables(engine: Optional[Engine]):
+    """
+    Startup hook, run before create_all. On PostgreSQL, creates `orders` and `order_items`
+    as partitioned parents (after the tables they reference) if they don't exist yet, and
+    makes sure the upcoming partitions exist. No-op on other databases (or without an engine).
+    """
+    if engine is None or engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        if not inspect(conn).has_table("orders"):
+            # Create what orders/order_items reference first: every table that doesn't depend on them
+            excluded = set(PARTITIONED_TABLES)
+            prerequisites = []
+            for table in db_config.Base.metadata.sorted_tables:
+                if table.name in excluded or any(fk.column.table.name in excluded for fk in table.foreign_keys):
+                    excluded.add(table.name)
+                else:
+                    prerequisites.append(table)
+            db_config.Base.metadata.create_all(bind=conn, tables=prerequisites)
+            for ddl in _CREATE_PARENTS:
+                conn.execute(text(ddl))
+            for model in (Order, OrderItem):
+                for index in model.__table__.indexes:
+                    index.create(conn)
+            for parent in PARTITIONED_TABLES:
+                conn.execute(text(f"CREATE TABLE {parent}_default PARTITION OF {parent} DEFAULT"))
+            logger.info("Created partitioned 'orders' and 'order_items' tables.")
+        elif not _is_partitioned(conn, "orders"):
+            logger.warning("'orders' exists and is not partitioned; leaving it as is (migrate it by hand to enable partitioning).")
+            return
+        created = _ensure_partitions(conn, settings.ORDER_PARTITION_MONTHS_AHEAD)
+        _ensure_cdc_publication(conn)
+    if created:
+        logger.info(f"Created {created} order partition(s) ahead of time.")
+
+def ensure_order_partitions(months_ahead: Optional[int] = None) -> int:
+    """Creates upcoming monthly partitions if missing; returns how many were created (0 if not partitioned)."""
+    engine = db_config.engine
+    if engine is None or engine.dialect.name != "postgresql":
+        return 0
+    with engine.begin() as conn:
+        if not _is_partitioned(conn, "orders"):
+            return 0
+        return _ensure_partitions(conn, months_ahead if months_ahead is not None else settings.ORDER_PARTITION_MONTHS_AHEAD)
+
+def _copy_to_gzip(conn: Connection, table: str, path: str):
+    """Streams the table out with COPY into a gzipped CSV (with header), written via a temp file."""
+    tmp_path = path + ".tmp"
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as out:
+            cursor.copy_expert(f"COPY {table} TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        cursor.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def archive_old_partitions(retention_months: Optional[int] = None, archive_dir: Optional[str] = None,
+                           dry_run: bool = False) -> List[str]:
+    """
+    Detaches every monthly partition that ended more than retention_months ago, writes it to
+    <archive_dir>/<partition>.csv.gz and drops it. One transaction per month: line items first
+    (they reference the orders), then orders; if an export fails the month is rolled back and
+    stays attached. Returns the archived partition names.
+    """
+    engine = db_config.engine
+    if engine is None or engine.dialect.name != "postgresql":
+        logger.info("Order archive: not a PostgreSQL database; nothing to do.")
+        return []
+    retention_months = retention_months if retention_months is not None else settings.ORDER_RETENTION_MONTHS
+    archive_dir = archive_dir or settings.ORDER_ARCHIVE_DIR
+    cutoff = _month_start(datetime.utcnow().date(), -retention_months)
+
+    with engine.connect() as conn:
+        if not _is_partitioned(conn, "orders"):
+            logger.info("Order archive: 'orders' is not partitioned; nothing to do.")
+            return []
+        months = sorted({month for month, _ in _monthly_partitions(conn, "orders") if month < cutoff})
+    if dry_run:
+        names = [partition_name(parent, month) for month in months for parent in PARTITIONED_TABLES]
+        logger.info(f"Order archive (dry run): would archive {names or 'nothing'} (cutoff {cutoff}).")
+        return names
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for month in months:
+        names = []
+        with engine.begin() as conn:
+            for parent in ("order_items", "orders"): # Referencing side first
+                name = partition_name(parent, month)
+                if not inspect(conn).has_table(name):
+                    continue
+                conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {name}"))
+                _copy_to_gzip(conn, name, os.path.join(archive_dir, f"{name}.csv.gz"))
+                conn.execute(text(f"DROP TABLE {name}"))
+                names.append(name)
+        archived.extend(names)
+        logger.info(f"Order archive: archived {', '.join(names)} to '{archive_dir}'.")
+    if not archived:
+        logger.info(f"Order archive: no partitions older than {cutoff}.")
+    return archived
+
+async def run_order_partition_maintainer(interval_seconds: Optional[int] = None):
+    """Background task: keeps monthly order partitions created ahead of time (PostgreSQL only)."""
+    if db_config.engine is None or db_config.engine.dialect.name != "postgresql":
+        logger.info("Order partition maintainer not needed for this database; exiting.")
+        return
+    interval_seconds = interval_seconds or settings.ORDER_PARTITION_MAINTENANCE_INTERVAL_SECONDS
+    logger.info(f"Order partition maintainer started (interval={interval_seconds}s, {settings.ORDER_PARTITION_MONTHS_AHEAD} month(s) ahead).")
+    while True:
+        try:
+            # DB work is blocking; keep it off the event loop
+            created = await asyncio.to_thread(ensure_order_partitions)
+            if created:
+                logger.info(f"Order partition maintainer created {created} partition(s).")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Order partition maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Order partition maintenance (PostgreSQL).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive = commands.add_parser("archive", help="Detach, export and drop partitions past the retention window.")
+    archive.add_argument("--retention-months", type=int, default=None)
+    archive.add_argument("--archive-dir", default=None)
+    archive.add_argument("--dry-run", action="store_true")
+    commands.add_parser("ensure", help="Create upcoming partitions now.")
+    args = parser.parse_args()
+    if args.command == "archive":
+        archive_old_partitions(args.retention_months, args.archive_dir, dry_run=args.dry_run)
+    else:
+        logger.info(f"Created {ensure_order_partitions()} partition(s).")
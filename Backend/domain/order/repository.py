@@ -1,50 +1,302 @@
 # File: domain/order/repository.py
-from sqlalchemy.orm import Session
-from typing import List # Import List
+import base64
+import hashlib
+import re
+from collections import defaultdict
+from types import SimpleNamespace
+from datetime import date, datetime
+from sqlalchemy import Integer, any_, bindparam, delete, func, insert, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session, selectinload
+from typing import Iterable, List, Dict, Optional, Tuple # Import List
+from config.db import dialect_insert
 # Use relative imports
-from .models import DeliveryInfo, Order
-from .schemas import DeliveryInfoCreate, OrderCreate
+from .models import DeliveryInfo, Order, OrderItem, OrderDailyRollup, OrderStatusRollup
+from .schemas import DeliveryInfoCreate
+
+def id_in(db: Session, column, ids: List[int]):
+    """
+    `column = ANY(:ids)` with the ids bound as ONE array parameter on PostgreSQL (one plan,
+    however many ids); an expanding IN list elsewhere.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return column == any_(bindparam(None, list(ids), type_=ARRAY(Integer)))
+    return column.in_(list(ids))
+
+def encode_cursor(order: Order) -> str:
+    """Keyset cursor for the page after `order`: its (created_at, id), base64url-encoded."""
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for cursors this API didn't issue."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, order_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception as e:
+        raise ValueError("Invalid pagination cursor.") from e
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_delivery_info(delivery_info: DeliveryInfoCreate) -> Dict[str, str]:
+    """Trims and collapses whitespace in every field and lowercases the email; the stored form."""
+    values = {
+        field: _WHITESPACE.sub(" ", str(value)).strip()
+        for field, value in delivery_info.model_dump().items()
+    }
+    values["email"] = values["email"].lower()
+    return values
+
+def delivery_info_hash(values: Dict[str, str]) -> str:
+    """
+    SHA-256 over the normalized fields, case-folded, with phone numbers reduced to their
+    digits: "12 Main St" and "12 main st " are the same address, "12 Main St" and "12 Main Rd" are not.
+    """
+    key = {field: value.casefold() for field, value in values.items()}
+    key["phone"] = re.sub(r"\D", "", values["phone"])
+    canonical = "\x1f".join(f"{field}={key[field]}" for field in sorted(key))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 class DeliveryInfoRepository:
-    def create(self, db: Session, delivery_info: DeliveryInfoCreate):
-        # ... (create logic as before) ...
-        db_delivery_info = DeliveryInfo(**delivery_info.dict())
-        db.add(db_delivery_info)
-        db.commit()
-        db.refresh(db_delivery_info)
-        return db_delivery_info
+    def get_or_create_for_user(self, db: Session, user_id: int, delivery_info: DeliveryInfoCreate) -> int:
+        """
+        Returns the id of the user's saved address with the same content, inserting it only on
+        a miss, without committing. A returning address costs one lookup on
+        (user_id, content_hash) and no write; a concurrent insert of the same address is
+        absorbed by ON CONFLICT DO NOTHING and picked up by the second lookup.
+        """
+        values = normalize_delivery_info(delivery_info)
+        content_hash = delivery_info_hash(values)
+        lookup = db.query(DeliveryInfo.id).filter(
+            DeliveryInfo.user_id == user_id, DeliveryInfo.content_hash == content_hash
+        )
+        existing_id = lookup.scalar()
+        if existing_id is not None:
+            return existing_id
+        stmt = dialect_insert(db, DeliveryInfo).values(
+            user_id=user_id, content_hash=content_hash, created_at=datetime.utcnow(), **values
+        ).on_conflict_do_nothing(index_elements=[DeliveryInfo.user_id, DeliveryInfo.content_hash])
+        inserted_id = db.execute(stmt.returning(DeliveryInfo.id)).scalar()
+        return inserted_id if inserted_id is not None else lookup.scalar()
+
+    def list_for_user(self, db: Session, user_id: int) -> List[DeliveryInfo]:
+        """The user's saved addresses, newest first."""
+        return db.query(DeliveryInfo)\
+                 .filter(DeliveryInfo.user_id == user_id)\
+                 .order_by(DeliveryInfo.id.desc())\
+                 .all()
 
     def get_by_id(self, db: Session, id: int):
         return db.query(DeliveryInfo).filter(DeliveryInfo.id == id).first()
 
 class OrderRepository:
-    # Add user_id parameter to create method
-    def create(self, db: Session, order: OrderCreate, delivery_info_id: int, user_id: int):
+    def create_with_items(
+        self, db: Session, user_id: int, delivery_info_id: int, lines: List[Dict],
+        subtotal: float, shipping_fee: float
+    ) -> Order:
+        """
+        Inserts the order and all its lines (one multi-row INSERT) without committing.
+        `lines` are dicts with prod_id, quantity, unit_price and line_total.
+        """
         db_order = Order(
-            user_id=user_id, # <-- Assign user_id
+            user_id=user_id,
             delivery_info_id=delivery_info_id,
-            subtotal=order.subtotal,
-            shipping_fee=order.shipping_fee,
-            total=order.total,
-            payment_method="cash_on_delivery" # Or determine based on flow
-            # status will use default
-            # created_at will use default
+            subtotal=subtotal,
+            shipping_fee=shipping_fee,
+            total=round(subtotal + shipping_fee, 2),
+            payment_method="cash_on_delivery",
         )
         db.add(db_order)
-        db.commit()
-        db.refresh(db_order)
+        db.flush()
+        db.execute(insert(OrderItem), [
+            {"order_id": db_order.id, "order_created_at": db_order.created_at, **line} for line in lines
+        ])
         return db_order
 
     def get_by_id(self, db: Session, id: int):
         # Consider filtering by user_id here too for security if needed
         return db.query(Order).filter(Order.id == id).first()
 
+    def bulk_set_status(self, db: Session, order_ids: List[int], new_status: str, from_statuses: List[str]):
+        """
+        Moves every listed order whose current status is in from_statuses to new_status, without
+        committing: one SELECT ... FOR UPDATE (in id order, so overlapping batches can't deadlock)
+        reads the previous statuses the rollups need, then one UPDATE ... RETURNING applies them all.
+        Returns rows of (id, user_id, old_status, created_at, total) for the orders actually changed.
+        """
+        previous = db.execute(
+            select(Order.id, Order.user_id, Order.status, Order.created_at, Order.total)
+            .where(id_in(db, Order.id, order_ids), Order.status.in_(from_statuses))
+            .order_by(Order.id)
+            .with_for_update()
+        ).all()
+        if not previous:
+            return []
+        changed_ids = set(db.execute(
+            update(Order)
+            .where(id_in(db, Order.id, [row.id for row in previous]), Order.status.in_(from_statuses))
+            .values(status=new_status)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        return [
+            SimpleNamespace(id=row.id, user_id=row.user_id, old_status=row.status, created_at=row.created_at, total=row.total)
+            for row in previous if row.id in changed_ids
+        ]
+
+    def get_statuses(self, db: Session, order_ids: List[int]) -> Dict[int, str]:
+        """{order_id: status} for the ids that exist."""
+        return dict(db.execute(select(Order.id, Order.status).where(id_in(db, Order.id, order_ids))).all())
+
+    def list_orders(
+        self, db: Session, limit: int, cursor: Optional[str] = None, user_id: Optional[int] = None,
+        status: Optional[str] = None, created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+    ) -> Tuple[List[Order], Optional[str]]:
+        """
+        One page of orders, newest first, by keyset pagination on (created_at, id): the cursor
+        is the last row of the previous page, so every page is an index range scan of `limit`
+        rows however deep it is (ix_orders_user_created / ix_orders_status_created).
+        created_to is exclusive. Returns (orders, next_cursor or None on the last page).
+        """
+        query = db.query(Order).options(selectinload(Order.items))
+        if user_id is not None:
+            query = query.filter(Order.user_id == user_id)
+        if status is not None:
+            query = query.filter(Order.status == status)
+        if created_from is not None:
+            query = query.filter(Order.created_at >= created_from)
+        if created_to is not None:
+            query = query.filter(Order.created_at < created_to)
+        if cursor:
+            query = query.filter(tuple_(Order.created_at, Order.id) < tuple_(*decode_cursor(cursor)))
+        orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+        if len(orders) > limit:
+            orders = orders[:limit]
+            return orders, encode_cursor(orders[-1])
+        return orders, None
+
     # --- ADDED: Method to fetch orders for a specific user ---
-    def list_orders_by_user(self, db: Session, user_id: int) -> List[Order]:
-        """Fetches all orders associated with a specific user ID, ordered by creation date."""
+    def list_orders_by_user(
+        self, db: Session, user_id: int, limit: int, cursor: Optional[str] = None, **filters
+    ) -> Tuple[List[Order], Optional[str]]:
+        """One page of a user's orders (see list_orders)."""
         print(f"Repository: Fetching orders for user_id={user_id}")
-        return db.query(Order)\
-                 .filter(Order.user_id == user_id)\
-                 .order_by(Order.created_at.desc())\
-                 .all()
-    # ------------------------------------------------------
\ No newline at end of file
+        return self.list_orders(db, limit, cursor=cursor, user_id=user_id, **filters)
+    # ------------------------------------------------------
+
+
+ROLLUP_REBUILD_CHUNK = 1000 # Rows per multi-row upsert when rebuilding (keeps bind parameters well under limits)
+
+# (day, status, order count delta, revenue delta)
+RollupDelta = Tuple[date, str, int, float]
+
+class OrderRollupRepository:
+    """
+    Sales rollups: order_daily_rollups (UTC day of creation x current status) and
+    order_status_rollups (all time x current status). Writers call the record_* methods inside
+    their own transaction, so the rollups commit or roll back together with the orders.
+    """
+
+    def record_order_created(self, db: Session, order: Order):
+        self.apply_deltas(db, [(order.created_at.date(), order.status, 1, order.total)])
+
+    def record_status_change(self, db: Session, order: Order, old_status: str):
+        """Moves the order from old_status to its current status in both rollups."""
+        self.record_status_changes(db, [(order.created_at, order.total, old_status)], order.status)
+
+    def record_status_changes(self, db: Session, changes: Iterable[Tuple[datetime, float, str]], new_status: str):
+        """Batch form: (created_at, total, old_status) per order moved to new_status, one upsert per table."""
+        deltas = []
+        for created_at, total, old_status in changes:
+            deltas.append((created_at.date(), old_status, -1, -total))
+            deltas.append((created_at.date(), new_status, 1, total))
+        self.apply_deltas(db, deltas)
+
+    def apply_deltas(self, db: Session, deltas: Iterable[RollupDelta]):
+        """
+        Adds the deltas with one multi-row upsert per table, without committing. Keys are
+        merged and sorted first so concurrent writers lock rollup rows in the same order.
+        Call it as late as possible in the transaction: the touched rows stay locked until commit.
+        """
+        by_day = defaultdict(lambda: [0, 0.0])
+        by_status = defaultdict(lambda: [0, 0.0])
+        for day, status, count, revenue in deltas:
+            for bucket in (by_day[(day, status)], by_status[status]):
+                bucket[0] += count
+                bucket[1] += revenue
+        if not by_day:
+            return
+        daily = dialect_insert(db, OrderDailyRollup).values([
+            {"day": day, "status": status, "order_count": count, "revenue": round(revenue, 2)}
+            for (day, status), (count, revenue) in sorted(by_day.items())
+        ])
+        db.execute(daily.on_conflict_do_update(
+            index_elements=[OrderDailyRollup.day, OrderDailyRollup.status],
+            set_={
+                "order_count": OrderDailyRollup.order_count + daily.excluded.order_count,
+                "revenue": OrderDailyRollup.revenue + daily.excluded.revenue,
+            },
+        ))
+        totals = dialect_insert(db, OrderStatusRollup).values([
+            {"status": status, "order_count": count, "revenue": round(revenue, 2)}
+            for status, (count, revenue) in sorted(by_status.items())
+        ])
+        db.execute(totals.on_conflict_do_update(
+            index_elements=[OrderStatusRollup.status],
+            set_={
+                "order_count": OrderStatusRollup.order_count + totals.excluded.order_count,
+                "revenue": OrderStatusRollup.revenue + totals.excluded.revenue,
+            },
+        ))
+
+    def get_status_totals(self, db: Session) -> List[OrderStatusRollup]:
+        """One row per status ever seen (a handful of rows, whatever the order volume)."""
+        return db.query(OrderStatusRollup).order_by(OrderStatusRollup.status).all()
+
+    def get_daily_totals(self, db: Session, start: date, end: date, status: Optional[str] = None):
+        """(day, order_count, revenue) for days in [start, end] that have orders, via the (day, status) key."""
+        query = db.query(
+            OrderDailyRollup.day,
+            func.sum(OrderDailyRollup.order_count).label("order_count"),
+            func.sum(OrderDailyRollup.revenue).label("revenue"),
+        ).filter(OrderDailyRollup.day >= start, OrderDailyRollup.day <= end)
+        if status is not None:
+            query = query.filter(OrderDailyRollup.status == status)
+        return query.group_by(OrderDailyRollup.day).order_by(OrderDailyRollup.day).all()
+
+    def rebuild(self, db: Session) -> int:
+        """
+        Recomputes the rollups from `orders` (one GROUP BY scan) without committing. Daily rows
+        are replaced from the first day still in `orders`; earlier days (archived partitions,
+        see partitioning.py) are kept, and the status totals are re-summed from the daily rows.
+        On PostgreSQL the rollup tables are locked first so checkouts and status changes wait
+        for the rebuild instead of landing in rows it is about to overwrite.
+        Returns the number of daily rows written.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text("LOCK TABLE order_daily_rollups, order_status_rollups IN EXCLUSIVE MODE"))
+        day_expr = func.date(Order.created_at)
+        rows = db.query(
+            day_expr, Order.status, func.count(Order.id), func.coalesce(func.sum(Order.total), 0.0)
+        ).group_by(day_expr, Order.status).all()
+        # func.date returns a string on SQLite and a date on PostgreSQL
+        deltas = [
+            (day if isinstance(day, date) else date.fromisoformat(day), status, count, revenue)
+            for day, status, count, revenue in rows
+        ]
+        if deltas:
+            db.execute(delete(OrderDailyRollup).where(OrderDailyRollup.day >= min(d[0] for d in deltas)))
+        for i in range(0, len(deltas), ROLLUP_REBUILD_CHUNK):
+            self.apply_deltas(db, deltas[i:i + ROLLUP_REBUILD_CHUNK])
+        db.execute(delete(OrderStatusRollup))
+        db.execute(insert(OrderStatusRollup).from_select(
+            ["status", "order_count", "revenue"],
+            select(
+                OrderDailyRollup.status,
+                func.sum(OrderDailyRollup.order_count),
+                func.sum(OrderDailyRollup.revenue),
+            ).group_by(OrderDailyRollup.status),
+        ))
+        return len(deltas)
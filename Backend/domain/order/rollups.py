@@ -0,0 +1,39 @@
+# domain/order/rollups.py
+# Backfill / repair for the sales rollups. Run from the Backend directory:
+#     python -m domain.order.rollups
+import logging
+
+from config import db as db_config
+from .models import OrderDailyRollup, OrderStatusRollup
+from .repository import OrderRollupRepository
+
+logger = logging.getLogger(__name__)
+
+rollup_repository = OrderRollupRepository()
+
+def backfill_order_rollups() -> int:
+    """
+    Creates the rollup tables if needed and rebuilds them from `orders` in one transaction.
+    Safe to re-run at any time (e.g. after editing orders by hand); returns daily rows written.
+    """
+    if db_config.SessionLocal is None:
+        logger.error("Rollup backfill: database session factory is not available.")
+        return 0
+    db_config.Base.metadata.create_all(
+        bind=db_config.engine, tables=[OrderDailyRollup.__table__, OrderStatusRollup.__table__]
+    )
+    db = db_config.SessionLocal()
+    try:
+        written = rollup_repository.rebuild(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info(f"Rollup backfill: wrote {written} daily rollup row(s).")
+    return written
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    backfill_order_rollups()
@@ -1,7 +1,7 @@
 # File: domain/order/schemas.py
-from pydantic import BaseModel, EmailStr, ConfigDict # Import ConfigDict for V2
-from datetime import datetime
-from typing import Optional # Import Optional if updated_at can be null
+from pydantic import BaseModel, EmailStr, ConfigDict, Field # Import ConfigDict for V2
+from datetime import date, datetime
+from typing import Optional, List # Import Optional if updated_at can be null
 
 # --- Base Schemas (Common fields) ---
 
@@ -23,9 +23,11 @@ class DeliveryInfoCreate(DeliveryInfoBase):
 
 class OrderCreate(BaseModel):
     delivery_info: DeliveryInfoCreate
-    subtotal: float
-    shipping_fee: float
-    total: float
+    # Ignored: the order is built from the user's cart and priced server-side at checkout.
+    # Still accepted so older clients keep working.
+    subtotal: Optional[float] = None
+    shipping_fee: Optional[float] = None
+    total: Optional[float] = None
 
 # --- Schemas for Responding to Client ---
 
@@ -36,6 +38,15 @@ class DeliveryInfoResponse(DeliveryInfoBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class OrderItemResponse(BaseModel):
+    prod_id: int
+    quantity: int
+    unit_price: float
+    line_total: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class OrderResponse(BaseModel):
     id: int
     delivery_info_id: int
@@ -49,7 +60,47 @@ class OrderResponse(BaseModel):
 
     # You might also want to add user_id if relevant for the response
     user_id: int
+    items: List[OrderItemResponse] = []
 
     model_config = ConfigDict(from_attributes=True)
 
-    
\ No newline at end of file
+
+class OrderPage(BaseModel):
+    items: List[OrderResponse]
+    # Opaque; pass back as ?cursor= for the next (older) page. None on the last page.
+    next_cursor: Optional[str] = None
+
+
+# --- Sales analytics (from the rollup tables) ---
+class SalesFigures(BaseModel):
+    order_count: int
+    revenue: float
+    average_order_value: float
+
+class SalesTotals(SalesFigures):
+    status: str
+
+class SalesKpis(SalesFigures):
+    by_status: List[SalesTotals]
+
+class DailySales(SalesFigures):
+    day: date
+
+
+# --- Bulk status transitions ---
+ORDER_STATUS_BULK_MAX = 10000
+
+class OrderStatusBulkUpdate(BaseModel):
+    order_ids: List[int] = Field(min_length=1, max_length=ORDER_STATUS_BULK_MAX)
+    status: str
+
+class OrderStatusRejection(BaseModel):
+    order_id: int
+    current_status: str
+
+class OrderStatusBulkResult(BaseModel):
+    status: str
+    updated: List[int]
+    already_in_status: List[int] = []
+    invalid_transition: List[OrderStatusRejection] = [] # Current status can't move to the target
+    not_found: List[int] = []
@@ -1,12 +1,17 @@
 # File: domain/order/service.py
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from typing import List # Import List
+from typing import List, Optional, Tuple # Import List
 # Use relative imports
 # Import only schemas needed for method signatures/return types if not converting here
-from .schemas import OrderCreate
+from .schemas import OrderCreate, SalesKpis, SalesTotals, DailySales, OrderStatusBulkResult, OrderStatusRejection
 # Import models for type hints and returning instances
 from .models import Order as OrderModel, DeliveryInfo as DeliveryInfoModel
-from .repository import DeliveryInfoRepository, OrderRepository
+from .repository import DeliveryInfoRepository, OrderRepository, OrderRollupRepository
+from .events import queue_status_changes
+from config.settings import settings
+from domain.cart.repository import CartRepository
+from domain.inventory.repository import InventoryRepository, ReservationRepository
 
 
 class OrderService:
@@ -14,34 +19,163 @@ class OrderService:
         self.db = db
         self.delivery_info_repo = DeliveryInfoRepository()
         self.order_repo = OrderRepository()
+        self.rollup_repo = OrderRollupRepository()
+        self.cart_repo = CartRepository()
+        self.inventory_repo = InventoryRepository()
+        self.reservation_repo = ReservationRepository()
 
-    # Update create_order signature and implementation
     def create_order(self, order_data: OrderCreate, user_id: int) -> OrderModel:
-        """Creates DeliveryInfo and Order records, returning the Order model instance."""
-        print(f"Service: Creating order for user_id={user_id}")
-        # 1. Create delivery info
-        db_delivery_info: DeliveryInfoModel = self.delivery_info_repo.create(
-            self.db, order_data.delivery_info
-        )
-        if not db_delivery_info:
-             raise ValueError("Failed to create delivery information.")
+        """
+        Checks out the user's cart in ONE transaction:
+          1. lock the cart rows and price them from products (client totals are ignored)
+          2. release the user's holds (reservations, then inventory: the sweeper's lock order)
+          3. lock the inventory rows in prod_id order (deterministic, so checkouts can't deadlock)
+             and decrement stock with one conditional UPDATE; sharded products are taken from
+             one shard each, locking only that shard
+          4. reuse the user's saved address (insert only if new), insert the order and all order_items in bulk
+          5. clear the cart and add the order to the sales rollups, then commit once
+        Raises ValueError (nothing written) if the cart is empty or any line is short on stock.
+        """
+        print(f"Service: Checking out cart for user_id={user_id}")
+        db = self.db
+        try:
+            lines = self.cart_repo.lock_checkout_lines(db, user_id)
+            if not lines:
+                raise ValueError("Your cart is empty.")
+            quantities = {line.prod_id: line.quantity for line in lines}
 
-        # 2. Create order with reference to delivery info ID and user ID
-        db_order: OrderModel = self.order_repo.create(
-            self.db, order_data, db_delivery_info.id, user_id=user_id
-        )
-        if not db_order:
-             raise ValueError("Failed to create order record.")
+            self.reservation_repo.release_all_for_user(db, user_id, commit=False)
+            self.inventory_repo.lock_stock_levels(db, sorted(quantities), include_sharded=False)
+            if self.inventory_repo.decrement_stock_bulk(db, quantities, commit=False) is None:
+                db.rollback()
+                raise ValueError(self._shortage_message(user_id))
+
+            order_lines = [
+                {
+                    "prod_id": line.prod_id,
+                    "quantity": line.quantity,
+                    "unit_price": line.price,
+                    "line_total": round(line.price * line.quantity, 2),
+                }
+                for line in lines
+            ]
+            subtotal = round(sum(line["line_total"] for line in order_lines), 2)
+            shipping_fee = settings.SHIPPING_FEE if subtotal > 0 else 0.0
+
+            delivery_info_id = self.delivery_info_repo.get_or_create_for_user(
+                db, user_id, order_data.delivery_info
+            )
+            db_order: OrderModel = self.order_repo.create_with_items(
+                db, user_id, delivery_info_id, order_lines, subtotal, shipping_fee
+            )
+            self.cart_repo.clear_user_cart(db, user_id, commit=False)
+            self.rollup_repo.record_order_created(db, db_order) # Last: its rows are shared by all checkouts
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
 
-        print(f"Service: Order {db_order.id} created successfully.")
-        # 3. Return the SQLAlchemy model instance
+        db.refresh(db_order)
+        print(f"Service: Order {db_order.id} created with {len(order_lines)} line(s), total {db_order.total}.")
         return db_order
 
+    def bulk_update_status(self, order_ids: List[int], new_status: str, from_statuses: List[str]) -> OrderStatusBulkResult:
+        """
+        Applies one status transition to many orders in one transaction: a single UPDATE for
+        every order currently in one of from_statuses, plus one batched rollup update.
+        Orders it didn't change are reported by reason; they don't fail the batch.
+        """
+        db = self.db
+        order_ids = sorted(set(order_ids))
+        try:
+            changed = self.order_repo.bulk_set_status(db, order_ids, new_status, from_statuses)
+            self.rollup_repo.record_status_changes(
+                db, [(row.created_at, row.total, row.old_status) for row in changed], new_status
+            )
+            queue_status_changes(db, new_status, [(row.id, row.user_id) for row in changed])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        updated = sorted(row.id for row in changed)
+        updated_set = set(updated)
+        remaining = [order_id for order_id in order_ids if order_id not in updated_set]
+        current = self.order_repo.get_statuses(db, remaining) if remaining else {}
+        print(f"Service: Bulk status '{new_status}': {len(updated)} updated, {len(remaining)} skipped.")
+        return OrderStatusBulkResult(
+            status=new_status,
+            updated=updated,
+            already_in_status=[i for i in remaining if current.get(i) == new_status],
+            invalid_transition=[
+                OrderStatusRejection(order_id=i, current_status=current[i] or "unknown")
+                for i in remaining if i in current and current[i] != new_status
+            ],
+            not_found=[i for i in remaining if i not in current],
+        )
+
+    def get_saved_addresses(self, user_id: int) -> List[DeliveryInfoModel]:
+        """Distinct delivery addresses the user has checked out with, newest first."""
+        return self.delivery_info_repo.list_for_user(self.db, user_id)
+
+    def _shortage_message(self, user_id: int) -> str:
+        """Names the cart lines that can no longer be fulfilled (failure path only)."""
+        short = [
+            f"{row.Product.name} ({max(row.available_stock, 0)} available, {row.quantity} in cart)"
+            for row in self.cart_repo.get_cart_with_totals(self.db, user_id)
+            if row.available_stock < row.quantity
+        ]
+        if not short:
+            return "Stock changed during checkout. No order was placed; please try again."
+        return f"Insufficient stock: {', '.join(short)}. No order was placed."
+
     # --- ADDED: Method to get order history ---
-    def get_order_history(self, user_id: int) -> List[OrderModel]:
-        """Gets the order history for a given user, returning a list of Order model instances."""
+    def get_order_history(
+        self, user_id: int, limit: int, cursor: Optional[str] = None, **filters
+    ) -> Tuple[List[OrderModel], Optional[str]]:
+        """Gets one page of a user's order history: (orders, next_cursor)."""
         print(f"Service: Getting order history for user_id={user_id}")
-        orders = self.order_repo.list_orders_by_user(self.db, user_id=user_id)
+        orders, next_cursor = self.order_repo.list_orders_by_user(self.db, user_id, limit, cursor=cursor, **filters)
         print(f"Service: Found {len(orders)} orders for user_id={user_id}")
-        return orders
-    # -----------------------------------------
\ No newline at end of file
+        return orders, next_cursor
+
+    def list_orders(self, limit: int, cursor: Optional[str] = None, **filters) -> Tuple[List[OrderModel], Optional[str]]:
+        """Gets one page of all orders (admin): (orders, next_cursor)."""
+        return self.order_repo.list_orders(self.db, limit, cursor=cursor, **filters)
+    # -----------------------------------------
+
+    # --- Sales analytics (served from the rollup tables, never from `orders`) ---
+    def get_sales_kpis(self) -> SalesKpis:
+        """All-time totals, overall and per current status."""
+        rows = [row for row in self.rollup_repo.get_status_totals(self.db) if row.order_count]
+        order_count = sum(row.order_count for row in rows)
+        revenue = sum(row.revenue for row in rows)
+        return SalesKpis(
+            **_sales_figures(order_count, revenue),
+            by_status=[
+                SalesTotals(status=row.status, **_sales_figures(row.order_count, row.revenue))
+                for row in rows
+            ],
+        )
+
+    def get_daily_sales(self, days: int, status: Optional[str] = None) -> List[DailySales]:
+        """One point per UTC day for the last `days` days (today included), zero-filled."""
+        end = datetime.utcnow().date()
+        start = end - timedelta(days=days - 1)
+        found = {
+            row.day: row for row in self.rollup_repo.get_daily_totals(self.db, start, end, status=status)
+        }
+        series = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            row = found.get(day)
+            series.append(DailySales(day=day, **_sales_figures(row.order_count if row else 0, row.revenue if row else 0.0)))
+        return series
+
+
+def _sales_figures(order_count: int, revenue: float) -> dict:
+    return {
+        "order_count": order_count,
+        "revenue": round(revenue, 2),
+        "average_order_value": round(revenue / order_count, 2) if order_count else 0.0,
+    }
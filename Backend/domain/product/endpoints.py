@@ -92,6 +92,42 @@ def read_products(
     products = prod_service.get_all_products(db, skip=skip, limit=limit)
     return products
 
+@router.get(
+    "/with-stock", # Declared before "/{product_id}" so it is not captured by the path parameter
+    response_model=List[schemas.ProductWithStock],
+    summary="Retrieve products with stock",
+    description="Gets a page of products with their stock levels, loaded with a single joined query."
+)
+def read_products_with_stock(
+    skip: int = Query(0, ge=0, description="Number of product records to skip"),
+    limit: int = Query(100, ge=1, le=500, description="Maximum number of product records to return"),
+    db: Session = Depends(get_db),
+    prod_service: service.ProductService = Depends(get_product_service)
+):
+    """
+    Catalog read model for the admin dashboard and storefront.
+    - Replaces separate /products/ and /inventory/ calls joined in the browser.
+    - Products without an inventory record report a stock of 0. Read-only.
+    """
+    return prod_service.get_all_products_with_stock(db, skip=skip, limit=limit)
+
+@router.get(
+    "/{product_id}/with-stock",
+    response_model=schemas.ProductWithStock,
+    summary="Retrieve a single product with stock",
+    description="Gets a product's details and stock level in a single joined query."
+)
+def read_product_with_stock(
+    product_id: int,
+    db: Session = Depends(get_db),
+    prod_service: service.ProductService = Depends(get_product_service)
+):
+    """
+    Product detail read model.
+    - Raises 404 if the product is not found. Read-only.
+    """
+    return prod_service.get_product_with_stock(db, product_id=product_id)
+
 @router.get(
     "/{product_id}", # Path relative to prefix -> final path is /products/{product_id}
     response_model=schemas.ProductRead,
@@ -21,4 +21,6 @@ class Product(Base):
     inventory_item = relationship("Inventory", back_populates="product", uselist=False, cascade="all, delete-orphan")
 
 Index("ix_product_name", Product.name)
-Index("ix_product_category", Product.category)
\ No newline at end of file
+Index("ix_product_category", Product.category)
+# Prefix index for category subtree listings (`category LIKE 'A > B > %'`) on Postgres
+Index("ix_product_category_prefix", Product.category, postgresql_ops={"category": "text_pattern_ops"})
\ No newline at end of file
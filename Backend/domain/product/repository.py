@@ -1,15 +1,52 @@
 # app/product/repository.py
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import func
+from typing import List, Optional, Set, Tuple
 from . import models, schemas
+from domain.category.models import Category
+from domain.category.repository import CategoryRepository
 import time # <--- Import time
 
+# Category counters are updated in the same transaction as the product write
+category_repository = CategoryRepository()
+
+def _is_in_stock(db_product: models.Product) -> bool:
+    inventory = db_product.inventory_item
+    return bool(inventory is not None and inventory.stock and inventory.stock > 0)
+
 class ProductRepository:
 
     def get_product(self, db: Session, product_id: int) -> Optional[models.Product]:
         """Fetches a single product by its ID."""
         return db.query(models.Product).filter(models.Product.id == product_id).first()
 
+    def get_existing_ids(self, db: Session, product_ids: List[int]) -> Set[int]:
+        """Returns the subset of `product_ids` that exist, in one query."""
+        rows = db.query(models.Product.id).filter(models.Product.id.in_(product_ids)).all()
+        return {row[0] for row in rows}
+
+    def _with_stock_query(self, db: Session):
+        """Product rows LEFT JOINed to their inventory (stock/reserved default to 0, the threshold to None)."""
+        from domain.inventory.models import Inventory, reserved_units, stock_on_hand # Local import: inventory imports product models
+        return db.query(
+            models.Product,
+            func.coalesce(stock_on_hand(), 0).label("stock"),
+            func.coalesce(reserved_units(), 0).label("reserved"),
+            Inventory.reorder_threshold,
+        ).outerjoin(Inventory, Inventory.prod_id == models.Product.id)
+
+    def get_product_with_stock(self, db: Session, product_id: int) -> Optional[Tuple[models.Product, int, int, Optional[int]]]:
+        """Fetches (product, stock, reserved, reorder threshold) in one read-only query, or None if the product doesn't exist."""
+        row = self._with_stock_query(db).filter(models.Product.id == product_id).first()
+        return tuple(row) if row else None
+
+    def get_products_with_stock(self, db: Session, skip: int = 0, limit: int = 100) -> List[Tuple[models.Product, int, int, Optional[int]]]:
+        """Fetches a page of (product, stock, reserved, reorder threshold) rows in one read-only query."""
+        return [
+            tuple(row)
+            for row in self._with_stock_query(db).order_by(models.Product.id).offset(skip).limit(limit).all()
+        ]
+
     def get_products(self, db: Session, skip: int = 0, limit: int = 100) -> List[models.Product]:
         """Fetches a list of products with pagination."""
         return db.query(models.Product).offset(skip).limit(limit).all()
@@ -25,7 +62,7 @@ class ProductRepository:
             description=product.description,
             price=product.price,
             image_url=image_url_str,
-            category=product.category,
+            category=Category.normalize_path(product.category),
             specifications=product.specifications,
             features=product.features
         )
@@ -36,6 +73,8 @@ class ProductRepository:
         add_end_time = time.time()
         print(f"[{add_end_time:.4f}] Repo: After db.add(). Duration: {add_end_time - add_start_time:.4f}s") # <--- Log after add
 
+        category_repository.adjust_counts(db, db_product.category, product_delta=1)
+
         commit_start_time = time.time()
         print(f"[{commit_start_time:.4f}] Repo: Before db.commit()") # <--- Log before commit
         db.commit()
@@ -63,6 +102,15 @@ class ProductRepository:
 
         update_data = product_update.model_dump(exclude_unset=True) # Pydantic V2
 
+        if "category" in update_data:
+            update_data["category"] = Category.normalize_path(update_data["category"])
+            old_category = db_product.category
+            if update_data["category"] != old_category:
+                # Move this product's contribution from the old subtree to the new one
+                in_stock = 1 if _is_in_stock(db_product) else 0
+                category_repository.adjust_counts(db, old_category, product_delta=-1, in_stock_delta=-in_stock)
+                category_repository.adjust_counts(db, update_data["category"], product_delta=1, in_stock_delta=in_stock)
+
         for key, value in update_data.items():
             if key == "image_url" and value is not None:
                 value = str(value)
@@ -78,6 +126,10 @@ class ProductRepository:
          # (Optional: Add similar timing logs here if needed for deletes)
         db_product = self.get_product(db, product_id)
         if db_product:
+            category_repository.adjust_counts(
+                db, db_product.category,
+                product_delta=-1, in_stock_delta=-1 if _is_in_stock(db_product) else 0
+            )
             db.delete(db_product)
             db.commit()
             return db_product
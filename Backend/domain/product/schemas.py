@@ -32,4 +32,10 @@ class ProductRead(ProductBase):
     id: int = Field(..., example=1)
 
     class Config:
-        from_attributes = True # Pydantic V2 (use orm_mode = True for V1)
\ No newline at end of file
+        from_attributes = True # Pydantic V2 (use orm_mode = True for V1)
+
+# Read model: product fields plus stock, loaded with a single LEFT JOIN on inventory
+class ProductWithStock(ProductRead):
+    stock: int = Field(0, example=50, description="Units on hand (0 if no inventory record)")
+    reserved: int = Field(0, example=5, description="Units held by cart reservations")
+    available_stock: int = Field(0, example=45, description="Units that can still be added to a cart")
@@ -20,6 +20,25 @@ class ProductService:
         """Retrieves a list of all products."""
         return self.repository.get_products(db, skip=skip, limit=limit)
 
+    def _to_product_with_stock(self, product: models.Product, stock: int, reserved: int) -> schemas.ProductWithStock:
+        data = schemas.ProductRead.model_validate(product).model_dump()
+        return schemas.ProductWithStock(
+            **data, stock=stock, reserved=reserved, available_stock=max(stock - reserved, 0)
+        )
+
+    def get_product_with_stock(self, db: Session, product_id: int) -> schemas.ProductWithStock:
+        """Retrieves a product and its stock in one query, raising 404 if not found. Never writes."""
+        row = self.repository.get_product_with_stock(db, product_id)
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+        product, stock, reserved, _ = row
+        return self._to_product_with_stock(product, stock, reserved)
+
+    def get_all_products_with_stock(self, db: Session, skip: int = 0, limit: int = 100) -> List[schemas.ProductWithStock]:
+        """Retrieves a page of products with their stock in one query. Never writes."""
+        rows = self.repository.get_products_with_stock(db, skip=skip, limit=limit)
+        return [self._to_product_with_stock(product, stock, reserved) for product, stock, reserved, _ in rows]
+
     def create_new_product(self, db: Session, product: schemas.ProductCreate) -> models.Product:
         """Creates a new product."""
         # Optional: Add business logic like checking for duplicate names
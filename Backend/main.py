@@ -4,6 +4,7 @@ import logging
 from fastapi import FastAPI, APIRouter # Import APIRouter for type hinting
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import asyncio
 import importlib # Use importlib for cleaner dynamic imports
 
 # --- Setup Logging Early ---
@@ -58,6 +59,12 @@ ROUTER_CONFIGS = {
         "prefix": "/products",
         "tags": ["Products"]
     },
+    "category": {
+        "module_path": "domain.category.endpoints",
+        "router_name": "router",
+        "prefix": "/categories",
+        "tags": ["Categories"]
+    },
     "inventory": {
         "module_path": "domain.inventory.endpoint", # Check if 'endpoint' or 'endpoints'
         "router_name": "router",
@@ -70,6 +77,12 @@ ROUTER_CONFIGS = {
         "prefix": "/cart",
         "tags": ["Cart"]
     },
+    "guest_cart": {
+        "module_path": "domain.cart.endpoints",
+        "router_name": "guest_router",
+        "prefix": "/guest-cart",
+        "tags": ["Guest Cart"]
+    },
     "order": {
         "module_path": "domain.order.endpoints",
         "router_name": "router",
@@ -84,11 +97,51 @@ ROUTER_CONFIGS = {
     },
 }
 
+# --- Define Background Task Configurations ---
+# Long-running coroutines started on app startup and cancelled on shutdown.
+# Structure: 'task_key': {'module_path': str, 'coroutine_name': str}
+BACKGROUND_TASK_CONFIGS = {
+    "notification_bus": {
+        "module_path": "notification_bus",
+        "coroutine_name": "run_notification_bus",
+    },
+    "reservation_sweeper": {
+        "module_path": "domain.inventory.sweeper",
+        "coroutine_name": "run_reservation_sweeper",
+    },
+    "stock_event_publisher": {
+        "module_path": "domain.inventory.events",
+        "coroutine_name": "run_stock_event_publisher",
+    },
+    "shard_rebalancer": {
+        "module_path": "domain.inventory.rebalancer",
+        "coroutine_name": "run_shard_rebalancer",
+    },
+    "cart_store_flusher": {
+        "module_path": "domain.cart.flusher",
+        "coroutine_name": "run_cart_store_flusher",
+    },
+    "cart_purger": {
+        "module_path": "domain.cart.purger",
+        "coroutine_name": "run_cart_purger",
+    },
+    "order_event_publisher": {
+        "module_path": "domain.order.events",
+        "coroutine_name": "run_order_event_publisher",
+    },
+    "order_partition_maintainer": {
+        "module_path": "domain.order.partitioning",
+        "coroutine_name": "run_order_partition_maintainer",
+    },
+}
+background_tasks = {}
+
 # --- Attempt to Import Models Implicitly (SQLAlchemy Requirement) ---
 # SQLAlchemy needs models imported somewhere so Base knows about them before create_all
 MODEL_MODULE_PATHS = [
     "domain.authentication.models",
     "domain.product.models",
+    "domain.category.models",
     "domain.inventory.models",
     "domain.cart.models",
     "domain.order.models",
@@ -105,10 +158,29 @@ for path in MODEL_MODULE_PATHS:
         logger.error(f"Error pre-importing models module {path}: {e}", exc_info=True)
 
 
+# --- Schema Hooks ---
+# Called with the engine before create_all, in order: upgrades of tables an older version
+# created, and tables that need dialect-specific DDL (create_all skips any table a hook already created).
+# Structure: 'hook_key': {'module_path': str, 'function_name': str}
+PRE_CREATE_HOOKS = {
+    "schema_upgrade": {
+        "module_path": "config.schema_upgrade",
+        "function_name": "upgrade_existing_tables",
+    },
+    "partitioned_orders": {
+        "module_path": "domain.order.partitioning",
+        "function_name": "create_partitioned_order_tables",
+    },
+}
+
 # --- Initialize Database ---
 if config_imported and hasattr(db, 'init_db'):
     logger.info("Initializing database via config.db.init_db()...")
     try:
+        for key, config in PRE_CREATE_HOOKS.items():
+            hook_fn = getattr(importlib.import_module(config['module_path']), config['function_name'])
+            hook_fn(db.engine)
+            logger.info(f"Ran pre-create schema hook '{key}'.")
         # Log known tables *before* creating them
         known_table_names_before = list(db.Base.metadata.tables.keys())
         logger.info(f"Models known to Base.metadata before create_all: {known_table_names_before}")
@@ -213,10 +285,24 @@ async def root():
 # --- Startup and Shutdown Events ---
 @app.on_event("startup")
 async def startup_event():
+    for key, config in BACKGROUND_TASK_CONFIGS.items():
+        try:
+            module = importlib.import_module(config['module_path'])
+            coroutine_fn = getattr(module, config['coroutine_name'])
+            background_tasks[key] = asyncio.create_task(coroutine_fn(), name=key)
+            logger.info(f"Started background task '{key}' from '{config['module_path']}'.")
+        except Exception as e:
+            logger.error(f"Failed to start background task '{key}': {e}", exc_info=True)
     logger.info("Application startup complete.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    for key, task in background_tasks.items():
+        task.cancel()
+    if background_tasks:
+        await asyncio.gather(*background_tasks.values(), return_exceptions=True)
+        logger.info(f"Stopped {len(background_tasks)} background task(s).")
+        background_tasks.clear()
     logger.info("Application shutdown.")
 
 # --- Optional: Add block for running with uvicorn directly ---
@@ -233,5 +319,8 @@ if __name__ == "__main__":
         host=host,
         port=port,
         reload=reload_flag,
-        log_level=log_level_main
+        log_level=log_level_main,
+        # Keep-alive for every WebSocket is handled here, with protocol-level ping frames
+        ws_ping_interval=settings.settings.WS_PING_INTERVAL_SECONDS,
+        ws_ping_timeout=settings.settings.WS_PING_TIMEOUT_SECONDS,
     )
\ No newline at end of file
@@ -0,0 +1,226 @@
+# File: backend/notification_bus.py
+"""
+Cross-process pub/sub for WebSocket notifications.
+
+WebSockets are held by whichever API worker accepted them, so anything that wants to reach
+"every admin" or "everyone watching product 7" publishes here instead of calling the local
+ConnectionManager. Every API worker runs run_notification_bus(), which receives each
+message once and hands it to the handler registered for its kind; the built-in "broadcast"
+kind fans out to that worker's local sockets. Publishers can be other processes (e.g. the
+Kafka order consumer) that never accept a socket themselves.
+
+Transports (chosen by URL, see create_notification_bus):
+  - postgresql://...  LISTEN/NOTIFY on one channel. Payloads over NOTIFY's ~8 KB limit are
+    stored in a small UNLOGGED table and the notification carries only their id.
+  - memory://         in-process stand-in for tests and single-process SQLite setups.
+"""
+import abc
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+DEFAULT_CHANNEL = "ws_fanout"
+BROADCAST = "broadcast"
+
+class NotificationBus(abc.ABC):
+    """Base class: handler registry and dispatch. Subclasses implement _send and run."""
+
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+        self.origin = uuid.uuid4().hex[:12] # Identifies this process in envelopes (for logs)
+
+    def subscribe(self, kind: str, handler: Handler):
+        """Registers the coroutine that handles messages of this kind in this process."""
+        self._handlers[kind] = handler
+
+    async def publish(self, kind: str, payload: dict):
+        """Delivers payload to the `kind` handler of every subscribed process (this one included)."""
+        await self._send(json.dumps({"kind": kind, "origin": self.origin, "payload": payload}))
+
+    async def broadcast(self, message: str, room: str, key: Optional[str] = None):
+        """Sends a message to every socket in `room`, on every API worker (see ConnectionManager.broadcast)."""
+        await self.publish(BROADCAST, {"room": room, "message": message, "key": key})
+
+    async def _dispatch(self, raw: str):
+        try:
+            envelope = json.loads(raw)
+            handler = self._handlers.get(envelope["kind"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Notification bus: dropping malformed message: {raw[:100]}")
+            return
+        if handler is None:
+            logger.debug(f"Notification bus: no handler for kind '{envelope['kind']}' in this process.")
+            return
+        try:
+            await handler(envelope["payload"])
+        except Exception as e:
+            logger.error(f"Notification bus: handler for '{envelope['kind']}' failed: {e}", exc_info=True)
+
+    @abc.abstractmethod
+    async def _send(self, raw: str):
+        """Transmits one serialized envelope to every subscribed process."""
+
+    @abc.abstractmethod
+    async def run(self):
+        """Receives messages and dispatches them until cancelled."""
+
+
+class InMemoryNotificationBus(NotificationBus):
+    """Single-process stand-in: publish dispatches to this process's handlers via a queue."""
+
+    def __init__(self):
+        super().__init__()
+        self._queue: Optional[asyncio.Queue] = None
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def _send(self, raw: str):
+        self._get_queue().put_nowait(raw)
+
+    async def run(self):
+        queue = self._get_queue()
+        while True:
+            await self._dispatch(await queue.get())
+
+
+class PostgresNotificationBus(NotificationBus):
+    """LISTEN/NOTIFY transport. One publishing connection (shared, locked) and one listening connection."""
+
+    MAX_NOTIFY_BYTES = 7900 # NOTIFY payloads must stay under 8000 bytes
+    SPILL_TABLE = "ws_notification_spill"
+    SPILL_RETENTION_SECONDS = 300
+    RECONNECT_DELAY_SECONDS = (1, 2, 5, 10)
+
+    def __init__(self, dsn: str, channel: str = DEFAULT_CHANNEL):
+        super().__init__()
+        # SQLAlchemy URLs may name the driver ("postgresql+psycopg2://"); libpq doesn't accept that
+        self.dsn = dsn.replace("+psycopg2", "", 1)
+        self.channel = channel
+        self._publish_conn = None
+        self._publish_lock = threading.Lock() # Publishing happens on worker threads
+        self._spilled = 0
+
+    def _connect(self):
+        import psycopg2 # Only needed for this transport
+        conn = psycopg2.connect(self.dsn, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        conn.autocommit = True
+        return conn
+
+    def _ensure_spill_table(self, cursor):
+        cursor.execute(
+            f"CREATE UNLOGGED TABLE IF NOT EXISTS {self.SPILL_TABLE} ("
+            "id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, created_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+
+    def _send_blocking(self, raw: str):
+        with self._publish_lock:
+            for attempt in (1, 2): # One retry on a fresh connection if the old one died
+                try:
+                    if self._publish_conn is None or self._publish_conn.closed:
+                        self._publish_conn = self._connect()
+                    with self._publish_conn.cursor() as cursor:
+                        if len(raw.encode("utf-8")) > self.MAX_NOTIFY_BYTES:
+                            self._ensure_spill_table(cursor)
+                            cursor.execute(f"INSERT INTO {self.SPILL_TABLE} (payload) VALUES (%s) RETURNING id", (raw,))
+                            raw = f"@{cursor.fetchone()[0]}"
+                            self._spilled += 1
+                            if self._spilled % 100 == 0: # Readers had minutes to fetch older rows
+                                cursor.execute(
+                                    f"DELETE FROM {self.SPILL_TABLE} WHERE created_at < now() - make_interval(secs => %s)",
+                                    (self.SPILL_RETENTION_SECONDS,),
+                                )
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, raw))
+                    return
+                except Exception:
+                    if self._publish_conn is not None:
+                        self._publish_conn.close()
+                    self._publish_conn = None
+                    if attempt == 2:
+                        raise
+
+    async def _send(self, raw: str):
+        # psycopg2 is blocking; keep it off the event loop
+        await asyncio.to_thread(self._send_blocking, raw)
+
+    def _fetch_spilled(self, conn, spill_id: int) -> Optional[str]:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT payload FROM {self.SPILL_TABLE} WHERE id = %s", (spill_id,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        failures = 0
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.to_thread(self._connect)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                logger.info(f"Notification bus listening on PostgreSQL channel '{self.channel}'.")
+                failures = 0
+                readable = asyncio.Event()
+                fd = conn.fileno() # Kept: fileno() raises once the connection has dropped
+                loop.add_reader(fd, readable.set)
+                try:
+                    while True:
+                        await readable.wait()
+                        readable.clear()
+                        conn.poll() # Raises if the connection dropped
+                        while conn.notifies:
+                            raw = conn.notifies.pop(0).payload
+                            if raw.startswith("@"):
+                                raw = await asyncio.to_thread(self._fetch_spilled, conn, int(raw[1:]))
+                                if raw is None:
+                                    continue
+                            await self._dispatch(raw)
+                finally:
+                    loop.remove_reader(fd)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self.RECONNECT_DELAY_SECONDS[min(failures, len(self.RECONNECT_DELAY_SECONDS) - 1)]
+                failures += 1
+                logger.error(f"Notification bus listener failed ({e}); reconnecting in {delay}s. Messages sent meanwhile are missed.")
+                await asyncio.sleep(delay)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+def create_notification_bus(url: Optional[str], channel: Optional[str] = None) -> NotificationBus:
+    """postgresql://... -> LISTEN/NOTIFY; anything else (memory://, sqlite://, None) -> in-process."""
+    if url and url.startswith("postgresql"):
+        return PostgresNotificationBus(url, channel=channel or DEFAULT_CHANNEL)
+    return InMemoryNotificationBus()
+
+_bus: Optional[NotificationBus] = None
+
+def get_notification_bus() -> NotificationBus:
+    """The API process's bus: NOTIFICATION_BUS_URL, else DATABASE_URL (from config.settings)."""
+    global _bus
+    if _bus is None:
+        from config.settings import settings
+        _bus = create_notification_bus(settings.NOTIFICATION_BUS_URL or settings.DATABASE_URL, settings.NOTIFICATION_BUS_CHANNEL)
+        from websocket_manager import manager
+
+        async def _broadcast_locally(payload: dict):
+            await manager.broadcast(payload["message"], room=payload["room"], key=payload.get("key"))
+        _bus.subscribe(BROADCAST, _broadcast_locally)
+    return _bus
+
+async def run_notification_bus():
+    """Background task (every API worker): receive bus messages and fan them out locally."""
+    bus = get_notification_bus()
+    logger.info(f"Notification bus started ({type(bus).__name__}, origin {bus.origin}).")
+    await bus.run()
@@ -6,19 +6,9 @@ import time
 import asyncio # Import asyncio
 from confluent_kafka import Consumer, KafkaError, KafkaException
 
-# --- IMPORTANT ---
-# This import assumes 'run_consumer.py' and 'websocket_manager.py'
-# are structured such that this relative import works within the container.
-# If they are in different directories, adjust the import path accordingly.
-# Example: from .websocket_manager import manager (if in same directory)
-# Example: from ..websocket_manager import manager (if websocket_manager is one level up)
-# Check your '/app' directory structure inside the container.
-try:
-    # Adjust this path based on where websocket_manager.py is relative to run_consumer.py
-    from websocket_manager import manager
-except ImportError:
-    logging.critical("Failed to import 'manager' from 'websocket_manager'. Check the path and Python's import resolution.")
-    raise
+# The admin WebSockets live in the backend workers, not in this container: notifications go
+# through the shared bus (PostgreSQL LISTEN/NOTIFY) and every worker fans them out locally.
+from notification_bus import PostgresNotificationBus, create_notification_bus
 
 # --- Logging Configuration ---
 log_level_str = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -35,6 +25,12 @@ KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "kafka:9092")
 KAFKA_TOPIC = os.environ.get("KAFKA_ORDER_TOPIC", "eventicmind.public.orders")
 KAFKA_GROUP_ID = os.environ.get("KAFKA_GROUP_ID", "order-notifications-group") # Consumer group
 
+# --- Notification Bus ---
+notification_bus = create_notification_bus(
+    os.environ.get("NOTIFICATION_BUS_URL") or os.environ.get("DATABASE_URL"),
+    os.environ.get("NOTIFICATION_BUS_CHANNEL"),
+)
+
 async def process_message(msg):
     """Processes a single Kafka message."""
     try:
@@ -81,9 +77,9 @@ async def process_message(msg):
                 }
                 notification_json = json.dumps(notification)
 
-                # --- Broadcast via WebSocket Manager ---
-                # manager is the shared instance imported from websocket_manager.py
-                await manager.broadcast(notification_json, room="admin_notifications")
+                # --- Publish to the backend workers' admin sockets ---
+                # Keyed by order: the admin room coalesces frames and keeps only an order's latest event
+                await notification_bus.broadcast(notification_json, room="admin_notifications", key=f"order:{order_id}")
                 logger.info(f"Broadcasted notification for new order {order_id}")
 
             else:
@@ -105,6 +101,9 @@ async def run_consumer():
     logger.info(f"  Broker: {KAFKA_BROKER}")
     logger.info(f"  Topic: {KAFKA_TOPIC}")
     logger.info(f"  Group ID: {KAFKA_GROUP_ID}")
+    logger.info(f"  Notification bus: {type(notification_bus).__name__}")
+    if not isinstance(notification_bus, PostgresNotificationBus):
+        logger.warning("NOTIFICATION_BUS_URL / DATABASE_URL is not PostgreSQL: notifications will not reach the backend workers.")
 
     conf = {
         'bootstrap.servers': KAFKA_BROKER,
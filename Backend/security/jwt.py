@@ -49,6 +49,14 @@ def verify_token(token: str, credentials_exception) -> TokenData:
         raise credentials_exception
     return token_data
 
+def get_user_from_token(token: str, db: Session) -> Optional[UserModel]:
+    """For WebSockets (browsers can't send an Authorization header): the token's user, or None."""
+    try:
+        token_data = verify_token(token, ValueError("Could not validate credentials"))
+    except ValueError:
+        return None
+    return UserRepository(db).get_by_email(email=token_data.email)
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
@@ -1,27 +1,91 @@
 # File: backend/websocket_manager.py
+import asyncio
 import logging
-from fastapi import WebSocket
-from typing import List, Dict, Set
+from fastapi import WebSocket, status
+from typing import Awaitable, Callable, List, Dict, Optional, Set, Tuple
+
+from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
 class ConnectionManager:
-    def __init__(self):
+    """
+    Rooms of accepted WebSockets, each with its own outbound queue and writer task.
+
+    Nothing here wakes up on a timer: an idle connection is one writer task waiting on its
+    queue plus the endpoint waiting in receive_until_disconnect(). Keep-alive is done with
+    protocol-level ping frames by the server (uvicorn --ws-ping-interval/--ws-ping-timeout),
+    which also closes half-open connections; the pending receive then returns right away.
+
+    Outbound queues are bounded (WS_SEND_QUEUE_SIZE) so one slow client can't hold up a
+    broadcast or grow memory without limit. When a client's queue is full, WS_SLOW_CONSUMER_POLICY
+    decides: "evict" closes it (code 1013, the client reconnects and refetches), "drop_oldest"
+    discards its oldest queued frame, "drop_newest" discards the new one.
+
+    Rooms can be coalesced (WS_COALESCE_WINDOW_MS / WS_COALESCE_MAX_EVENTS, or coalesce()):
+    messages are held for up to the room's window, or until it has max_events pending, then
+    sent as one JSON array frame. A message broadcast with a `key` replaces any pending message
+    with the same key (e.g. the same order), so only the latest state of an entity goes out.
+    Clients of a coalesced room always receive arrays.
+    """
+
+    SLOW_CONSUMER_POLICIES = ("evict", "drop_oldest", "drop_newest")
+    CLOSE_TIMEOUT_SECONDS = 5 # An evicted client that can't even take the close frame is abandoned
+
+    def __init__(self, queue_size: Optional[int] = None, slow_consumer_policy: Optional[str] = None):
         # Store connections per "room" or topic, e.g., 'admin_notifications'
         # Using a set for faster additions/removals
         self.active_connections: Dict[str, Set[WebSocket]] = {}
-        logger.info("ConnectionManager initialized.")
+        self._rooms_by_socket: Dict[WebSocket, Set[str]] = {}
+        self._outboxes: Dict[WebSocket, asyncio.Queue] = {}
+        self._writers: Dict[WebSocket, asyncio.Task] = {}
+        self._closing: Set[asyncio.Task] = set()
+        # Coalescing: room -> (window seconds, max events); pending messages by key; flush timers
+        self._coalesce: Dict[str, Tuple[float, int]] = {}
+        self._pending: Dict[str, Dict[object, str]] = {}
+        self._flush_timers: Dict[str, asyncio.TimerHandle] = {}
+        for room, window_ms in settings.WS_COALESCE_WINDOW_MS.items():
+            self.coalesce(room, window_ms / 1000, settings.WS_COALESCE_MAX_EVENTS.get(room, 100))
+        self.queue_size = queue_size or settings.WS_SEND_QUEUE_SIZE
+        self.slow_consumer_policy = slow_consumer_policy or settings.WS_SLOW_CONSUMER_POLICY
+        if self.slow_consumer_policy not in self.SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"WS_SLOW_CONSUMER_POLICY must be one of {self.SLOW_CONSUMER_POLICIES}, got '{self.slow_consumer_policy}'.")
+        # Counters since startup (see stats())
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.evictions = 0
+        self.messages_coalesced = 0 # Messages that went out inside a shared array frame or were superseded
+        logger.info(f"ConnectionManager initialized (queue size {self.queue_size}, slow consumers: {self.slow_consumer_policy}).")
 
     async def connect(self, websocket: WebSocket, room: str = "admin_notifications"):
-        """Accepts a WebSocket connection and adds it to the specified room."""
+        """Accepts a WebSocket connection, starts its writer and adds it to the specified room."""
         await websocket.accept()
-        if room not in self.active_connections:
-            self.active_connections[room] = set()
-        self.active_connections[room].add(websocket)
+        self._outboxes[websocket] = asyncio.Queue(maxsize=self.queue_size)
+        self._writers[websocket] = asyncio.create_task(self._write(websocket), name="ws-writer")
+        self.join(websocket, room)
         logger.info(f"WebSocket connected. Total in room '{room}': {len(self.active_connections[room])}")
 
+    def join(self, websocket: WebSocket, room: str):
+        """Adds an already-accepted WebSocket to another room (one socket may watch several rooms)."""
+        self.active_connections.setdefault(room, set()).add(websocket)
+        self._rooms_by_socket.setdefault(websocket, set()).add(room)
+        logger.debug(f"WebSocket joined room '{room}'. Total in room: {len(self.active_connections[room])}")
+
+    def is_connected(self, websocket: WebSocket) -> bool:
+        """False once the WebSocket has left its last room (disconnected or evicted)."""
+        return websocket in self._rooms_by_socket
+
+    def rooms_of(self, websocket: WebSocket) -> Set[str]:
+        """Rooms the WebSocket is currently in (a copy)."""
+        return set(self._rooms_by_socket.get(websocket, ()))
+
     def disconnect(self, websocket: WebSocket, room: str = "admin_notifications"):
-        """Removes a WebSocket connection from the specified room."""
+        """Removes a WebSocket connection from the specified room; stops its writer once it's in no room."""
+        rooms = self._rooms_by_socket.get(websocket)
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                self._release(websocket)
         if room in self.active_connections:
             self.active_connections[room].discard(websocket) # Use discard to avoid errors if already removed
             logger.info(f"WebSocket disconnected. Remaining in room '{room}': {len(self.active_connections[room])}")
@@ -31,59 +95,150 @@ class ConnectionManager:
         else:
             logger.warning(f"Attempted to disconnect WebSocket from non-existent or empty room '{room}'.")
 
+    def _release(self, websocket: WebSocket):
+        del self._rooms_by_socket[websocket]
+        self._outboxes.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer is not None:
+            writer.cancel()
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        """Sends a message directly to a single WebSocket."""
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            # This often happens if the client disconnected abruptly
-            logger.warning(f"Failed to send personal message (client might have disconnected): {e}", exc_info=False)
-            # Attempt to clean up the connection if sending failed
-            # We need to know the room, which isn't directly available here.
-            # This is a limitation; disconnect is typically called from the endpoint.
-
+    async def _write(self, websocket: WebSocket):
+        """Writer task: sends queued frames in order until the connection fails or is released."""
+        outbox = self._outboxes[websocket]
+        while True:
+            message = await outbox.get()
+            try:
+                await websocket.send_text(message)
+                self.frames_sent += 1
+            except Exception as e:
+                # The endpoint's pending receive sees the close and cleans up the rooms
+                logger.warning(f"Failed to send to WebSocket (client might have disconnected): {e}", exc_info=False)
+                return
 
-    async def broadcast(self, message: str, room: str = "admin_notifications"):
-        """Broadcasts a message to all connected WebSockets in a specific room."""
-        if room in self.active_connections:
-            # Create a list to iterate over, as the set might change during iteration if disconnects happen
-            connections_to_notify = list(self.active_connections[room])
-            if not connections_to_notify:
-                logger.debug(f"No active connections in room '{room}' to broadcast to.")
+    async def receive_until_disconnect(self, websocket: WebSocket,
+                                       on_message: Optional[Callable[[str], Awaitable[None]]] = None):
+        """
+        Waits for the client to go away, passing each text frame it sends to on_message (or
+        discarding it). Endpoints await this (then disconnect in `finally`); a close, network
+        error or missed pong ends it at once.
+        """
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                logger.debug(f"WebSocket closed by client: code={message.get('code')}")
                 return
+            if on_message is not None and message.get("text") is not None:
+                await on_message(message["text"])
+
+    def _enqueue(self, message: str, websocket: WebSocket) -> bool:
+        """Queues a frame, applying the slow-consumer policy. Returns False if the socket must be evicted."""
+        outbox = self._outboxes.get(websocket)
+        if outbox is None:
+            return True
+        if outbox.full():
+            self.frames_dropped += 1
+            if self.slow_consumer_policy == "evict":
+                return False
+            if self.slow_consumer_policy == "drop_newest":
+                return True
+            outbox.get_nowait() # drop_oldest
+        outbox.put_nowait(message)
+        return True
+
+    def _evict(self, websocket: WebSocket):
+        """Removes a client that can't keep up from every room and closes it in the background."""
+        if websocket not in self._rooms_by_socket:
+            return
+        self.evictions += 1
+        dropped = self._outboxes[websocket].qsize()
+        self.frames_dropped += dropped
+        for room in list(self._rooms_by_socket[websocket]):
+            self.disconnect(websocket, room) # The last room releases the writer and the queue
+        logger.warning(f"Evicted slow WebSocket client {websocket.client} ({dropped} frame(s) discarded).")
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
 
-            logger.info(f"Broadcasting to {len(connections_to_notify)} connections in room '{room}': {message[:100]}...") # Log truncated message
-
-            # Use list comprehension for potential slight performance gain with asyncio.gather (though loop is often clearer)
-            # for connection in connections_to_notify:
-            #     try:
-            #         await connection.send_text(message)
-            #     except Exception as e:
-            #         logger.error(f"Error broadcasting to a WebSocket: {e}. Connection might be closed.", exc_info=False)
-            #         # Mark for removal or handle disconnection here if possible/needed
-            #         # Note: Modifying the set while iterating can be tricky, hence iterating a list copy
-            #         # self.disconnect(connection, room) # Careful with modifying during iteration
-
-            # Alternative using gather (can be faster for many connections, but handles errors differently)
-            import asyncio
-            results = await asyncio.gather(
-                *(connection.send_text(message) for connection in connections_to_notify),
-                return_exceptions=True # Capture exceptions instead of raising them immediately
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Client too slow"),
+                timeout=self.CLOSE_TIMEOUT_SECONDS,
             )
+        except Exception as e:
+            logger.debug(f"Closing evicted WebSocket failed: {e}")
 
-            # Process results to find failed sends (and potentially disconnect those sockets)
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    failed_socket = connections_to_notify[i]
-                    logger.error(f"Error broadcasting to a WebSocket: {result}. Removing connection.", exc_info=False)
-                    # Disconnect the socket that caused the error
-                    self.disconnect(failed_socket, room)
-        else:
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        """Queues a message for a single WebSocket (sent by its writer task)."""
+        if not self._enqueue(message, websocket):
+            self._evict(websocket)
+
+    def coalesce(self, room: str, window_seconds: float, max_events: int = 100):
+        """Batches the room's messages into array frames: at most one per window, or per max_events messages."""
+        self._coalesce[room] = (window_seconds, max_events)
+
+    async def broadcast(self, message: str, room: str = "admin_notifications", key: Optional[str] = None):
+        """
+        Queues a message (one serialized JSON value) for every WebSocket in a room; never waits
+        on a client, and the same string is shared by every queue. In a coalesced room the
+        message is buffered instead; `key` identifies the entity it describes.
+        """
+        if not self.active_connections.get(room):
             logger.debug(f"Room '{room}' does not exist for broadcasting.")
+            return
+        if room not in self._coalesce:
+            self._fanout(message, room)
+            return
+        window_seconds, max_events = self._coalesce[room]
+        pending = self._pending.setdefault(room, {})
+        if key is None:
+            key = object() # Unkeyed messages never supersede each other
+        elif pending.pop(key, None) is not None:
+            self.messages_coalesced += 1 # Superseded by this newer state
+        pending[key] = message
+        if len(pending) >= max_events:
+            self._flush_room(room)
+        elif room not in self._flush_timers:
+            self._flush_timers[room] = asyncio.get_running_loop().call_later(window_seconds, self._flush_room, room)
+
+    def _flush_room(self, room: str):
+        """Sends the room's pending messages as one array frame (joined, not re-serialized)."""
+        timer = self._flush_timers.pop(room, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(room, None)
+        if not pending or not self.active_connections.get(room):
+            return
+        if len(pending) > 1:
+            self.messages_coalesced += len(pending)
+        self._fanout("[" + ",".join(pending.values()) + "]", room)
+
+    def _fanout(self, message: str, room: str):
+        connections_to_notify = self.active_connections[room]
+        logger.debug(f"Broadcasting to {len(connections_to_notify)} connections in room '{room}': {message[:100]}...") # Log truncated message
+        too_slow = [connection for connection in connections_to_notify if not self._enqueue(message, connection)]
+        for connection in too_slow:
+            self._evict(connection)
+
+    def stats(self) -> dict:
+        """Connection and queue metrics for this worker."""
+        depths = [outbox.qsize() for outbox in self._outboxes.values()]
+        return {
+            "connections": len(self._outboxes),
+            "rooms": len(self.active_connections),
+            "queue_size": self.queue_size,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "full_queues": sum(1 for depth in depths if depth >= self.queue_size),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "evictions": self.evictions,
+            "messages_coalesced": self.messages_coalesced,
+            "pending_coalesced": sum(len(pending) for pending in self._pending.values()),
+        }
 
 
-# Create a single instance to be used across the application
-# This instance will be shared between the endpoint and the consumer
-# IF they run in the same process (as configured in docker-compose).
-manager = ConnectionManager()
\ No newline at end of file
+# Create a single instance to be used across the application.
+# Each API worker has its own; other processes reach it through notification_bus.py.
+manager = ConnectionManager()
@@ -70,6 +70,9 @@ const StatsCard = ({ title, value, icon: Icon, description }) => (
 );
 
 // Helper component for Loader inside Button or Select
+const ORDERS_PAGE_SIZE = 50;
+const SALES_TREND_DAYS = 30;
+
 const LoaderIf = ({ loading, className = "h-4 w-4 mr-2 animate-spin" }) => (
     loading ? <Loader2 className={className} /> : null
 );
@@ -77,7 +80,11 @@ const LoaderIf = ({ loading, className = "h-4 w-4 mr-2 animate-spin" }) => (
 const AdminDashboard = () => {
     // --- State Definitions ---
     const [displayUser, setDisplayUser] = useState(null);
-    const [stats, setStats] = useState({ revenue: 0, orders: 0, customers: 0, growth: 0 });
+    const [stats, setStats] = useState({ revenue: 0, orders: 0, customers: 0, growth: 0, averageOrderValue: 0 });
+    // Sales analytics come from the server-side rollups (/orders/orders/admin/stats/*), not from the order list
+    const [statusTotals, setStatusTotals] = useState([]);
+    const [dailySales, setDailySales] = useState([]);
+    const [salesLoading, setSalesLoading] = useState(true);
     const [newProductName, setNewProductName] = useState('');
     const [newProductDescription, setNewProductDescription] = useState('');
     const [newProductPrice, setNewProductPrice] = useState('');
@@ -98,6 +105,8 @@ const AdminDashboard = () => {
     const [allOrders, setAllOrders] = useState([]);
     const [allOrdersLoading, setAllOrdersLoading] = useState(true);
     const [allOrdersError, setAllOrdersError] = useState(null);
+    const [allOrdersCursor, setAllOrdersCursor] = useState(null); // next_cursor from /admin/all; null when all pages are loaded
+    const [allOrdersLoadingMore, setAllOrdersLoadingMore] = useState(false);
     const [updatingStatusOrderId, setUpdatingStatusOrderId] = useState(null);
     // --- WebSocket State ---
     const [isWsConnected, setIsWsConnected] = useState(false);
@@ -164,20 +173,16 @@ const AdminDashboard = () => {
     const fetchProductsAndInventory = useCallback(async (showToast = false) => {
         setProductLoading(true); setInventoryLoading(true); setProductError(null); setInventoryError(null);
         try {
-            const [productResponse, inventoryResponse] = await Promise.all([
-                axiosInstance.get('/products/?limit=500'),
-                axiosInstance.get('/inventory/?limit=500')
-            ]);
+            // Products and stock come back joined from a single request/query
+            const productResponse = await axiosInstance.get('/products/with-stock?limit=500');
             const fetchedProducts = productResponse.data || [];
-            const fetchedInventory = inventoryResponse.data || [];
 
             setAdminProducts(fetchedProducts);
 
-            const inventoryMap = new Map(fetchedInventory.map(item => [item.prod_id, item.stock]));
             const combinedItems = fetchedProducts.map(product => ({
                 id: product.id,
                 name: product.name,
-                stock: inventoryMap.get(product.id) ?? 0
+                stock: product.stock ?? 0
             })).sort((a, b) => a.name.localeCompare(b.name));
             setInventoryItems(combinedItems);
 
@@ -193,20 +198,23 @@ const AdminDashboard = () => {
         }
     }, []);
 
-    const fetchAllOrders = useCallback(async (showToast = false) => {
-        setAllOrdersLoading(true);
+    // Orders are paged newest first; pass the previous next_cursor to append the following page.
+    const fetchAllOrders = useCallback(async (showToast = false, cursor = null) => {
+        const isNextPage = Boolean(cursor);
+        if (isNextPage) setAllOrdersLoadingMore(true); else setAllOrdersLoading(true);
         setAllOrdersError(null);
         // Don't reset revenue here if WS updates it incrementally
         // setStats(prev => ({ ...prev, revenue: 0 }));
 
         try {
-            const response = await axiosInstance.get('/orders/orders/admin/all');
-            const ordersData = Array.isArray(response.data) ? response.data : [];
+            const response = await axiosInstance.get('/orders/orders/admin/all', {
+                params: { limit: ORDERS_PAGE_SIZE, ...(cursor ? { cursor } : {}) }
+            });
+            const ordersData = Array.isArray(response.data?.items) ? response.data.items : [];
+            setAllOrdersCursor(response.data?.next_cursor || null);
 
-            let calculatedTotalRevenue = 0;
             const processedOrders = ordersData.map(order => {
                 const orderAmount = Number(order.total || 0);
-                calculatedTotalRevenue += orderAmount;
                 const userId = order.user_id || order.user?.id || 'N/A';
 
                 return {
@@ -219,16 +227,10 @@ const AdminDashboard = () => {
                 };
             }).sort((a, b) => new Date(b.date).getTime() - new Date(a.date).getTime());
 
-            setAllOrders(processedOrders);
-            // Update stats with potentially more accurate data from full fetch
-            setStats(prev => ({
-                ...prev,
-                revenue: calculatedTotalRevenue,
-                orders: processedOrders.length
-            }));
+            setAllOrders(prev => isNextPage ? [...prev, ...processedOrders] : processedOrders);
 
             if (showToast && ordersData.length > 0) {
-                toast.success(`Refreshed ${processedOrders.length} total orders. Revenue recalculated.`);
+                toast.success(`Refreshed ${processedOrders.length} latest orders.`);
             } else if (showToast) {
                 toast.info("No orders found to refresh.");
             }
@@ -240,21 +242,49 @@ const AdminDashboard = () => {
                 : err.response?.status === 403 ? "Forbidden."
                 : err.response?.data?.detail || err.message || "Could not load orders.";
             setAllOrdersError(errorMsg);
-            setAllOrders([]);
-            setStats(prev => ({ ...prev, revenue: 0, orders: 0 })); // Reset on error
+            if (!isNextPage) { // Keep already loaded pages if only "Load more" failed
+                setAllOrders([]);
+                setAllOrdersCursor(null);
+            }
             if (showToast) toast.error(`Error loading orders: ${errorMsg}`);
         } finally {
-            setTimeout(() => setAllOrdersLoading(false), 200);
+            if (isNextPage) setAllOrdersLoadingMore(false);
+            else setTimeout(() => setAllOrdersLoading(false), 200);
+        }
+    }, []);
+
+    const fetchSalesStats = useCallback(async () => {
+        setSalesLoading(true);
+        try {
+            const [kpiResponse, dailyResponse] = await Promise.all([
+                axiosInstance.get('/orders/orders/admin/stats/kpis'),
+                axiosInstance.get('/orders/orders/admin/stats/daily', { params: { days: SALES_TREND_DAYS } }),
+            ]);
+            const kpis = kpiResponse.data || {};
+            setStats(prev => ({
+                ...prev,
+                revenue: Number(kpis.revenue || 0),
+                orders: kpis.order_count || 0,
+                averageOrderValue: Number(kpis.average_order_value || 0),
+            }));
+            setStatusTotals(Array.isArray(kpis.by_status) ? kpis.by_status : []);
+            setDailySales(Array.isArray(dailyResponse.data) ? dailyResponse.data : []);
+        } catch (err) {
+            console.error("Dashboard: Failed to fetch sales stats:", err);
+            toast.error(`Error loading sales stats: ${err.response?.data?.detail || err.message}`);
+        } finally {
+            setSalesLoading(false);
         }
     }, []);
 
     const refreshAllData = useCallback(() => {
         toast.info("Refreshing dashboard data...");
         // Fetch orders first, then products/inventory
+        fetchSalesStats();
         fetchAllOrders(true).then(() => {
             fetchProductsAndInventory(true);
         });
-    }, [fetchAllOrders, fetchProductsAndInventory]);
+    }, [fetchAllOrders, fetchProductsAndInventory, fetchSalesStats]);
 
     // --- Initial Load & Authentication Check ---
     useEffect(() => {
@@ -331,46 +361,88 @@ const AdminDashboard = () => {
 
         ws.current.onmessage = (event) => {
             console.log('WebSocket: Message received:', event.data);
+            let messages;
             try {
-                const message = JSON.parse(event.data);
+                // The admin room is coalesced server-side: a frame is an array of events (older servers sent single objects)
+                const data = JSON.parse(event.data);
+                messages = Array.isArray(data) ? data : [data];
+            } catch (error) {
+                console.error('WebSocket: Failed to parse message:', error, 'Data:', event.data);
+                toast.error("Received unreadable notification data.");
+                return;
+            }
 
+            // Apply each batch with one state update per kind, however many events it holds
+            const newOrders = [];
+            const movedStatuses = new Map(); // order id -> latest status
+            const stockLevels = new Map(); // prod id -> latest stock
+            messages.forEach(message => {
                 if (message.type === 'new_order') {
-                    toast.info(
-                        `🚀 New Order #${message.order_id} Received!`,
-                        {
-                            description: `User ID: ${message.user_id || 'N/A'}, Total: ${formatCurrency(message.total)}, Status: ${getStatusText(message.status)}`,
+                    newOrders.push(message);
+
+                } else if (message.type === 'order_status_bulk_update') {
+                    // One event per fulfillment batch (PATCH /orders/status), however many orders it moved
+                    (message.order_ids || []).forEach(id => movedStatuses.set(id, message.status));
+                    toast.info(`${message.count} order(s) moved to ${getStatusText(message.status)}.`);
+
+                } else if (message.type === 'low_stock_alert') {
+                    const label = message.name || `Product #${message.prod_id}`;
+                    if (message.state === 'low') {
+                        toast.warning(`⚠️ Low stock: ${label}`, {
+                            description: `${message.stock} left (reorder threshold ${message.reorder_threshold}).`,
                             duration: 10000,
-                        }
-                    );
-                    // Update stats immediately
-                    setStats(prev => ({
-                        ...prev,
-                        orders: prev.orders + 1,
-                        revenue: prev.revenue + (Number(message.total) || 0),
-                    }));
-                    // Optional: Refresh full list if needed
-                    // setTimeout(() => fetchAllOrders(false), 1000);
+                        });
+                    } else {
+                        toast.success(`${label} restocked`, {
+                            description: `${message.stock} in stock (above threshold ${message.reorder_threshold}).`,
+                        });
+                    }
+                    stockLevels.set(message.prod_id, message.stock);
 
                 } else if (message.type === 'status') {
                     // General status messages from backend (e.g., welcome message)
                     console.log(`WebSocket Status: ${message.message}`);
-                    // You could still use this for a connection confirmation toast if backend sends one
-                    // if (message.message === 'Admin WS Connected') {
-                    //    toast.success("Real-time notifications active.", { duration: 2000 });
-                    // }
 
                 } else if (message.type === 'ping') {
-                    // Optional: Handle keep-alive pings
-                    // console.log("WebSocket: Ping received.");
-                    // ws.current?.send('{"type": "pong"}');
-                }
-                 else {
+                    // Keep-alive is done with protocol-level ping frames now; nothing to do
+                } else {
                     console.warn("WebSocket: Received unknown message type:", message.type, message);
                 }
-
-            } catch (error) {
-                console.error('WebSocket: Failed to parse message:', error, 'Data:', event.data);
-                toast.error("Received unreadable notification data.");
+            });
+
+            const newOrdersTotal = newOrders.reduce((sum, order) => sum + (Number(order.total) || 0), 0);
+            if (newOrders.length === 1) {
+                const [order] = newOrders;
+                toast.info(
+                    `🚀 New Order #${order.order_id} Received!`,
+                    {
+                        description: `User ID: ${order.user_id || 'N/A'}, Total: ${formatCurrency(order.total)}, Status: ${getStatusText(order.status)}`,
+                        duration: 10000,
+                    }
+                );
+            } else if (newOrders.length > 1) {
+                toast.info(`🚀 ${newOrders.length} New Orders Received!`, {
+                    description: `Total: ${formatCurrency(newOrdersTotal)}`,
+                    duration: 10000,
+                });
+            }
+            if (newOrders.length > 0) {
+                // Update stats immediately
+                setStats(prev => ({
+                    ...prev,
+                    orders: prev.orders + newOrders.length,
+                    revenue: prev.revenue + newOrdersTotal,
+                }));
+            }
+            if (movedStatuses.size > 0) {
+                setAllOrders(prevOrders => prevOrders.map(order =>
+                    movedStatuses.has(order.id) ? { ...order, status: movedStatuses.get(order.id) } : order
+                ));
+            }
+            if (stockLevels.size > 0) {
+                setInventoryItems(prevItems => prevItems.map(item =>
+                    stockLevels.has(item.id) ? { ...item, stock: stockLevels.get(item.id) } : item
+                ));
             }
         };
 
@@ -596,12 +668,21 @@ const AdminDashboard = () => {
     };
 
 
-    // --- Chart Data & Configs --- (Mock Data)
-    const revenueData = [ { month: "Jan", Online: 4580, InStore: 2340 }, { month: "Feb", Online: 5950, InStore: 3100 }, { month: "Mar", Online: 5237, InStore: 2820 }, { month: "Apr", Online: 6473, InStore: 3290 }, { month: "May", Online: 7209, InStore: 3730 }, { month: "Jun", Online: 7914, InStore: 3840 }, ];
-    const orderStatusData = [ { name: "Completed", value: 187, fill: chartColors.green }, { name: "Processing", value: 125, fill: chartColors.orange }, { name: "Pending", value: 95, fill: chartColors.blue }, { name: "Cancelled", value: 43, fill: chartColors.red }, { name: "Refunded", value: 32, fill: chartColors.violet }, ];
+    // --- Chart Data & Configs --- (revenue and status from the sales rollups; the rest is mock data)
+    const revenueData = dailySales.map(point => ({
+        day: new Date(`${point.day}T00:00:00Z`).toLocaleDateString('en-US', { month: 'short', day: 'numeric', timeZone: 'UTC' }),
+        Revenue: point.revenue,
+        Orders: point.order_count,
+    }));
+    const statusColorCycle = [chartColors.blue, chartColors.orange, chartColors.green, chartColors.violet, chartColors.cyan, chartColors.red];
+    const orderStatusData = statusTotals.map((entry, index) => ({
+        name: getStatusText(entry.status),
+        value: entry.order_count,
+        fill: entry.status === 'cancelled' ? chartColors.red : statusColorCycle[index % statusColorCycle.length],
+    }));
     const topCustomersData = [ { name: "J. Smith", value: 2186, fill: chartColors.violet }, { name: "M. Garcia", value: 1905, fill: chartColors.blue }, { name: "D. Wong", value: 1837, fill: chartColors.green }, { name: "S. Johnson", value: 1673, fill: chartColors.orange }, { name: "A. Patel", value: 1509, fill: chartColors.cyan }, { name: "E. Thompson", value: 1314, fill: chartColors.red }, ];
     const newCustomersData = [ { month: "Jan", value: 46 }, { month: "Feb", value: 55 }, { month: "Mar", value: 47 }, { month: "Apr", value: 63 }, { month: "May", value: 59 }, { month: "Jun", value: 64 }, ];
-    const revenueChartConfig = { Online: { label: "Online", color: chartColors.blue }, InStore: { label: "In-store", color: chartColors.green } };
+    const revenueChartConfig = { Revenue: { label: "Revenue", color: chartColors.blue } };
     const statusChartConfig = { value: { label: "Orders" } };
     const customersChartConfig = { value: { label: "Spent" } };
     const newCustomersChartConfig = { value: { label: "New Customers" } };
@@ -611,7 +692,7 @@ const AdminDashboard = () => {
     const renderInventorySkeletons = (count = 5) => ( Array.from({ length: count }).map((_, index) => ( <TableRow key={`inv-skel-${index}`}><TableCell><Skeleton className="h-4 w-4/6" /></TableCell><TableCell className="text-center"><Skeleton className="h-4 w-12 mx-auto" /></TableCell><TableCell className="text-center"><Skeleton className="h-5 w-24 rounded-full mx-auto" /></TableCell><TableCell><div className="flex justify-center"><Skeleton className="h-9 w-40" /></div></TableCell></TableRow> )) );
 
     // --- Component Render ---
-    const anyLoading = productLoading || inventoryLoading || allOrdersLoading;
+    const anyLoading = productLoading || inventoryLoading || allOrdersLoading || salesLoading;
 
     return (
       <div className="min-h-screen bg-background pt-8 pb-16 px-4 sm:px-6 lg:px-8">
@@ -643,8 +724,8 @@ const AdminDashboard = () => {
 
           {/* Stats Cards */}
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6 mb-8">
-            <StatsCard title="Total Revenue" value={allOrdersLoading ? <Skeleton className="h-7 w-32" /> : formatCurrency(stats.revenue)} icon={DollarSign} description={allOrdersLoading ? 'Calculating...' : `From ${stats.orders} orders`} />
-            <StatsCard title="Total Orders" value={allOrdersLoading ? <Skeleton className="h-7 w-16"/> : stats.orders} icon={ShoppingBag} description={allOrdersLoading ? 'Loading...' : 'All time fetched'} />
+            <StatsCard title="Total Revenue" value={salesLoading ? <Skeleton className="h-7 w-32" /> : formatCurrency(stats.revenue)} icon={DollarSign} description={salesLoading ? 'Calculating...' : `From ${stats.orders} orders`} />
+            <StatsCard title="Total Orders" value={salesLoading ? <Skeleton className="h-7 w-16"/> : stats.orders} icon={ShoppingBag} description={salesLoading ? 'Loading...' : `All time · avg. ${formatCurrency(stats.averageOrderValue)}`} />
             <StatsCard title="Active Products" value={productLoading ? <Skeleton className="h-7 w-16"/> : adminProducts.length} icon={Boxes} description={productLoading ? 'Loading...' : `${inventoryItems.filter(item => item.stock > 0).length} in stock`} />
           </div>
 
@@ -663,17 +744,16 @@ const AdminDashboard = () => {
             <TabsContent value="overview" className="space-y-4">
                 <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
                    <Card>
-                       <CardHeader><CardTitle>Revenue Trend</CardTitle><CardDescription>Online vs In-Store (Mock)</CardDescription></CardHeader>
+                       <CardHeader><CardTitle>Revenue Trend</CardTitle><CardDescription>Daily revenue, last {SALES_TREND_DAYS} days (UTC)</CardDescription></CardHeader>
                        <CardContent className="pl-2">
                            <ChartContainer config={revenueChartConfig} className="aspect-auto h-[250px]">
                                <AreaChart accessibilityLayer data={revenueData} margin={{ top: 10, right: 10, left: -10, bottom: 0 }}>
-                                   <defs><linearGradient id="colorOnline" x1="0" y1="0" x2="0" y2="1"><stop offset="5%" stopColor={chartColors.blue} stopOpacity={0.8}/><stop offset="95%" stopColor={chartColors.blue} stopOpacity={0}/></linearGradient><linearGradient id="colorInStore" x1="0" y1="0" x2="0" y2="1"><stop offset="5%" stopColor={chartColors.green} stopOpacity={0.8}/><stop offset="95%" stopColor={chartColors.green} stopOpacity={0}/></linearGradient></defs>
+                                   <defs><linearGradient id="colorRevenue" x1="0" y1="0" x2="0" y2="1"><stop offset="5%" stopColor={chartColors.blue} stopOpacity={0.8}/><stop offset="95%" stopColor={chartColors.blue} stopOpacity={0}/></linearGradient></defs>
                                    <CartesianGrid vertical={false} strokeDasharray="3 3" stroke="hsl(var(--border))"/>
-                                   <XAxis dataKey="month" stroke="hsl(var(--muted-foreground))" fontSize={11} tickLine={false} axisLine={false} tickMargin={8}/>
+                                   <XAxis dataKey="day" stroke="hsl(var(--muted-foreground))" fontSize={11} tickLine={false} axisLine={false} tickMargin={8} minTickGap={16}/>
                                    <YAxis stroke="hsl(var(--muted-foreground))" fontSize={11} tickLine={false} axisLine={false} tickMargin={8} tickFormatter={(value) => `$${value / 1000}k`}/>
                                    <ChartTooltip cursor={{fill: 'hsl(var(--muted)/.5)'}} content={<ChartTooltipContent indicator="dot" formatter={(value) => formatCurrency(value)} />} />
-                                   <Area type="monotone" dataKey="InStore" stroke={chartColors.green} fillOpacity={0.6} fill="url(#colorInStore)" strokeWidth={2} name="In-Store"/>
-                                   <Area type="monotone" dataKey="Online" stroke={chartColors.blue} fillOpacity={0.6} fill="url(#colorOnline)" strokeWidth={2} name="Online" />
+                                   <Area type="monotone" dataKey="Revenue" stroke={chartColors.blue} fillOpacity={0.6} fill="url(#colorRevenue)" strokeWidth={2} name="Revenue" />
                                    <Legend iconType="circle" wrapperStyle={{fontSize: '12px', paddingTop: '10px'}}/>
                                </AreaChart>
                            </ChartContainer>
@@ -740,6 +820,13 @@ const AdminDashboard = () => {
                                </TableBody>
                            </Table>
                        </div>
+                       {allOrdersCursor && !allOrdersLoading && (
+                            <div className="mt-4 flex justify-center">
+                                <Button variant="outline" size="sm" onClick={() => fetchAllOrders(false, allOrdersCursor)} disabled={allOrdersLoadingMore} className="cursor-pointer">
+                                    <LoaderIf loading={allOrdersLoadingMore} /> Load more orders
+                                </Button>
+                            </div>
+                        )}
                     </CardContent>
                  </Card>
             </TabsContent>
@@ -825,7 +912,7 @@ const AdminDashboard = () => {
             {/* --- Analytics Tab --- */}
             <TabsContent value="analytics">
                 <Card>
-                    <CardHeader><CardTitle>Store Analytics</CardTitle><CardDescription>Visual summary (Mock Data)</CardDescription></CardHeader>
+                    <CardHeader><CardTitle>Store Analytics</CardTitle><CardDescription>Visual summary (status distribution is live; customer trend is mock data)</CardDescription></CardHeader>
                     <CardContent className="space-y-6">
                        <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
                           <Card className="border shadow-sm">
@@ -2,14 +2,28 @@
 import React, { createContext, useState, useEffect, useContext, useCallback, useMemo } from 'react';
 import { toast } from 'sonner';
 import axiosInstance from '../api/axiosInstance'; // Your configured axios instance
+import { useAuth } from '../contexts/AuthContext';
+
+// Guests keep their cart in a signed token issued by /guest-cart/ (merged into /cart/ at login)
+const GUEST_CART_KEY = 'guestCart';
+const guestCartConfig = () => {
+  const token = localStorage.getItem(GUEST_CART_KEY);
+  return token ? { headers: { 'X-Guest-Cart': token } } : {};
+};
+const storeGuestCartToken = (data) => {
+  if (data?.token) localStorage.setItem(GUEST_CART_KEY, data.token);
+};
 
 // Create the context
 const CartContext = createContext();
 
 // Create the provider component
 export const CartProvider = ({ children }) => {
+  const { isLoggedIn } = useAuth();
   // State managed by the context
   const [cartItems, setCartItems] = useState([]);
+  // Totals computed by the server for the items it last returned ({ items, total_cost, item_count })
+  const [serverSummary, setServerSummary] = useState(null);
   const [isLoading, setIsLoading] = useState(true); // For initial load and full clear
   const [isUpdating, setIsUpdating] = useState(false); // For individual item updates
   const [error, setError] = useState(null);
@@ -20,14 +34,24 @@ export const CartProvider = ({ children }) => {
     if (showLoading) setIsLoading(true);
     setError(null);
     try {
-      const response = await axiosInstance.get('/cart/');
+      const response = isLoggedIn
+        ? await axiosInstance.get('/cart/')
+        : await axiosInstance.get('/guest-cart/', guestCartConfig());
+      if (!isLoggedIn) storeGuestCartToken(response.data);
       console.log("Context: fetchCart - Raw GET response data:", JSON.stringify(response.data, null, 2));
       if (response.data && Array.isArray(response.data.items)) {
         console.log("Context: fetchCart - Calling setCartItems with items count:", response.data.items.length);
         setCartItems(response.data.items);
+        setServerSummary({
+          items: response.data.items,
+          total_cost: Number(response.data.total_cost) || 0,
+          item_count: Number(response.data.item_count) || 0,
+          shipping_fee: Number(response.data.shipping_fee) || 0,
+        });
       } else {
         console.warn("Context: fetchCart - Received empty/invalid data:", response.data);
         setCartItems([]);
+        setServerSummary(null);
       }
     } catch (err) {
       console.error("Context: Failed to fetch cart:", err);
@@ -37,7 +61,25 @@ export const CartProvider = ({ children }) => {
     } finally {
        if (showLoading) setIsLoading(false);
     }
-  }, []); // fetchCart is stable
+  }, [isLoggedIn]); // Re-created when the user logs in or out
+
+  // --- Batch edit: one PATCH, one transaction; the response is the whole cart (with server totals) ---
+  const applyCartOperations = useCallback(async (operations) => {
+    const response = isLoggedIn
+      ? await axiosInstance.patch('/cart/', operations)
+      : await axiosInstance.patch('/guest-cart/', operations, guestCartConfig());
+    if (!isLoggedIn) storeGuestCartToken(response.data);
+    if (response.data && Array.isArray(response.data.items)) {
+      setCartItems(response.data.items);
+      setServerSummary({
+        items: response.data.items,
+        total_cost: Number(response.data.total_cost) || 0,
+        item_count: Number(response.data.item_count) || 0,
+        shipping_fee: Number(response.data.shipping_fee) || 0,
+      });
+    }
+    return response.data;
+  }, [isLoggedIn]); // Re-created when the user logs in or out
 
   const removeFromCartAPI = useCallback(async (productId) => {
     console.log(`Context: Removing item ${productId}`);
@@ -48,7 +90,7 @@ export const CartProvider = ({ children }) => {
     setIsUpdating(true);
     setError(null);
     try {
-      await axiosInstance.delete(`/cart/${productId}`);
+      await applyCartOperations([{ op: 'remove', prod_id: productId }]);
       toast.success(`"${itemName}" removed successfully.`); // Keep success toast for individual remove
     } catch (err) {
       console.error(`Context: Failed to remove item ${productId}:`, err);
@@ -59,7 +101,7 @@ export const CartProvider = ({ children }) => {
     } finally {
       setIsUpdating(false);
     }
-  }, [cartItems]); // Depends on cartItems
+  }, [cartItems, applyCartOperations]); // Depends on cartItems
 
   const updateQuantityAPI = useCallback(async (productId, newQuantity) => {
      if (newQuantity < 1) {
@@ -82,16 +124,8 @@ export const CartProvider = ({ children }) => {
      setIsUpdating(true);
      setError(null);
      try {
-       const response = await axiosInstance.put(`/cart/${productId}`, { quantity: newQuantity });
-       // Optional: Align state more precisely if PUT response returns the updated item
-       if (response.data && typeof response.data.id !== 'undefined') {
-          console.log("Context: updateQuantityAPI - PUT Response OK, aligning state");
-          setCartItems(currentItems =>
-             currentItems.map(item => (item.id === response.data.id ? response.data : item))
-           );
-       } else {
-           console.log("Context: updateQuantityAPI - PUT Response OK (No specific item body)");
-       }
+       // PATCH returns the whole cart, so state (and totals) realign with the server
+       await applyCartOperations([{ op: 'set', prod_id: productId, quantity: newQuantity }]);
        toast.info(`Quantity for "${itemName}" updated to ${newQuantity}.`); // Keep info toast for update
      } catch (err) {
        console.error(`Context: Failed to update quantity for item ${productId}:`, err);
@@ -102,7 +136,7 @@ export const CartProvider = ({ children }) => {
      } finally {
        setIsUpdating(false);
      }
-  }, [cartItems, removeFromCartAPI]); // Depends on cartItems and stable removeFromCartAPI
+  }, [cartItems, removeFromCartAPI, applyCartOperations]); // Depends on cartItems and stable removeFromCartAPI
 
   const addToCartAPI = useCallback(async (productId, quantity = 1) => {
     console.log(`Context: Adding/Incrementing item ${productId} by ${quantity}`);
@@ -110,6 +144,12 @@ export const CartProvider = ({ children }) => {
     setError(null);
     const previousCartItems = [...cartItems]; // Store for potential revert
     try {
+        if (!isLoggedIn) {
+            // Guest carts have no per-line endpoint: one add operation returns the whole cart
+            const cart = await applyCartOperations([{ op: 'add', prod_id: productId, quantity }]);
+            toast.success(`Item updated/added in cart!`);
+            return cart?.items?.find(item => item.prod_id === productId);
+        }
         const response = await axiosInstance.post('/cart/', {
             prod_id: productId,
             quantity: quantity,
@@ -161,7 +201,7 @@ export const CartProvider = ({ children }) => {
     } finally {
         setIsUpdating(false);
     }
-  }, [cartItems, fetchCart]); // Depends on cartItems and stable fetchCart
+  }, [cartItems, fetchCart, isLoggedIn, applyCartOperations]); // Depends on cartItems, fetchCart and auth state
 
   // --- Function to clear cart (Backend + Optimistic UI Update) ---
   const clearCartAPI = useCallback(async () => {
@@ -172,7 +212,12 @@ export const CartProvider = ({ children }) => {
      setError(null);
      setCartItems([]); // Optimistic Update: UI clears immediately
      try {
-        await axiosInstance.delete('/cart/'); // Call backend endpoint to clear the cart
+        if (isLoggedIn) {
+          await axiosInstance.delete('/cart/'); // Call backend endpoint to clear the cart
+        } else {
+          localStorage.removeItem(GUEST_CART_KEY);
+          await axiosInstance.delete('/guest-cart/'); // Clears the guest cart cookie
+        }
         console.log("Context: Cart cleared via API successfully (toast skipped).");
         // toast.success("Cart cleared successfully."); // <-- SUCCESS TOAST REMOVED/COMMENTED OUT
      } catch (err) {
@@ -184,26 +229,36 @@ export const CartProvider = ({ children }) => {
      } finally {
         setIsLoading(false); // Stop loading indicator
      }
-  }, [cartItems]); // Depends only on cartItems for reverting state
+  }, [cartItems, isLoggedIn]); // Depends on cartItems for reverting state
 
 
   // --- Derived State Calculations (using useMemo) ---
+  // Server totals are used while cartItems is exactly what GET /cart/ returned; after an
+  // optimistic local edit we fall back to a local estimate until the next fetch.
+  const isServerSummaryCurrent = serverSummary !== null && serverSummary.items === cartItems;
+
   const cartTotal = useMemo(() => {
       // console.log("Recalculating cartTotal");
+      if (isServerSummaryCurrent) return serverSummary.total_cost;
       return cartItems.reduce((sum, item) => {
           const price = Number(item.product?.price) || 0;
           const quantity = Number(item.quantity) || 0;
           return sum + (price * quantity);
       }, 0);
-  }, [cartItems]);
+  }, [cartItems, isServerSummaryCurrent, serverSummary]);
 
   const itemCount = useMemo(() => {
       // console.log("Recalculating itemCount");
+      if (isServerSummaryCurrent) return serverSummary.item_count;
       return cartItems.reduce((sum, item) => {
           const quantity = Number(item.quantity) || 0;
           return sum + quantity;
       }, 0);
-  }, [cartItems]);
+  }, [cartItems, isServerSummaryCurrent, serverSummary]);
+
+
+  // The fee checkout will charge, as priced by the server; null until the summary is current again
+  const shippingFee = isServerSummaryCurrent ? serverSummary.shipping_fee : null;
 
 
   // --- Context Value (Memoized) ---
@@ -216,26 +271,26 @@ export const CartProvider = ({ children }) => {
           isUpdating,
           error,
           fetchCart,          // Memoized by useCallback
+          applyCartOperations, // Batch edit (PATCH /cart/), memoized by useCallback
           addToCartAPI,       // Memoized by useCallback (changes if cartItems changes)
           removeFromCartAPI,  // Memoized by useCallback (changes if cartItems changes)
           updateQuantityAPI,  // Memoized by useCallback (changes if cartItems/removeFromCartAPI changes)
           clearCartAPI,       // Memoized by useCallback (changes if cartItems changes)
           cartTotal,          // Memoized by useMemo
           itemCount,          // Memoized by useMemo
+          shippingFee,        // From the last server summary
       };
   }, [
       cartItems, isLoading, isUpdating, error, // State dependencies
-      fetchCart, addToCartAPI, removeFromCartAPI, updateQuantityAPI, clearCartAPI, // Function dependencies
-      cartTotal, itemCount // Derived state dependencies
+      fetchCart, applyCartOperations, addToCartAPI, removeFromCartAPI, updateQuantityAPI, clearCartAPI, // Function dependencies
+      cartTotal, itemCount, shippingFee // Derived state dependencies
   ]);
 
-  // --- Initial Fetch ---
+  // --- Initial Fetch (and again on login/logout: guest cart vs. user cart) ---
   useEffect(() => {
-      console.log("CartProvider Mount: Fetching initial cart.");
+      console.log("CartProvider: Fetching cart.");
       fetchCart();
-      // fetchCart is stable due to useCallback([]) - no need to include in deps array
-      // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, []);
+  }, [fetchCart]);
 
 
   // --- Render Log ---
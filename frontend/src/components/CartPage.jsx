@@ -178,7 +178,9 @@ const CartPage = () => {
                       const productName = product.name || `Product ID: ${productId}`;
                       const productPrice = Number(product.price) || 0; // Ensure price is a number
                       const imageUrl = product.image_url || 'https://via.placeholder.com/150?text=No+Image'; // Default image
-                      const itemSubtotal = (productPrice * item.quantity).toFixed(2);
+                      // line_total / available_stock come from GET /cart/ (absent right after an optimistic edit)
+                      const itemSubtotal = (item.line_total ?? productPrice * item.quantity).toFixed(2);
+                      const stockShort = item.in_stock === false;
                       // ---
 
                       // Ensure item has a valid key
@@ -197,6 +199,9 @@ const CartPage = () => {
                             <div className="min-w-0">
                               <h2 className="font-semibold text-base truncate" title={productName}>{productName}</h2>
                               <p className="text-sm text-gray-500 dark:text-gray-400">${productPrice.toFixed(2)} each</p>
+                              {stockShort && (
+                                <p className="text-xs text-red-600 dark:text-red-400">Only {item.available_stock} available</p>
+                              )}
                             </div>
                           </div>
 
@@ -26,6 +26,8 @@ const OrderHistory = () => {
   const [filteredOrders, setFilteredOrders] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null); // Set while older pages remain on the server
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [statusFilter, setStatusFilter] = useState('all');
   const [sortOrder, setSortOrder] = useState('newest');
@@ -66,14 +68,16 @@ const OrderHistory = () => {
   };
 
   // --- Data Fetching ---
-  const fetchOrderHistory = useCallback(async () => {
-    setLoading(true);
+  // Pages come newest first; pass the previous next_cursor to append older orders.
+  const fetchOrderHistory = useCallback(async (cursor = null) => {
+    const isNextPage = Boolean(cursor);
+    if (isNextPage) setLoadingMore(true); else setLoading(true);
     setError(null);
     console.log("OrderHistory: Fetching order history...");
     try {
-      const response = await axiosInstance.get('orders/orders');
+      const response = await axiosInstance.get('orders/orders', { params: cursor ? { cursor } : {} });
       console.log("OrderHistory: API Response:", response.data);
-      const fetchedOrders = response.data;
+      const fetchedOrders = response.data?.items;
       if (!Array.isArray(fetchedOrders)) {
          throw new Error("Received invalid order data structure from server.");
       }
@@ -84,14 +88,17 @@ const OrderHistory = () => {
           status: order.status || 'unknown',
           itemCount: order.item_count || order.items?.length || null,
         }));
-      setOrders(processedOrders);
+      setOrders(prev => isNextPage ? [...prev, ...processedOrders] : processedOrders);
+      setNextCursor(response.data.next_cursor || null);
     } catch (err) {
       console.error("OrderHistory: Failed to fetch order history:", err);
       const errorMsg = err.response?.data?.detail || err.message || "Could not load order history.";
       setError(errorMsg);
       setOrders([]);
+      setNextCursor(null);
     } finally {
-      setTimeout(() => setLoading(false), 300);
+      if (isNextPage) setLoadingMore(false);
+      else setTimeout(() => setLoading(false), 300);
       console.log("OrderHistory: Finished fetching order history.");
     }
   }, []);
@@ -102,6 +109,55 @@ const OrderHistory = () => {
     fetchOrderHistory();
   }, [fetchOrderHistory]);
 
+  // --- Live Status Updates ---
+  // The server pushes status changes for this user's orders, so the list never needs a refetch
+  useEffect(() => {
+    const token = localStorage.getItem('accessToken');
+    if (!token) return undefined;
+    const wsBaseUrl = (import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000').replace(/^http/, 'ws');
+    let socket = null;
+    let reconnectTimer = null;
+    let closedByUs = false;
+
+    const connect = () => {
+      socket = new WebSocket(`${wsBaseUrl}/orders/orders/ws/me?token=${encodeURIComponent(token)}`);
+      socket.onmessage = (event) => {
+        let data;
+        try {
+          data = JSON.parse(event.data);
+        } catch (err) {
+          console.error("OrderHistory: Unreadable WebSocket message:", event.data);
+          return;
+        }
+        const messages = Array.isArray(data) ? data : [data];
+        const latestStatus = new Map(); // order id -> status, last update wins
+        messages.forEach(message => {
+          if (message.type === 'order_status_update') {
+            (message.order_ids || []).forEach(id => latestStatus.set(id, message.status));
+          }
+        });
+        if (latestStatus.size > 0) {
+          setOrders(prev => prev.map(order =>
+            latestStatus.has(order.id) ? { ...order, status: latestStatus.get(order.id) } : order
+          ));
+        }
+      };
+      socket.onclose = (event) => {
+        // 1008: token rejected (expired); don't retry with it
+        if (!closedByUs && event.code !== 1008) {
+          reconnectTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+    connect();
+
+    return () => {
+      closedByUs = true;
+      clearTimeout(reconnectTimer);
+      socket?.close();
+    };
+  }, []);
+
   // --- Filtering & Sorting ---
   useEffect(() => {
     console.log("OrderHistory: Applying filters/sort:", { searchTerm, statusFilter, sortOrder });
@@ -226,7 +282,7 @@ const OrderHistory = () => {
                        <AlertCircle className="h-10 w-10 text-destructive mb-3"/>
                        <p className="font-semibold text-destructive mb-2">Failed to load orders</p>
                        <p className="text-sm text-destructive/80 mb-4">{error}</p>
-                       <Button variant="destructive" size="sm" onClick={fetchOrderHistory}>
+                       <Button variant="destructive" size="sm" onClick={() => fetchOrderHistory()}>
                            Retry
                        </Button>
                    </CardContent>
@@ -316,6 +372,13 @@ const OrderHistory = () => {
                             </CardContent>
                         </Card>
                     )}
+                    {nextCursor && (
+                        <div className="flex justify-center pt-2">
+                            <Button variant="outline" size="sm" onClick={() => fetchOrderHistory(nextCursor)} disabled={loadingMore}>
+                                {loadingMore ? "Loading..." : "Load older orders"}
+                            </Button>
+                        </div>
+                    )}
                 </div> // Closing tag for the space-y-4 div
             )} {/* End of conditional rendering block */}
 
@@ -13,10 +13,10 @@ import axiosInstance from '../api/axiosInstance';
 
 const Payment = () => {
   const navigate = useNavigate();
-  // Destructure the API version of the clear cart function
-  const { cartTotal, clearCartAPI } = useCart(); // <-- Use clearCartAPI from context
-  const shippingFee = cartTotal > 0 ? 10.00 : 0;
-  const total = cartTotal + shippingFee;
+  // Checkout empties the cart server-side; fetchCart re-syncs the context afterwards
+  // shippingFee is priced by the server (cart summary); null while a local cart edit is unconfirmed
+  const { cartTotal, shippingFee, fetchCart } = useCart();
+  const total = cartTotal + (shippingFee ?? 0);
 
   const [isFormValid, setIsFormValid] = useState(false);
   const [formData, setFormData] = useState({
@@ -32,6 +32,7 @@ const Payment = () => {
   });
   const [error, setError] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [savedAddresses, setSavedAddresses] = useState([]); // Distinct addresses from past checkouts
 
   // Load stored delivery info useEffect...
   useEffect(() => {
@@ -50,6 +51,32 @@ const Payment = () => {
     }
   }, []);
 
+  // Re-sync the cart if a local edit left the server-priced fee unknown
+  useEffect(() => {
+    if (shippingFee === null) fetchCart(false);
+  }, [shippingFee, fetchCart]);
+
+  // Load the user's saved addresses (optional; the form works without them)
+  useEffect(() => {
+    axiosInstance.get('orders/orders/addresses')
+      .then(response => setSavedAddresses(Array.isArray(response.data) ? response.data : []))
+      .catch(err => console.warn("Could not load saved addresses:", err));
+  }, []);
+
+  const applySavedAddress = (address) => {
+    setFormData({
+      firstName: address.first_name,
+      lastName: address.last_name,
+      email: address.email,
+      phone: address.phone,
+      street: address.street,
+      city: address.city,
+      state: address.state,
+      zipCode: address.zip_code,
+      country: address.country,
+    });
+  };
+
   // Validate form useEffect...
    useEffect(() => {
     const { firstName, lastName, email, phone, street, city, state, zipCode, country } = formData;
@@ -106,13 +133,10 @@ const Payment = () => {
         zip_code: formData.zipCode.trim(),
         country: formData.country.trim(),
       },
-      subtotal: parseFloat(cartTotal.toFixed(2)),
-      shipping_fee: parseFloat(shippingFee.toFixed(2)),
-      total: parseFloat(total.toFixed(2)),
     };
 
     try {
-      // 1. Place the order
+      // 1. Place the order: one request turns the cart into an order, decrements stock and clears the cart
       const response = await axiosInstance.post('orders/orders/', orderData); // Note trailing slash, and orders/
       const createdOrder = response.data;    
 
@@ -121,27 +145,11 @@ const Payment = () => {
         toast.info("Order placed but response was unusual. Please check order history.");
       } else {
         console.log("Order placed successfully:", createdOrder);
-        toast.success("Order placed successfully!");
+        toast.success(`Order placed successfully! Total: $${Number(createdOrder.total).toFixed(2)}`);
       }
 
-      // 2. Clear the cart via context API call
-      // Check if the function exists before calling
-      if (clearCartAPI) {
-        try {
-            console.log("Calling clearCartAPI from Payment component..."); // Add log
-            await clearCartAPI(); // <-- CALL THE API version
-            // Success/Error toast for clearing is handled within clearCartAPI itself
-            console.log("clearCartAPI call completed."); // Add log
-        } catch (clearError) {
-             console.error("Attempt to clear cart via API failed after successful order:", clearError);
-             // Optionally add a specific toast here if needed, but don't block navigation
-             // toast.warning("Order placed, but cart couldn't be cleared automatically.");
-        }
-      } else {
-        // Log a warning if the function isn't available from context
-        console.warn("clearCartAPI function is not available in CartContext!");
-      }
-      // ****************************
+      // 2. Re-sync the cart (already emptied by the checkout transaction)
+      await fetchCart(false);
 
       // 3. Save delivery info locally
       localStorage.setItem('deliveryInfo', JSON.stringify(formData));
@@ -153,7 +161,8 @@ const Payment = () => {
 
     } catch (err) { // Catch errors from placing the order
       console.error("Error submitting order:", err);
-      const errorMessage = err.message || "An unexpected error occurred. Please try again.";
+      // 400s explain what went wrong (empty cart, items out of stock); nothing was ordered
+      const errorMessage = err.response?.data?.detail || err.message || "An unexpected error occurred. Please try again.";
       setError(errorMessage);
       toast.error(errorMessage); // Show order placement error
       setIsLoading(false); // Stop loading ONLY on order placement error
@@ -176,6 +185,18 @@ const Payment = () => {
               </CardTitle>
             </CardHeader>
             <CardContent className="pt-6">
+              {savedAddresses.length > 0 && (
+                <div className="mb-6">
+                  <p className="text-sm font-medium mb-2">Saved addresses</p>
+                  <div className="flex flex-wrap gap-2">
+                    {savedAddresses.map(address => (
+                      <Button key={address.id} type="button" variant="outline" size="sm" onClick={() => applySavedAddress(address)} className="h-auto py-2 text-left whitespace-normal">
+                        {address.first_name} {address.last_name}, {address.street}, {address.city}
+                      </Button>
+                    ))}
+                  </div>
+                </div>
+              )}
               <form id="deliveryForm" className="space-y-4" onSubmit={handleSubmit} noValidate>
                 {/* --- All Input fields --- */}
                 <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
@@ -249,7 +270,7 @@ const Payment = () => {
                 {/* Order Totals */}
                 <div className="space-y-2 mb-6">
                   <div className="flex justify-between text-sm"><span className="text-gray-600 dark:text-gray-400">Subtotal:</span><span className="text-gray-800 dark:text-gray-200">${cartTotal.toFixed(2)}</span></div>
-                  <div className="flex justify-between text-sm"><span className="text-gray-600 dark:text-gray-400">Shipping Fee:</span><span className="text-gray-800 dark:text-gray-200">${shippingFee.toFixed(2)}</span></div>
+                  <div className="flex justify-between text-sm"><span className="text-gray-600 dark:text-gray-400">Shipping Fee:</span><span className="text-gray-800 dark:text-gray-200">{shippingFee === null ? "..." : `$${shippingFee.toFixed(2)}`}</span></div>
                   <div className="flex justify-between font-bold text-lg pt-2 border-t border-gray-200 dark:border-gray-700"><span>Total:</span><span>${total.toFixed(2)}</span></div>
                 </div>
                 {/* Payment Method Section */}
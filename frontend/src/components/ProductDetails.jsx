@@ -50,50 +50,17 @@ const ProductDetails = () => {
             setInventoryStock(null); // Reset inventory on new fetch
 
             try {
-                // Fetch both product and inventory concurrently
-                const results = await Promise.allSettled([
-                    // Use the configured axiosInstance here
-                    axiosInstance.get(`/products/${productId}`),
-                    axiosInstance.get(`/inventory/${productId}`)
-                ]);
-
-                const productResult = results[0];
-                const inventoryResult = results[1];
-
-                // Process Product Result
-                if (productResult.status === 'fulfilled' && productResult.value.data) {
-                    setProduct(productResult.value.data);
-                } else {
-                    console.error("Error fetching product details:", productResult.reason || 'No data');
-                    const errorMsg = productResult.reason?.response?.data?.detail || 'Failed to load product details.';
-                    setProductError(errorMsg);
-                    toast.error(`Error loading product: ${errorMsg}`);
-                    setProduct(null);
-                }
-
-                // Process Inventory Result
-                if (inventoryResult.status === 'fulfilled' && inventoryResult.value.data) {
-                    setInventoryStock(inventoryResult.value.data.stock);
-                } else {
-                    console.error("Error fetching inventory details:", inventoryResult.reason || 'No data');
-                    if (inventoryResult.reason?.response?.status === 404) {
-                        console.warn(`Inventory record not found for product ID ${productId}. Assuming stock is 0.`);
-                        setInventoryStock(0); // Treat 404 as 0 stock
-                    } else {
-                        const errorMsg = inventoryResult.reason?.response?.data?.detail || 'Failed to load stock information.';
-                        setInventoryError(errorMsg); // Keep track of specific inventory error
-                        setInventoryStock(null); // Explicitly set to null if error other than 404
-                        toast.error(`Error loading stock: ${errorMsg}`);
-                    }
-                }
-
+                // Product details and stock come back joined from a single request
+                const response = await axiosInstance.get(`/products/${productId}/with-stock`);
+                setProduct(response.data);
+                setInventoryStock(response.data.available_stock ?? response.data.stock ?? 0);
             } catch (err) {
-                // Catch unexpected errors during Promise.allSettled or setup
-                console.error("Unexpected error fetching details:", err);
-                const generalError = "An unexpected error occurred while loading details.";
-                setProductError(prev => prev || generalError);
-                setInventoryError(prev => prev || generalError);
-                toast.error(generalError);
+                console.error("Error fetching product details:", err);
+                const errorMsg = err.response?.data?.detail || 'Failed to load product details.';
+                setProductError(errorMsg);
+                toast.error(`Error loading product: ${errorMsg}`);
+                setProduct(null);
+                setInventoryError(errorMsg);
             } finally {
                 setLoadingProduct(false);
                 setLoadingInventory(false);
@@ -104,6 +71,26 @@ const ProductDetails = () => {
         // Dependency array ensures this runs when the productId changes
     }, [productId]);
 
+    // --- Live stock updates (server pushes coalesced changes; no polling) ---
+    useEffect(() => {
+        if (!productId) return;
+        const apiBaseUrl = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
+        const wsUrl = `${apiBaseUrl.replace(/^http/, 'ws')}/inventory/ws/stock?product_id=${productId}`;
+        const socket = new WebSocket(wsUrl);
+        socket.onmessage = (event) => {
+            try {
+                const data = JSON.parse(event.data);
+                if (data.type === 'stock_update' && String(data.prod_id) === String(productId)) {
+                    setInventoryStock(data.available_stock);
+                }
+            } catch (err) {
+                console.error("Stock WebSocket: failed to parse message:", err);
+            }
+        };
+        socket.onerror = (err) => console.warn("Stock WebSocket error:", err);
+        return () => socket.close();
+    }, [productId]);
+
 
     // --- Handle Quantity Changes ---
     const handleQuantityChange = (action) => {
@@ -56,6 +56,19 @@ export const AuthProvider = ({ children }) => {
     // Login function
     const login = useCallback(async (newToken, userData = null) => {
         localStorage.setItem('accessToken', newToken);
+        // Move any guest cart into the user's cart in one request, before the cart refetches
+        const guestCartToken = localStorage.getItem('guestCart');
+        if (guestCartToken) {
+            try {
+                await axiosInstance.post('/cart/merge-guest', null, {
+                    headers: { 'X-Guest-Cart': guestCartToken }
+                });
+            } catch (error) {
+                console.error("AuthContext: Guest cart merge failed", error);
+            } finally {
+                localStorage.removeItem('guestCart');
+            }
+        }
         setToken(newToken);
         setIsLoggedIn(true);
         // If login endpoint returns user data, set it, otherwise fetch it